@@ -4,24 +4,72 @@ import argparse
 import psycopg2
 import uuid
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from datetime import date, datetime, timedelta
 import psycopg2.extras
+import ledger_rollup
+import ledger_balance
+import bulk_import
+from ledger_version import ensure_ledger_changes, bump_ledger_version, ensure_entry_changes, bump_entry_version
+from ledger_bounds import ensure_bounds, extend_bounds, shrink_bounds
+from migrations import migrate
+from ledger_partitions import ensure_partitions
+import metrics
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'
 
-DB_NAME = "cafe_v2_db"
-REPORTING_DB_NAME = "coffeeshop_cashflow"
-DB_USER = "postgres"
-DB_PASSWORD = "postgres"
-DB_HOST = "localhost"
+# Request / SQL timing histograms, served at /metrics
+metrics.instrument_flask(app)
+
+# Overridable from the environment (benchmarks point the app at scratch databases)
+DB_NAME = os.getenv("CAFE_DB_NAME", "cafe_v2_db")
+REPORTING_DB_NAME = os.getenv("REPORTING_DB_NAME", "coffeeshop_cashflow")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+
+# Removes one ledger row matching a deleted entry (duplicates keep the rest).
+# benchmarks/check_plans.py EXPLAINs these to check they stay on the dedupe indexes.
+PAYROLL_DELETE_SQL = """
+    DELETE FROM payroll_history
+    WHERE pay_date = %s
+      AND employee_name = %s
+      AND total_business_cost = %s
+      AND id IN (
+          SELECT id FROM payroll_history
+          WHERE pay_date = %s
+            AND employee_name = %s
+            AND total_business_cost = %s
+          LIMIT 1
+      )
+"""
+
+CHECKING_DELETE_SQL = """
+    DELETE FROM checking_account_main
+    WHERE date = %s
+      AND category = %s
+      AND description = %s
+      AND type = %s
+      AND amount = %s
+      AND id IN (
+          SELECT id FROM checking_account_main
+          WHERE date = %s
+            AND category = %s
+            AND description = %s
+            AND type = %s
+            AND amount = %s
+          LIMIT 1
+      )
+"""
 
 def get_db_connection():
-    return psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST)
+    return psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST,
+                            connection_factory=metrics.InstrumentedConnection)
 
 def get_reporting_db_connection():
-    return psycopg2.connect(dbname=REPORTING_DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST)
+    return psycopg2.connect(dbname=REPORTING_DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST,
+                            connection_factory=metrics.InstrumentedConnection)
 
 # Create the app DB if it doesn't exist
 def create_database():
@@ -58,9 +106,37 @@ def create_entries_table():
     cur.close()
     conn.close()
 
-# Hook for future DB tweaks (left empty)
+# Reporting-side tables the sync code writes to besides the ledger itself,
+# plus pending schema migrations (indexes the dedupe lookups rely on) in both DBs
 def ensure_schema_updates():
-    return
+    try:
+        create_entries_table()
+        conn = get_db_connection()
+        cur = conn.cursor()
+        ensure_entry_changes(cur)
+        conn.commit()
+        cur.close()
+        migrate(conn, "cafe")
+        conn.close()
+    except Exception as e:
+        print(f"Cafe schema check failed: {e}")
+    try:
+        r_conn = get_reporting_db_connection()
+        r_cur = r_conn.cursor()
+        ensure_ledger_changes(r_cur)
+        r_conn.commit()
+        r_cur.close()
+        ledger_rollup.ensure_rollup(r_conn)
+        r_cur = r_conn.cursor()
+        ensure_bounds(r_cur)
+        r_conn.commit()
+        r_cur.close()
+        migrate(r_conn, "reporting")
+        ensure_partitions(r_conn)
+        ledger_balance.ensure_balances(r_conn)
+        r_conn.close()
+    except Exception as e:
+        print(f"Reporting schema check failed: {e}")
 
 # Clear the details field on all rows
 def clear_details():
@@ -72,7 +148,8 @@ def clear_details():
     conn.close()
 
 
-# Website import (CSV/Excel): parse, dedupe, save, then sync to reporting
+# Website import (CSV/Excel): parse, then stage, dedupe and sync in bulk (bulk_import.py)
+# ?format=json returns the import report instead of redirecting
 @app.route('/import_entries', methods=['POST'])
 def import_entries():
     role = request.args.get('role', 'sale')
@@ -103,89 +180,21 @@ def import_entries():
         print(f"Import read error: {e}")
         return redirect(url_for('add_data', role=role, origin=origin))
     conn = get_db_connection()
-    cur = conn.cursor()
     r_conn = get_reporting_db_connection()
-    r_cur = r_conn.cursor()
-    inserted = 0
-    for raw in rows:
-        kv = {str(k).strip().lower(): raw[k] for k in raw.keys()}
-        date_val = kv.get('date') or kv.get('pay_date')
-        desc = kv.get('description') or kv.get('employee_name') or kv.get('vendor')
-        category = kv.get('category')
-        amt = kv.get('amount') if kv.get('amount') not in (None, '') else kv.get('balance')
-        try:
-            amount = float(amt) if amt not in (None, '') else 0
-        except Exception:
-            try:
-                amount = float(str(amt).replace(',', ''))
-            except Exception:
-                amount = 0
-        t = (kv.get('type') or kv.get('entry_type') or '').strip().lower()
-        if t in ('credit', 'income'):
-            entry_type = 'income'
-        elif t in ('debit', 'expense'):
-            entry_type = 'expense'
-        else:
-            entry_type = 'income' if amount >= 0 else 'expense'
-        if date_val and category and desc:
-            cur.execute(
-                """
-                SELECT 1 FROM entries
-                WHERE date = %s AND category = %s AND description = %s AND entry_type = %s AND balance = %s
-                """,
-                (date_val, category, desc, entry_type, amount),
-            )
-            exists = cur.fetchone()
-            if exists:
-                continue
-            cur.execute(
-                """
-                INSERT INTO entries (date, entry_type, category, description, balance)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (date_val, entry_type, category, desc, amount),
-            )
-            inserted += 1
-            if (category or '').strip().lower() in ('payroll', 'payroll/labor'):
-                try:
-                    r_cur.execute(
-                        """
-                        INSERT INTO payroll_history (employee_name, pay_date, total_business_cost, role)
-                        VALUES (%s, %s, %s, 'Employee')
-                        """,
-                        (desc, date_val, amount)
-                    )
-                except Exception as e:
-                    print(f"Sync payroll failed: {e}")
-            else:
-                db_type_val = 'Credit' if entry_type == 'income' else 'Debit'
-                tx_id = f"TX-{uuid.uuid4().hex[:8].upper()}"
-                try:
-                    r_cur.execute(
-                        """
-                        SELECT 1 FROM checking_account_main
-                        WHERE date = %s AND category = %s AND description = %s AND type = %s AND amount = %s
-                        """,
-                        (date_val, category, desc, db_type_val, amount)
-                    )
-                    r_exists = r_cur.fetchone()
-                    if not r_exists:
-                        r_cur.execute(
-                            """
-                            INSERT INTO checking_account_main (date, transaction_id, description, category, type, amount, balance)
-                            VALUES (%s, %s, %s, %s, %s, %s, 0)
-                            """,
-                            (date_val, tx_id, desc, category, db_type_val, amount)
-                        )
-                except Exception as e:
-                    print(f"Sync checking failed: {e}")
-    conn.commit()
-    r_conn.commit()
-    cur.close()
-    r_cur.close()
-    conn.close()
-    r_conn.close()
-    print(f"Imported {inserted} entries from file: {f.filename}")
+    try:
+        report = bulk_import.import_rows(conn, r_conn, rows)
+    except Exception as e:
+        print(f"Import failed: {e}")
+        flash("Import failed: nothing was saved.", 'import')
+        return redirect(url_for('add_data', role=role, origin=origin))
+    finally:
+        conn.close()
+        r_conn.close()
+    print(f"Imported {report['inserted']} entries from file: {f.filename} "
+          f"({report['duplicates']} duplicates, {report['rejected']} rejected)")
+    if request.args.get('format') == 'json':
+        return jsonify(report)
+    flash(bulk_import.summary(report), 'import')
     return redirect(url_for('add_data', role=role, origin=origin))
 
 # Manage Cash Entry
@@ -222,6 +231,7 @@ def add_data():
             """,
             (date_entry, entry_type, category, description, details, staff_name, balance),
         )
+        bump_entry_version(cur)
         conn.commit()
         cur.close()
         conn.close()
@@ -245,6 +255,9 @@ def add_data():
                     """,
                     (description, date_entry, balance)
                 )
+                ledger_rollup.apply_delta(r_cur, ledger_rollup.PAYROLL, date_entry, category, description, balance)
+                bump_ledger_version(r_cur, [date_entry])
+                extend_bounds(r_cur, [date_entry])
                 r_conn.commit()
                 r_cur.close()
                 r_conn.close()
@@ -271,6 +284,10 @@ def add_data():
                     """,
                     (date_entry, tx_id, description, category, db_type, balance)
                 )
+                ledger_rollup.apply_delta(r_cur, ledger_rollup.CHECKING_MAIN, date_entry, category, description, balance)
+                bump_ledger_version(r_cur, [date_entry])
+                extend_bounds(r_cur, [date_entry])
+                ledger_balance.recompute_balances(r_cur, [date_entry])
                 r_conn.commit()
                 r_cur.close()
                 r_conn.close()
@@ -373,44 +390,22 @@ def delete_entry(id):
             r_cur = r_conn.cursor()
             
             if d_cat == 'Payroll':
-                r_cur.execute(
-                    """
-                    DELETE FROM payroll_history
-                    WHERE pay_date = %s
-                      AND employee_name = %s
-                      AND total_business_cost = %s
-                      AND ctid IN (
-                          SELECT ctid FROM payroll_history
-                          WHERE pay_date = %s
-                            AND employee_name = %s
-                            AND total_business_cost = %s
-                          LIMIT 1
-                      )
-                    """,
-                    (d_date, d_desc, d_bal, d_date, d_desc, d_bal)
-                )
+                r_cur.execute(PAYROLL_DELETE_SQL, (d_date, d_desc, d_bal, d_date, d_desc, d_bal))
+                if r_cur.rowcount:
+                    ledger_rollup.apply_delta(r_cur, ledger_rollup.PAYROLL, d_date, d_cat, d_desc, d_bal, sign=-1)
+                    bump_ledger_version(r_cur, [d_date])
+                    shrink_bounds(r_cur, d_date)
             else:
                 db_type_val = 'Credit' if d_type == 'income' else 'Debit'
                 r_cur.execute(
-                    """
-                    DELETE FROM checking_account_main
-                    WHERE date = %s
-                      AND category = %s
-                      AND description = %s
-                      AND type = %s
-                      AND amount = %s
-                      AND ctid IN (
-                          SELECT ctid FROM checking_account_main
-                          WHERE date = %s
-                            AND category = %s
-                            AND description = %s
-                            AND type = %s
-                            AND amount = %s
-                          LIMIT 1
-                      )
-                    """,
+                    CHECKING_DELETE_SQL,
                     (d_date, d_cat, d_desc, db_type_val, d_bal, d_date, d_cat, d_desc, db_type_val, d_bal)
                 )
+                if r_cur.rowcount:
+                    ledger_rollup.apply_delta(r_cur, ledger_rollup.CHECKING_MAIN, d_date, d_cat, d_desc, d_bal, sign=-1)
+                    bump_ledger_version(r_cur, [d_date])
+                    shrink_bounds(r_cur, d_date)
+                    ledger_balance.recompute_balances(r_cur, [d_date])
             r_conn.commit()
             r_cur.close()
             r_conn.close()
@@ -419,6 +414,8 @@ def delete_entry(id):
     # -------------------------------------
 
     cur.execute("DELETE FROM entries WHERE id = %s", (id,))
+    if cur.rowcount:
+        bump_entry_version(cur)
     conn.commit()
     cur.close()
     conn.close()
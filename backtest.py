@@ -0,0 +1,286 @@
+"""Rolling-origin backtest of the /api/predict-finances models.
+
+For every historical cutoff the model is refit on the months before it and
+asked for the next `horizon` months, which are then compared with what
+actually happened. Errors are scored per series (revenue, expense and each
+expense category) as MAPE and MASE. Each cutoff is independent, so cutoffs
+are spread over a process pool.
+
+Results are stored in `forecast_backtest` stamped with the ledger version
+they were computed on. The API only reads that table (and keeps the latest
+result in memory); when the ledger has moved on it serves the stored
+figures and refreshes them in the background. Those refreshes always score
+on one long-lived process pool whose workers run at lower CPU priority
+(BACKTEST_NICE), so they neither hold the API's GIL nor crowd out its
+requests.
+
+CLI:
+    python backtest.py                      # backtest every model and store the results
+    python backtest.py --model ets --horizon 6 --no-save
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import text
+
+import forecasting
+from forecast_cache import get_forecast_state
+
+BACKTEST_WORKERS = max(1, int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 2))))
+# Horizon the API's accuracy figure refers to (the default forecast length)
+BACKTEST_HORIZON = 3
+# Fewest training months a cutoff may have
+MIN_TRAIN_MONTHS = 3
+# Added to the niceness of the background pool's workers
+BACKTEST_NICE = int(os.getenv("BACKTEST_NICE", "10"))
+
+BACKTEST_DDL = """
+    CREATE TABLE IF NOT EXISTS forecast_backtest (
+        model TEXT NOT NULL,
+        horizon INTEGER NOT NULL,
+        series TEXT NOT NULL,
+        ledger_version BIGINT NOT NULL,
+        origins INTEGER NOT NULL,
+        mape DOUBLE PRECISION,
+        mase DOUBLE PRECISION,
+        computed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (model, horizon, series)
+    )
+"""
+
+_lock = threading.Lock()
+# (model, horizon) -> (ledger version, accuracy dict), only for up-to-date results
+_accuracy = {}
+# (model, horizon) pairs with a background refresh in flight
+_refreshing = set()
+_background_pool = None
+
+
+def ensure_backtest_table(cur):
+    cur.execute(BACKTEST_DDL)
+
+
+# --- SCORING ---
+
+def _score_origin(model, monthly, cat_monthly, start_month, actual):
+    """Fit on one cutoff's history and return (S x h forecast, per-series naive MAE)."""
+    train = {"version": None, "monthly": monthly, "cat_monthly": cat_monthly, "cat_weights": {}}
+    fitted = forecasting.fit(train, model)
+    forecast = forecasting.forecast_matrix(fitted, start_month, actual.shape[1])
+    # MASE scale: in-sample error of the one-month-ago naive forecast
+    _, _, Y = forecasting.history(train)
+    scale = np.mean(np.abs(np.diff(Y, axis=1)), axis=1) if Y.shape[1] > 1 else np.full(len(Y), np.nan)
+    return forecast, scale
+
+
+def _origins(state, horizon, min_train):
+    """Cutoffs as (training monthly, training categories, first test month, S x h actuals)."""
+    index, names, Y = forecasting.history(state)
+    monthly, cat_monthly = state["monthly"], state["cat_monthly"]
+    origins = []
+    for t in range(min_train, len(index)):
+        cutoff = index[t]
+        origins.append((
+            monthly[monthly['m_start'] < cutoff].reset_index(drop=True),
+            cat_monthly[cat_monthly.index < cutoff],
+            cutoff,
+            Y[:, t:t + horizon],
+        ))
+    return names, origins
+
+
+def _lower_priority():
+    if hasattr(os, "nice"):
+        os.nice(BACKTEST_NICE)
+
+
+def background_pool():
+    """The pool API-triggered refreshes score on: spawned once, workers at lower priority."""
+    global _background_pool
+    with _lock:
+        if _background_pool is None:
+            # spawn: the API process is multi-threaded, so don't fork it
+            _background_pool = ProcessPoolExecutor(
+                max_workers=BACKTEST_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority,
+            )
+        return _background_pool
+
+
+def run_backtest(state, model, horizon=BACKTEST_HORIZON, min_train=MIN_TRAIN_MONTHS, workers=BACKTEST_WORKERS,
+                 pool=None):
+    """Backtest `model` on the forecast state. Returns {"origins", "series": {name: {"mape", "mase"}}}.
+
+    With `pool` the cutoffs are scored there; otherwise on a pool of
+    `workers` processes made for this call (1 = in-process).
+    """
+    names, origins = _origins(state, horizon, min_train)
+    if not origins:
+        return {"origins": 0, "series": {n: {"mape": None, "mase": None} for n in names}}
+
+    args = [(model, *o) for o in origins]
+    if pool is not None:
+        results = list(pool.map(_score_origin, *zip(*args)))
+    elif workers > 1 and len(origins) > 1:
+        # spawn: the API process is multi-threaded, so don't fork it
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(origins)), mp_context=ctx) as pool:
+            results = list(pool.map(_score_origin, *zip(*args)))
+    else:
+        results = [_score_origin(*a) for a in args]
+
+    abs_pct, scaled = [[] for _ in names], [[] for _ in names]
+    for (_, _, _, actual), (forecast, scale) in zip(origins, results):
+        errors = np.abs(actual - forecast[:, :actual.shape[1]])
+        for s in range(len(names)):
+            nonzero = actual[s] != 0
+            abs_pct[s].extend(errors[s][nonzero] / np.abs(actual[s][nonzero]))
+            if np.isfinite(scale[s]) and scale[s] > 0:
+                scaled[s].append(errors[s].mean() / scale[s])
+
+    series = {}
+    for s, name in enumerate(names):
+        series[name] = {
+            "mape": round(float(np.mean(abs_pct[s])) * 100, 2) if abs_pct[s] else None,
+            "mase": round(float(np.mean(scaled[s])), 3) if scaled[s] else None,
+        }
+    return {"origins": len(origins), "series": series}
+
+
+# --- PERSISTENCE ---
+
+def save_backtest(engine, model, horizon, version, result):
+    with engine.begin() as conn:
+        conn.execute(text(BACKTEST_DDL))
+        conn.execute(
+            text("DELETE FROM forecast_backtest WHERE model = :model AND horizon = :horizon"),
+            {"model": model, "horizon": horizon},
+        )
+        rows = [
+            {"model": model, "horizon": horizon, "series": name, "version": version,
+             "origins": result["origins"], "mape": score["mape"], "mase": score["mase"]}
+            for name, score in result["series"].items()
+        ]
+        if rows:
+            conn.execute(text("""
+                INSERT INTO forecast_backtest (model, horizon, series, ledger_version, origins, mape, mase)
+                VALUES (:model, :horizon, :series, :version, :origins, :mape, :mase)
+            """), rows)
+
+
+def load_backtest(conn, model, horizon=BACKTEST_HORIZON):
+    """Stored result for (model, horizon) as an accuracy dict, or None if never run."""
+    rows = conn.execute(text("""
+        SELECT series, ledger_version, origins, mape, mase
+        FROM forecast_backtest WHERE model = :model AND horizon = :horizon
+    """), {"model": model, "horizon": horizon}).mappings().all()
+    if not rows:
+        return None
+    series = {r["series"]: {"mape": r["mape"], "mase": r["mase"]} for r in rows}
+    # Headline figure: how close revenue and expense forecasts came on average
+    mapes = [series[n]["mape"] for n in ("revenue", "expense") if series.get(n, {}).get("mape") is not None]
+    return {
+        "accuracy": f"{round(max(0.0, 100 - np.mean(mapes)), 1)}%" if mapes else "N/A",
+        "version": int(rows[0]["ledger_version"]),
+        "origins": rows[0]["origins"],
+        "horizon": horizon,
+        "series": series,
+    }
+
+
+def refresh(engine, model, horizon=BACKTEST_HORIZON, pool=None):
+    """Backtest against the current ledger and store the result."""
+    state = get_forecast_state(engine)
+    result = run_backtest(state, model, horizon, pool=pool)
+    save_backtest(engine, model, horizon, state["version"], result)
+    return state["version"], result
+
+
+def _refresh_in_background(engine, model, horizon):
+    key = (model, horizon)
+    try:
+        refresh(engine, model, horizon, pool=background_pool())
+    except Exception as e:
+        print(f"Backtest refresh failed for {model}: {e}")
+    finally:
+        with _lock:
+            _refreshing.discard(key)
+
+
+def get_accuracy(engine, model, version, horizon=BACKTEST_HORIZON):
+    """Cached backtest accuracy for `model`; never runs a backtest on the caller's thread.
+
+    If the stored result predates ledger `version` it is still returned (marked
+    stale) and a refresh is started in the background.
+    """
+    key = (model, horizon)
+    with _lock:
+        cached = _accuracy.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+    try:
+        with engine.connect() as conn:
+            stored = load_backtest(conn, model, horizon)
+    except Exception as e:
+        # Table not created yet: the background refresh creates it
+        print(f"Backtest lookup error: {e}")
+        stored = None
+
+    if stored is not None and stored["version"] == version:
+        stored["stale"] = False
+        with _lock:
+            _accuracy[key] = (version, stored)
+        return stored
+
+    with _lock:
+        if key not in _refreshing:
+            _refreshing.add(key)
+            threading.Thread(
+                target=_refresh_in_background, args=(engine, model, horizon), daemon=True
+            ).start()
+    if stored is None:
+        return {"accuracy": "N/A", "version": None, "origins": 0, "horizon": horizon, "series": {}, "stale": True}
+    stored["stale"] = True
+    return stored
+
+
+# --- CLI ---
+
+def main():
+    from sqlalchemy import create_engine
+    from db import REPORTING_DATABASE_URL
+
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the forecast models.")
+    parser.add_argument("--model", nargs="+", choices=forecasting.MODELS, default=list(forecasting.MODELS))
+    parser.add_argument("--horizon", type=int, default=BACKTEST_HORIZON, help="months forecast at each cutoff")
+    parser.add_argument("--min-train", type=int, default=MIN_TRAIN_MONTHS, help="fewest training months per cutoff")
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS, help="process pool size (1 = in-process)")
+    parser.add_argument("--no-save", action="store_true", help="print results without storing them")
+    parser.add_argument("--database-url", default=REPORTING_DATABASE_URL)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    state = get_forecast_state(engine)
+    for model in args.model:
+        started = time.perf_counter()
+        result = run_backtest(state, model, args.horizon, args.min_train, args.workers)
+        elapsed = time.perf_counter() - started
+        print(f"\n{model}: {result['origins']} cutoffs, horizon {args.horizon}, {elapsed:.2f}s")
+        print(f"  {'series':<28}{'MAPE %':>10}{'MASE':>10}")
+        for name, score in result["series"].items():
+            mape = "-" if score["mape"] is None else f"{score['mape']:.2f}"
+            mase = "-" if score["mase"] is None else f"{score['mase']:.3f}"
+            print(f"  {name:<28}{mape:>10}{mase:>10}")
+        if not args.no_save:
+            save_backtest(engine, model, args.horizon, state["version"], result)
+    if not args.no_save:
+        print(f"\nStored in forecast_backtest (ledger version {state['version']}).")
+
+
+if __name__ == "__main__":
+    main()
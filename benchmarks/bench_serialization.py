@@ -0,0 +1,106 @@
+"""Payload size and encode time of the detailed-cashflow JSON formats.
+
+Compares the previous path (jsonable_encoder + stdlib json, one object per
+row) with the fast path (orjson rows, orjson columnar), each raw, gzip and
+brotli-compressed. Rows are synthetic by default so the numbers don't
+depend on the local database; --database uses the real ledger instead.
+
+    python benchmarks/bench_serialization.py --rows 50000
+    python benchmarks/bench_serialization.py --database --start 2022-01-01 --end 2022-12-31
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+import cashflow
+from compression import BROTLI_QUALITY, GZIP_LEVEL
+from json_response import dumps, to_columns
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def synthetic_rows(n, seed=7):
+    """Rows shaped like the cashflow query output (date text, Decimal amounts)."""
+    rng = random.Random(seed)
+    descriptions = ["Daily Sales Deposit", "Coffee Supplier", "Bakery Payment", "Rent Payment",
+                    "Facebook Ads", "Utility Company", "Eva Thompson", "Daniel Lee"]
+    categories = ["Sales Revenue", "COGS", "Supplies", "Operating Expense", "Marketing",
+                  "Utilities", "PAYROLL/LABOR"]
+    day = date(2022, 1, 1)
+    rows = []
+    for i in range(n):
+        if i % 40 == 0:
+            day += timedelta(days=1)
+        rows.append((day.isoformat(), rng.choice(descriptions), rng.choice(categories),
+                     Decimal(f"{rng.uniform(-2000, 2000):.2f}")))
+    return rows
+
+
+def database_rows(start, end):
+    from db import get_engine
+
+    with get_engine("reporting").connect() as conn:
+        result = conn.execute(cashflow.cashflow_query(), cashflow.query_params(start, end))
+        return [tuple(r[:4]) for r in result]
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - started)
+    return out, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000, help="synthetic row count")
+    parser.add_argument("--database", action="store_true", help="use the reporting ledger instead")
+    parser.add_argument("--start", default="2022-01-01")
+    parser.add_argument("--end", default="2022-12-31")
+    parser.add_argument("--repeat", type=int, default=5, help="best of N timings")
+    args = parser.parse_args()
+
+    rows = database_rows(args.start, args.end) if args.database else synthetic_rows(args.rows)
+    fields = cashflow.PUBLIC_FIELDS
+
+    def legacy():
+        data = [cashflow.public_row(dict(zip(fields, r))) for r in rows]
+        return JSONResponse(jsonable_encoder(data)).body
+
+    def fast_rows():
+        return dumps([cashflow.public_row(dict(zip(fields, r))) for r in rows])
+
+    def fast_columns():
+        columns = to_columns(rows, fields)
+        columns["amount"] = [float(a) if a is not None else None for a in columns["amount"]]
+        return dumps(columns)
+
+    print(f"{len(rows)} rows ({'database' if args.database else 'synthetic'})\n")
+    print(f"{'format':<22}{'encode ms':>10}{'raw KB':>10}{'gzip KB':>10}{'gzip ms':>9}{'br KB':>9}{'br ms':>8}")
+    for name, fn in [("legacy rows (stdlib)", legacy), ("orjson rows", fast_rows), ("orjson columns", fast_columns)]:
+        body, encode_s = timed(fn, args.repeat)
+        gz, gz_s = timed(lambda: gzip.compress(body, GZIP_LEVEL), args.repeat)
+        line = f"{name:<22}{encode_s * 1000:>10.1f}{len(body) / 1024:>10.1f}{len(gz) / 1024:>10.1f}{gz_s * 1000:>9.1f}"
+        if brotli is not None:
+            br, br_s = timed(lambda: brotli.compress(body, quality=BROTLI_QUALITY), args.repeat)
+            line += f"{len(br) / 1024:>9.1f}{br_s * 1000:>8.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Check that the hot queries are answered from indexes on realistic data.
+
+The statements are the ones the apps run, imported from where they live
+(app.py, bulk_import.py, cashflow.py, ledger_balance.py, timeseries.py,
+forecast_cache.py, budget_routes.py), not copies. A scratch pair of
+databases is built for a data scale exactly as run_benchmarks.py does
+(cloned from the seeded databases, migrated, filled by generate_data.py),
+ANALYZEd, and each statement is EXPLAINed with the planner's normal
+settings and parameters taken from the generated rows. Nothing is executed:
+the import staging tables are created and filled inside the transaction,
+which is rolled back.
+
+A statement fails if the plan reads one of the ledger, rollup or entries
+tables with a Seq Scan, unless that relation holds fewer than
+SEQ_SCAN_MAX_ROWS rows (a small seeded table, or a single monthly
+partition after pruning, is rightly read whole). Using a different index
+than the one the migration added for it is reported but not a failure.
+The exit status is 1 if any statement fails, so CI can run:
+
+    python benchmarks/check_plans.py --scale medium --drop
+    python benchmarks/check_plans.py --scale small --reuse
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import date, timedelta
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+import budget_routes  # noqa: E402
+import bulk_import  # noqa: E402
+import cashflow  # noqa: E402
+import forecast_cache  # noqa: E402
+import ledger_balance  # noqa: E402
+import timeseries  # noqa: E402
+from db import CAFE_DATABASE_URL, REPORTING_DATABASE_URL  # noqa: E402
+from run_benchmarks import SCALES, _database_names, _url, drop_scale, prepare_scale  # noqa: E402
+
+DEFAULT_SCALE = "medium"
+# Seq scans of relations smaller than this are left to the planner
+SEQ_SCAN_MAX_ROWS = 10000
+# Rows staged for the import dedupe statements (a typical upload)
+STAGED_ROWS = 200
+WATCHED_TABLES = {
+    "checking_account_main", "checking_account_secondary", "credit_card_account", "payroll_history",
+    "ledger_daily_rollup", "ledger_period_rollup", "entries",
+}
+
+
+def _psycopg2_sql(query):
+    """A SQLAlchemy text() statement with psycopg2-style parameters."""
+    return re.sub(r"(?<!:):(\w+)", r"%(\1)s", query.text)
+
+
+# --- PARAMETERS FROM THE GENERATED DATA ---
+
+def _last_day(cur):
+    cur.execute("SELECT MAX(date) FROM checking_account_main")
+    return cur.fetchone()[0]
+
+
+def cashflow_page(cur):
+    last = _last_day(cur)
+    cur.execute(
+        "SELECT date, id FROM checking_account_main WHERE date <= %s ORDER BY date DESC, id DESC LIMIT 1",
+        (last - timedelta(days=15),),
+    )
+    day, row_id = cur.fetchone()
+    after = {"after_date": day, "after_src": 1, "after_row": row_id}
+    sql = _psycopg2_sql(cashflow.cashflow_query(True, after, 51))
+    return sql, cashflow.query_params(last - timedelta(days=30), last, after, 51)
+
+
+def checking_delete(cur):
+    cur.execute(
+        "SELECT date, category, description, type, amount FROM checking_account_main "
+        "ORDER BY date DESC, id DESC LIMIT 1"
+    )
+    row = cur.fetchone()
+    return app.CHECKING_DELETE_SQL, row + row
+
+
+def payroll_delete(cur):
+    cur.execute(
+        "SELECT pay_date, employee_name, total_business_cost FROM payroll_history "
+        "ORDER BY pay_date DESC, id DESC LIMIT 1"
+    )
+    row = cur.fetchone()
+    return app.PAYROLL_DELETE_SQL, row + row
+
+
+def import_ledger_sync(cur):
+    """Stage recent checking rows, as an import re-uploading them would."""
+    cur.execute(bulk_import.LEDGER_STAGING_DDL)
+    cur.execute(bulk_import.LEDGER_INSERTED_DDL)
+    cur.execute("""
+        INSERT INTO import_ledger_staging (line, date, entry_type, category, description, amount)
+        SELECT ROW_NUMBER() OVER (), date, CASE WHEN type = 'Credit' THEN 'income' ELSE 'expense' END,
+               category, COALESCE(description, ''), amount
+        FROM (SELECT * FROM checking_account_main WHERE amount IS NOT NULL AND category IS NOT NULL
+              ORDER BY date DESC, id DESC LIMIT %s) recent
+    """, (STAGED_ROWS,))
+    cur.execute("ANALYZE import_ledger_staging")
+    return bulk_import.INSERT_CHECKING_SQL, None
+
+
+def balance_batch(cur):
+    start = _last_day(cur) - timedelta(days=7)
+    end = date.fromordinal(start.toordinal() + ledger_balance.BALANCE_BATCH_DAYS)
+    return ledger_balance.BATCH_UPDATE_SQL, {"start": start, "end": end}
+
+
+def balance_as_of(cur):
+    return _psycopg2_sql(ledger_balance.BALANCE_AS_OF_QUERY), {"day": _last_day(cur) - timedelta(days=30)}
+
+
+def income_progress(cur):
+    last = _last_day(cur)
+    return _psycopg2_sql(timeseries.DAILY_REVENUE_QUERY), {"start": last - timedelta(days=90), "end": last}
+
+
+def forecast_month_reload(cur):
+    lo = _last_day(cur).replace(day=1)
+    hi = (lo + timedelta(days=32)).replace(day=1)
+    sql = forecast_cache.MONTHLY_SQL.format(
+        range_date="AND date >= %(lo)s AND date < %(hi)s",
+        range_pay_date="AND pay_date >= %(lo)s AND pay_date < %(hi)s",
+    )
+    return sql, {"lo": lo, "hi": hi}
+
+
+def entry_import_dedupe(cur):
+    """Stage recent entries, as an import re-uploading them would."""
+    cur.execute(bulk_import.ENTRY_STAGING_DDL)
+    cur.execute("""
+        INSERT INTO import_staging (line, date, entry_type, category, description, amount)
+        SELECT ROW_NUMBER() OVER (), date, entry_type, category, COALESCE(description, ''), balance
+        FROM (SELECT * FROM entries WHERE balance IS NOT NULL ORDER BY date DESC, id DESC LIMIT %s) recent
+    """, (STAGED_ROWS,))
+    cur.execute("ANALYZE import_staging")
+    return bulk_import.MARK_DUPLICATES_SQL, None
+
+
+def _entries_month(cur):
+    cur.execute("SELECT MAX(date) FROM entries")
+    last = cur.fetchone()[0]
+    return {"start": last.replace(day=1), "end": last}
+
+
+def key_insights_entries(cur):
+    return _psycopg2_sql(budget_routes.KEY_INSIGHTS_ENTRIES_QUERY), dict(_entries_month(cur), sales_only=False)
+
+
+def subcategory_entries(cur):
+    return _psycopg2_sql(budget_routes.SUBCATEGORY_ENTRIES_QUERY), _entries_month(cur)
+
+
+# (database, name, statement builder, index the migrations added for it)
+CHECKS = [
+    ("reporting", "cashflow keyset page", cashflow_page, "checking_account_main_date_idx"),
+    ("reporting", "checking delete (app.py)", checking_delete, "checking_account_main_dedupe_idx"),
+    ("reporting", "payroll delete (app.py)", payroll_delete, "payroll_history_dedupe_idx"),
+    ("reporting", "import ledger sync", import_ledger_sync, "checking_account_main_dedupe_idx"),
+    ("reporting", "balance batch update", balance_batch, "checking_account_main_date_idx"),
+    ("reporting", "balance as of", balance_as_of, "checking_account_main_date_idx"),
+    ("reporting", "income progress series", income_progress, "ledger_daily_rollup_series_idx"),
+    ("reporting", "forecast month reload", forecast_month_reload, "payroll_history_pay_date_idx"),
+    ("cafe", "import entry dedupe", entry_import_dedupe, "entries_dedupe_idx"),
+    ("cafe", "key insights entries", key_insights_entries, "entries_expense_date_idx"),
+    ("cafe", "expense by subcategory", subcategory_entries, "entries_expense_date_idx"),
+]
+
+
+# --- PLAN INSPECTION ---
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _parent(cur, name):
+    """For a partition or an index on one, the partitioned table or index it belongs to."""
+    cur.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhparent "
+        "WHERE i.inhrelid = to_regclass(%s)",
+        (name,),
+    )
+    row = cur.fetchone()
+    return row[0] if row else name
+
+
+def _rows(cur, relation):
+    cur.execute("SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)", (relation,))
+    row = cur.fetchone()
+    return max(0, int(row[0])) if row else 0
+
+
+def check(conn, builder):
+    """EXPLAIN one statement. Returns (indexes used, [(relation, rows)] of the watched tables seq scanned)."""
+    cur = conn.cursor()
+    try:
+        sql, params = builder(cur)
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = list(_plan_nodes(plan[0]["Plan"]))
+        used = {_parent(cur, n["Index Name"]) for n in nodes if n.get("Index Name")}
+        seq = []
+        for n in nodes:
+            if n["Node Type"] != "Seq Scan" or _parent(cur, n["Relation Name"]) not in WATCHED_TABLES:
+                continue
+            seq.append((n["Relation Name"], _rows(cur, n["Relation Name"])))
+        return used, seq
+    finally:
+        conn.rollback()
+        cur.close()
+
+
+def run(conns):
+    """Check every statement whose database is in `conns`. Returns the number of failures."""
+    for conn in conns.values():
+        cur = conn.cursor()
+        cur.execute("ANALYZE")
+        conn.commit()
+        cur.close()
+    failures = 0
+    for database, name, builder, index in CHECKS:
+        if database not in conns:
+            continue
+        used, seq = check(conns[database], builder)
+        ok = all(rows < SEQ_SCAN_MAX_ROWS for _, rows in seq)
+        failures += not ok
+        note = "" if index in used else f" (intended {index})"
+        scans = ", ".join(f"{rel} ({rows} rows)" for rel, rows in seq) or "-"
+        print(f"{'ok  ' if ok else 'FAIL'} {database:<10} {name:<26} indexes={sorted(used)} seq_scans={scans}{note}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the hot queries' plans use indexes on generated data.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default=DEFAULT_SCALE,
+                        help="data scale of the scratch databases (see run_benchmarks.py)")
+    parser.add_argument("--reuse", action="store_true", help="keep existing bench_* databases instead of regenerating")
+    parser.add_argument("--drop", action="store_true", help="drop the scratch databases afterwards")
+    parser.add_argument("--current", action="store_true",
+                        help="check the configured databases (DATABASE_URL, CAFE_DATABASE_URL) as they are")
+    args = parser.parse_args()
+
+    if args.current:
+        urls = {"reporting": REPORTING_DATABASE_URL, "cafe": CAFE_DATABASE_URL}
+    else:
+        # budget_routes connected to the seeded databases on import; they can't be cloned while in use
+        budget_routes.engine.dispose()
+        budget_routes.cafe_engine.dispose()
+        prepare_scale(args.scale, args.reuse)
+        reporting_db, cafe_db = _database_names(args.scale)
+        urls = {"reporting": _url(REPORTING_DATABASE_URL, reporting_db), "cafe": _url(CAFE_DATABASE_URL, cafe_db)}
+    conns = {name: psycopg2.connect(url) for name, url in urls.items()}
+    try:
+        failures = run(conns)
+    finally:
+        for conn in conns.values():
+            conn.close()
+        if args.drop and not args.current:
+            drop_scale(args.scale)
+    if failures:
+        print(f"{failures} statement(s) read a large table without an index")
+        sys.exit(1)
@@ -0,0 +1,713 @@
+"""Endpoint benchmarks at several data scales.
+
+For every scale, scratch databases are cloned from the seeded ones
+(CREATE DATABASE ... TEMPLATE) and filled by generate_data.py. A worker
+process is then started with DATABASE_URL / CAFE_DATABASE_URL and the
+app.py DB_* variables pointing at them. It drives every route of main.py
+and budget_routes.py (FastAPI TestClient) and of app.py (Flask test
+client) in-process, including the write paths: budget CRUD, entry add /
+import / delete. For each route it records:
+
+    p50 / p95 / p99 / mean / max latency in ms (after warm-up requests)
+    rows scanned by one request: seq_tup_read and idx_tup_fetch from
+      pg_stat_user_tables in both databases, measured on a separate
+      instrumented request after the pools are closed so the stats are flushed
+    peak RSS of the worker after the route, and how much the route raised it
+
+Results are written as JSON together with the git commit, so two runs can
+be compared:
+
+    python benchmarks/run_benchmarks.py --scales seed,small --iterations 20
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+
+Read-only routes run first. The write scenarios run last because they
+bump the ledger / budget versions and so invalidate the caches. Each
+import adds IMPORT_ROWS entries, which is noise next to the scale sizes.
+
+Between the two, a concurrency scenario samples /api/data-bounds on its
+own (idle baseline), then again while forecasts and PDF renders run in
+parallel. The ledger version is bumped before each round so that the heavy
+requests really refit and re-render. Both latencies are recorded. The run
+fails (exit status 1) if the cheap route's p95 under load is more than
+CONCURRENCY_P95_RATIO times its idle p95 and also more than
+CONCURRENCY_MIN_MS slower.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy.engine import make_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import CAFE_DATABASE_URL, REPORTING_DATABASE_URL  # noqa: E402
+
+# name -> (years, checking transactions per day, employees); None keeps the seeded rows as they are
+SCALES = {
+    "seed": None,
+    "small": (1, 20, 8),
+    "medium": (3, 100, 15),
+    "large": (5, 400, 25),
+}
+ITERATIONS = 20
+WARMUP = 2
+# Routes that read whole ranges, render PDFs or fit models get fewer timed requests
+HEAVY_ITERATIONS = 5
+IMPORT_ROWS = 200
+# p95 slower than this (relative), and by more than COMPARE_MIN_MS, counts as a regression
+COMPARE_THRESHOLD = 0.2
+COMPARE_MIN_MS = 1.0
+# Cheap-route p95 while heavy work runs vs. idle: allowed ratio, and an absolute slack under which it
+# always passes. The slack covers sharing the CPU (and the GIL) with the heavy threads on small machines;
+# a blocked event loop or starved pool shows up as the heavy requests' own duration, hundreds of ms.
+CONCURRENCY_P95_RATIO = 3.0
+CONCURRENCY_MIN_MS = 75.0
+CONCURRENCY_SAMPLE_INTERVAL = 0.01
+# Idle requests the baseline p95 is taken from
+CONCURRENCY_IDLE_SAMPLES = 30
+
+
+# --- SCRATCH DATABASES ---
+
+def _database_names(scale):
+    return f"bench_{scale}_cashflow", f"bench_{scale}_cafe"
+
+
+def _url(base, database):
+    return make_url(base).set(database=database).render_as_string(hide_password=False)
+
+
+def _admin_connection():
+    conn = psycopg2.connect(_url(REPORTING_DATABASE_URL, "postgres"))
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+
+def prepare_scale(scale, reuse=False):
+    """Clone the seeded databases for `scale` and generate its data. Returns load statistics."""
+    reporting_db, cafe_db = _database_names(scale)
+    template_reporting = make_url(REPORTING_DATABASE_URL).database
+    template_cafe = make_url(CAFE_DATABASE_URL).database
+    admin = _admin_connection()
+    cur = admin.cursor()
+    cur.execute("SELECT datname FROM pg_database WHERE datname IN (%s, %s)", (reporting_db, cafe_db))
+    if reuse and len(cur.fetchall()) == 2:
+        print(f"[{scale}] reusing {reporting_db}, {cafe_db}")
+        admin.close()
+        return {"reused": True}
+    for name, template in ((reporting_db, template_reporting), (cafe_db, template_cafe)):
+        cur.execute(f"DROP DATABASE IF EXISTS {name}")
+        cur.execute(f"CREATE DATABASE {name} TEMPLATE {template}")
+    admin.close()
+
+    started = time.perf_counter()
+    stats = {"reused": False}
+    conn = psycopg2.connect(_url(REPORTING_DATABASE_URL, reporting_db))
+    cafe_conn = psycopg2.connect(_url(CAFE_DATABASE_URL, cafe_db))
+    try:
+        from generate_data import default_start, generate
+        from ledger_bounds import reconcile_bounds
+        from ledger_rollup import rebuild_rollup
+        from migrations import migrate
+
+        migrate(conn, "reporting")
+        migrate(cafe_conn, "cafe")
+        if SCALES[scale] is not None:
+            years, per_day, employees = SCALES[scale]
+            days = int(round(years * 365.25))
+            cur = conn.cursor()
+            start = default_start(cur, days, replace=True)
+            cur.close()
+            generate(conn, cafe_conn, start, days, per_day, employees, replace=True)
+        rebuild_rollup(conn)
+        reconcile_bounds(conn)
+    finally:
+        cafe_conn.close()
+        conn.close()
+    stats["load_seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def drop_scale(scale):
+    admin = _admin_connection()
+    cur = admin.cursor()
+    for name in _database_names(scale):
+        cur.execute(f"DROP DATABASE IF EXISTS {name}")
+    admin.close()
+
+
+def worker_env(scale):
+    reporting_db, cafe_db = _database_names(scale)
+    url = make_url(REPORTING_DATABASE_URL)
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": _url(REPORTING_DATABASE_URL, reporting_db),
+        "CAFE_DATABASE_URL": _url(CAFE_DATABASE_URL, cafe_db),
+        "REPORTING_DB_NAME": reporting_db,
+        "CAFE_DB_NAME": cafe_db,
+        "DB_USER": url.username or "postgres",
+        "DB_PASSWORD": url.password or "",
+        "DB_HOST": url.host or "localhost",
+    })
+    return env
+
+
+# --- MEASUREMENT (runs inside the worker process) ---
+
+class StatsProbe:
+    """Rows scanned in both databases, read once every app connection is closed (stats flush on exit)."""
+
+    def __init__(self):
+        self.conns = [psycopg2.connect(os.environ["DATABASE_URL"]), psycopg2.connect(os.environ["CAFE_DATABASE_URL"])]
+        for conn in self.conns:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+
+    def _quiesce(self):
+        import db
+
+        for name in db.DATABASE_URLS:
+            db.get_engine(name).dispose()
+        deadline = time.monotonic() + 5
+        for conn in self.conns:
+            cur = conn.cursor()
+            while time.monotonic() < deadline:
+                cur.execute(
+                    "SELECT COUNT(*) FROM pg_stat_activity "
+                    "WHERE datname = current_database() AND pid <> pg_backend_pid() AND backend_type = 'client backend'"
+                )
+                if cur.fetchone()[0] == 0:
+                    break
+                time.sleep(0.02)
+            cur.close()
+
+    def snapshot(self):
+        self._quiesce()
+        seq = idx = 0
+        for conn in self.conns:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_stat_clear_snapshot()")
+            cur.execute("SELECT COALESCE(SUM(seq_tup_read), 0), COALESCE(SUM(idx_tup_fetch), 0) FROM pg_stat_user_tables")
+            s, i = cur.fetchone()
+            seq += int(s)
+            idx += int(i)
+            cur.close()
+        return seq, idx
+
+    def close(self):
+        for conn in self.conns:
+            conn.close()
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def latency_stats(latencies):
+    lat = np.array(latencies) if latencies else np.array([np.nan])
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        "mean_ms": round(float(lat.mean()), 3),
+        "max_ms": round(float(lat.max()), 3),
+    }
+
+
+class Recorder:
+    def __init__(self, iterations, warmup, probe):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.probe = probe
+        self.routes = {}
+
+    def _entry(self, name, method, path):
+        return self.routes.setdefault(name, {
+            "method": method, "path": path, "latencies": [], "statuses": set(), "rows_scanned": None,
+        })
+
+    def measure(self, name, method, path, call, heavy=False):
+        """Warm up, time `call` repeatedly, then run it once more between two stats snapshots."""
+        entry = self._entry(name, method, path)
+        rss_before = _peak_rss_mb()
+        for _ in range(self.warmup):
+            call()
+        for _ in range(min(self.iterations, HEAVY_ITERATIONS) if heavy else self.iterations):
+            self.time_once(name, method, path, call)
+        entry["rows_scanned"] = self.scanned(call)
+        entry["peak_rss_mb"] = _peak_rss_mb()
+        entry["rss_growth_mb"] = round(entry["peak_rss_mb"] - rss_before, 1)
+
+    def time_once(self, name, method, path, call):
+        entry = self._entry(name, method, path)
+        started = time.perf_counter()
+        response = call()
+        entry["latencies"].append((time.perf_counter() - started) * 1000)
+        entry["statuses"].add(response.status_code)
+        entry["peak_rss_mb"] = _peak_rss_mb()
+        return response
+
+    def scanned(self, call):
+        before = self.probe.snapshot()
+        call()
+        after = self.probe.snapshot()
+        return {"seq": after[0] - before[0], "index": after[1] - before[1]}
+
+    def results(self):
+        out = {}
+        for name, entry in self.routes.items():
+            out[name] = {
+                "method": entry["method"],
+                "path": entry["path"],
+                **latency_stats(entry["latencies"]),
+                "statuses": sorted(entry["statuses"]),
+                "rows_scanned": entry["rows_scanned"],
+                "peak_rss_mb": entry.get("peak_rss_mb"),
+                "rss_growth_mb": entry.get("rss_growth_mb", 0.0),
+            }
+        return out
+
+
+def _month_after(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1).strftime("%Y-%m")
+
+
+def read_routes(api, bounds):
+    """(name, method, path template, call, heavy) for every read endpoint of the FastAPI app."""
+    lo, hi = bounds
+    full = {"start_date": lo.isoformat(), "end_date": hi.isoformat()}
+    year = {"start_date": max(lo, hi - timedelta(days=365)).isoformat(), "end_date": hi.isoformat()}
+    month = {"start_date": max(lo, hi - timedelta(days=30)).isoformat(), "end_date": hi.isoformat()}
+    budget_month = hi.strftime("%Y-%m")
+    get = lambda path, params=None: (lambda: api.get(path, params=params))
+    return [
+        ("GET /api/pool-stats", "GET", "/api/pool-stats", get("/api/pool-stats"), False),
+        ("GET /api/data-bounds", "GET", "/api/data-bounds", get("/api/data-bounds"), False),
+        ("GET /api/income-progress [full]", "GET", "/api/income-progress", get("/api/income-progress", full), False),
+        ("GET /api/income-progress [full, columns]", "GET", "/api/income-progress",
+         get("/api/income-progress", {**full, "layout": "columns"}), False),
+        ("GET /api/financial-summary [month]", "GET", "/api/financial-summary", get("/api/financial-summary", month), False),
+        ("GET /api/financial-summary [full]", "GET", "/api/financial-summary", get("/api/financial-summary", full), False),
+        ("GET /api/dashboard [month+year]", "GET", "/api/dashboard", get("/api/dashboard", {"range": [
+            f"{month['start_date']},{month['end_date']},500", f"{year['start_date']},{year['end_date']}"]}), False),
+        ("GET /api/detailed-cashflow [month]", "GET", "/api/detailed-cashflow", get("/api/detailed-cashflow", month), False),
+        ("GET /api/detailed-cashflow [full]", "GET", "/api/detailed-cashflow", get("/api/detailed-cashflow", full), True),
+        ("GET /api/detailed-cashflow [full, page 500]", "GET", "/api/detailed-cashflow",
+         get("/api/detailed-cashflow", {**full, "limit": 500}), False),
+        ("GET /api/detailed-cashflow [full, columns]", "GET", "/api/detailed-cashflow",
+         get("/api/detailed-cashflow", {**full, "layout": "columns"}), True),
+        ("GET /api/detailed-cashflow [full, ndjson]", "GET", "/api/detailed-cashflow",
+         get("/api/detailed-cashflow", {**full, "format": "ndjson"}), True),
+        ("GET /api/export/ledger [full, arrow]", "GET", "/api/export/ledger", get("/api/export/ledger", full), True),
+        ("GET /api/export/ledger [full, parquet]", "GET", "/api/export/ledger",
+         get("/api/export/ledger", {**full, "format": "parquet"}), True),
+        ("GET /api/export/cashflow [full, csv]", "GET", "/api/export/cashflow", get("/api/export/cashflow", full), True),
+        ("GET /api/export/cashflow [year, xlsx]", "GET", "/api/export/cashflow",
+         get("/api/export/cashflow", {**year, "format": "xlsx"}), True),
+        ("GET /api/export/kpis [full]", "GET", "/api/export/kpis", get("/api/export/kpis", full), False),
+        ("GET /api/export/budget [year]", "GET", "/api/export/budget",
+         get("/api/export/budget", {**year, "month": budget_month}), False),
+        ("GET /api/predict-finances", "GET", "/api/predict-finances",
+         get("/api/predict-finances", {"target_date": hi.isoformat()}), True),
+        ("GET /api/download-pdf [year]", "GET", "/api/download-pdf", get("/api/download-pdf", year), True),
+        ("GET /api/budgets", "GET", "/api/budgets", get("/api/budgets", {"month": budget_month}), False),
+        ("GET /api/company_budgets", "GET", "/api/company_budgets", get("/api/company_budgets"), False),
+        ("GET /api/overall_budgets", "GET", "/api/overall_budgets", get("/api/overall_budgets"), False),
+        ("GET /api/key-insights [year]", "GET", "/api/key-insights",
+         get("/api/key-insights", {**year, "month": budget_month}), False),
+        ("GET /api/expense-by-subcategory [year]", "GET", "/api/expense-by-subcategory",
+         get("/api/expense-by-subcategory", year), False),
+    ]
+
+
+def report_job_cycle(rec, api, bounds):
+    """POST /api/reports, poll it to completion, download the PDF."""
+    lo, hi = bounds
+    params = {"start_date": max(lo, hi - timedelta(days=90)).isoformat(), "end_date": hi.isoformat()}
+    job = rec.time_once("POST /api/reports", "POST", "/api/reports", lambda: api.post("/api/reports", params=params)).json()
+    status = job if "job_id" in job else {}
+    while status.get("status") in ("queued", "running"):
+        status = rec.time_once("GET /api/reports/{job_id}", "GET", "/api/reports/{job_id}",
+                               lambda: api.get(f"/api/reports/{job['job_id']}")).json()
+        time.sleep(0.05)
+    rec.time_once("GET /api/reports/{job_id}/download", "GET", "/api/reports/{job_id}/download",
+                  lambda: api.get(f"/api/reports/{job['job_id']}/download"))
+
+
+def _timed(call):
+    started = time.perf_counter()
+    response = call()
+    return (time.perf_counter() - started) * 1000, response.status_code
+
+
+def _invalidate_ledger():
+    """Mark the whole ledger as changed, as a write would, so forecasts and PDFs are recomputed."""
+    from ledger_version import bump_ledger_version
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    cur = conn.cursor()
+    bump_ledger_version(cur)
+    conn.commit()
+    conn.close()
+
+
+def concurrency_scenario(api, bounds, rounds, samples):
+    """/api/data-bounds latency idle, then while forecasts and PDF renders run alongside it.
+
+    `api` must be a TestClient used as a context manager: all threads then
+    share its event loop, as they would share a server's. Each round
+    starts one more heavy request than the heavy pool has workers, so one
+    of them queues.
+    """
+    import workers
+
+    lo, hi = bounds
+    year = {"start_date": max(lo, hi - timedelta(days=365)).isoformat(), "end_date": hi.isoformat()}
+    cheap = lambda: api.get("/api/data-bounds")
+    heavy_calls = [
+        ("GET /api/predict-finances", lambda: api.get("/api/predict-finances", params={"target_date": hi.isoformat()})),
+        ("GET /api/download-pdf [year]", lambda: api.get("/api/download-pdf", params=year)),
+    ]
+    heavy_calls = [heavy_calls[i % len(heavy_calls)] for i in range(workers.HEAVY_WORKERS + 1)]
+
+    for _ in range(WARMUP):
+        cheap()
+    idle = [_timed(cheap)[0] for _ in range(max(samples, CONCURRENCY_IDLE_SAMPLES))]
+    loaded, heavy, statuses = [], {}, set()
+    with ThreadPoolExecutor(max_workers=len(heavy_calls)) as pool:
+        for _ in range(rounds):
+            _invalidate_ledger()
+            futures = [(name, pool.submit(_timed, call)) for name, call in heavy_calls]
+            while not all(f.done() for _, f in futures):
+                loaded.append(_timed(cheap)[0])
+                time.sleep(CONCURRENCY_SAMPLE_INTERVAL)
+            for name, f in futures:
+                ms, status = f.result()
+                heavy.setdefault(name, []).append(ms)
+                statuses.add(status)
+
+    idle_stats, loaded_stats = latency_stats(idle), latency_stats(loaded)
+    limit = max(idle_stats["p95_ms"] * CONCURRENCY_P95_RATIO, idle_stats["p95_ms"] + CONCURRENCY_MIN_MS)
+    return {
+        "cheap_route": "GET /api/data-bounds",
+        "idle": idle_stats,
+        "under_load": loaded_stats,
+        "heavy": {name: latency_stats(lat) for name, lat in heavy.items()},
+        "heavy_statuses": sorted(statuses),
+        "p95_limit_ms": round(limit, 3),
+        # The heavy requests must have succeeded; with no samples under load they were too fast to overlap
+        "passed": statuses <= {200} and (not loaded or loaded_stats["p95_ms"] <= limit),
+    }
+
+
+def budget_cycle(rec, api, month):
+    """Overall, category and company budgets: create, update, delete (later steps skipped if a create fails)."""
+    t = rec.time_once
+    overall = t("POST /api/overall_budgets", "POST", "/api/overall_budgets",
+                lambda: api.post("/api/overall_budgets", json={"month": month, "amount": 100000, "description": "bench"}))
+    main = t("POST /api/budgets", "POST", "/api/budgets",
+             lambda: api.post("/api/budgets", json={"month": month, "category": "COGS", "amount": 50000}))
+    sub = {"month": month, "category": "COGS", "subcategory": "Bakery Payment", "amount": 10000}
+    created = t("POST /api/budgets", "POST", "/api/budgets", lambda: api.post("/api/budgets", json=sub))
+    if created.status_code == 200:
+        sub_id = created.json()["id"]
+        t("PUT /api/budgets/{budget_id}", "PUT", "/api/budgets/{budget_id}",
+          lambda: api.put(f"/api/budgets/{sub_id}", json={**sub, "amount": 12000}))
+        t("DELETE /api/budgets/{budget_id}", "DELETE", "/api/budgets/{budget_id}", lambda: api.delete(f"/api/budgets/{sub_id}"))
+    if main.status_code == 200:
+        t("DELETE /api/budgets/{budget_id}", "DELETE", "/api/budgets/{budget_id}",
+          lambda: api.delete(f"/api/budgets/{main.json()['id']}"))
+    if overall.status_code == 200:
+        overall_id = overall.json()["id"]
+        t("PUT /api/overall_budgets/{budget_id}", "PUT", "/api/overall_budgets/{budget_id}",
+          lambda: api.put(f"/api/overall_budgets/{overall_id}", json={"month": month, "amount": 90000}))
+        t("DELETE /api/overall_budgets/{budget_id}", "DELETE", "/api/overall_budgets/{budget_id}",
+          lambda: api.delete(f"/api/overall_budgets/{overall_id}"))
+    company = t("POST /api/company_budgets", "POST", "/api/company_budgets",
+                lambda: api.post("/api/company_budgets", json={"month": month, "amount": 5000}))
+    if company.status_code == 200:
+        company_id = company.json()["id"]
+        t("PUT /api/company_budgets/{budget_id}", "PUT", "/api/company_budgets/{budget_id}",
+          lambda: api.put(f"/api/company_budgets/{company_id}", json={"month": month, "amount": 6000}))
+        t("DELETE /api/company_budgets/{budget_id}", "DELETE", "/api/company_budgets/{budget_id}",
+          lambda: api.delete(f"/api/company_budgets/{company_id}"))
+    # Leave the month empty for the next cycle whatever failed
+    _clear_budget_month(month)
+
+
+def _latest_entry_id(description):
+    conn = psycopg2.connect(os.environ["CAFE_DATABASE_URL"])
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(id) FROM entries WHERE description = %s", (description,))
+    entry_id = cur.fetchone()[0]
+    conn.close()
+    return entry_id
+
+
+def entry_cycle(rec, flask, day, n):
+    """Add one entry through the Flask form, then delete it (both synced to the ledger)."""
+    description = f"Bench entry {n}"
+    form = {"date": day.isoformat(), "entry_type": "expense", "category": "COGS", "description": description,
+            "balance": f"{100 + n % 50}.25", "staff_name": "bench"}
+    rec.time_once("POST /", "POST", "/", lambda: flask.post("/?role=admin", data=form))
+    entry_id = _latest_entry_id(description)
+    rec.time_once("POST /delete_entry/<int:id>", "POST", "/delete_entry/<int:id>",
+                  lambda: flask.post(f"/delete_entry/{entry_id}?role=admin"))
+
+
+def import_file(day, n, rows=IMPORT_ROWS):
+    """A CSV like the one the entry page imports; amounts differ per call so every row is new."""
+    lines = ["date,type,category,description,amount"]
+    for i in range(rows):
+        lines.append(f"{(day - timedelta(days=i % 28)).isoformat()},expense,COGS,Bench import,{10 + i}.{n % 100:02d}")
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def run_worker(scale, iterations, warmup, result_file):
+    from fastapi.testclient import TestClient
+
+    import app as entry_app
+    import main as api_module
+
+    # Server errors become 500s in the results instead of aborting the run
+    api = TestClient(api_module.app, raise_server_exceptions=False)
+    flask = entry_app.app.test_client()
+    probe = StatsProbe()
+    rec = Recorder(iterations, warmup, probe)
+
+    bounds_json = api.get("/api/data-bounds").json()
+    bounds = (date.fromisoformat(bounds_json["min"]), date.fromisoformat(bounds_json["max"]))
+    for name, method, path, call, heavy in read_routes(api, bounds):
+        print(f"[{scale}] {name}")
+        rec.measure(name, method, path, call, heavy)
+
+    # The entry page lists every entry; filtered to one month it is the common case
+    rec.measure("GET / [all]", "GET", "/", lambda: flask.get("/?role=admin"), heavy=True)
+    rec.measure("GET / [month]", "GET", "/",
+                lambda: flask.get(f"/?role=admin&year={bounds[1].year}&month={bounds[1].month}"))
+
+    print(f"[{scale}] cheap route while forecasts and PDFs run")
+    with TestClient(api_module.app, raise_server_exceptions=False) as shared:
+        concurrency = concurrency_scenario(shared, bounds, max(1, min(iterations, HEAVY_ITERATIONS)), iterations)
+
+    print(f"[{scale}] write scenarios")
+    cycles = max(1, min(iterations, HEAVY_ITERATIONS))
+    rss_before = _peak_rss_mb()
+    budget_month = _month_after(date.today(), 3)
+    _clear_budget_month(budget_month)
+    for n in range(cycles):
+        report_job_cycle(rec, api, bounds)
+        budget_cycle(rec, api, budget_month)
+        entry_cycle(rec, flask, bounds[1], n)
+        rec.time_once("POST /import_entries", "POST", "/import_entries", lambda: flask.post(
+            "/import_entries?role=admin",
+            data={"import_file": (import_file(bounds[1], n), "bench.csv")},
+            content_type="multipart/form-data",
+        ))
+    # One more of each, between stats snapshots
+    rec.routes["POST /import_entries"]["rows_scanned"] = rec.scanned(lambda: flask.post(
+        "/import_entries?role=admin",
+        data={"import_file": (import_file(bounds[1], cycles), "bench.csv")},
+        content_type="multipart/form-data",
+    ))
+    scenarios = {
+        "report job": rec.scanned(lambda: report_job_cycle(_Untimed(), api, bounds)),
+        "budget create/update/delete": rec.scanned(lambda: budget_cycle(_Untimed(), api, budget_month)),
+        "entry add + delete": rec.scanned(lambda: entry_cycle(_Untimed(), flask, bounds[1], cycles)),
+    }
+    for entry in rec.routes.values():
+        entry.setdefault("rss_growth_mb", round(_peak_rss_mb() - rss_before, 1))
+    probe.close()
+
+    uncovered = _uncovered_routes(api_module.app, entry_app.app, rec.routes)
+    with open(result_file, "w") as f:
+        json.dump({"routes": rec.results(), "scenarios_rows_scanned": scenarios, "concurrency": concurrency,
+                   "rows": _table_rows(), "uncovered": uncovered}, f)
+
+
+class _Untimed:
+    """Stands in for a Recorder when a scenario only runs for its stats."""
+
+    def time_once(self, name, method, path, call):
+        return call()
+
+
+def _clear_budget_month(month):
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    cur = conn.cursor()
+    for table in ("budgets", "overall_budgets", "company_budgets"):
+        cur.execute(f"DELETE FROM {table} WHERE month = %s", (month,))
+    conn.commit()
+    conn.close()
+
+
+def _table_rows():
+    counts = {}
+    for env in ("DATABASE_URL", "CAFE_DATABASE_URL"):
+        conn = psycopg2.connect(os.environ[env])
+        cur = conn.cursor()
+        cur.execute("SELECT relname, n_live_tup FROM pg_stat_user_tables ORDER BY relname")
+        counts.update({name: int(n) for name, n in cur.fetchall()})
+        conn.close()
+    return counts
+
+
+def _uncovered_routes(api_app, flask_app, measured):
+    from fastapi.routing import APIRoute
+
+    seen = {(r["method"], r["path"]) for r in measured.values()}
+    missing = []
+    for route in api_app.routes:
+        if isinstance(route, APIRoute):
+            missing += [f"{m} {route.path}" for m in route.methods if (m, route.path) not in seen]
+    for rule in flask_app.url_map.iter_rules():
+        if rule.endpoint == "static":
+            continue
+        missing += [f"{m} {rule.rule}" for m in rule.methods - {"HEAD", "OPTIONS"} if (m, rule.rule) not in seen]
+    return sorted(missing)
+
+
+# --- DRIVER ---
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def _server_version():
+    conn = psycopg2.connect(REPORTING_DATABASE_URL)
+    cur = conn.cursor()
+    cur.execute("SHOW server_version")
+    version = cur.fetchone()[0]
+    conn.close()
+    return version
+
+
+def run(scales, iterations, warmup, output, reuse=False, drop=False):
+    """Benchmark every scale and write the results. Returns the scales whose concurrency check failed."""
+    commit, dirty = _git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "postgres": _server_version(),
+        "iterations": iterations,
+        "warmup": warmup,
+        "scales": {},
+    }
+    for scale in scales:
+        load = prepare_scale(scale, reuse)
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            result_file = tmp.name
+        try:
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", scale, "--iterations", str(iterations),
+                 "--warmup", str(warmup), "--result-file", result_file],
+                cwd=ROOT, env=worker_env(scale), check=True,
+            )
+            with open(result_file) as f:
+                worker = json.load(f)
+        finally:
+            os.unlink(result_file)
+            if drop:
+                drop_scale(scale)
+        results["scales"][scale] = {"params": SCALES[scale], "load": load, **worker}
+        if worker["uncovered"]:
+            print(f"[{scale}] routes not exercised: {', '.join(worker['uncovered'])}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    print(f"Results written to {output}")
+    return [scale for scale, data in results["scales"].items() if not data["concurrency"]["passed"]]
+
+
+def print_summary(results):
+    for scale, data in results["scales"].items():
+        print(f"\n== {scale} ({data['rows'].get('checking_account_main', 0)} checking rows) ==")
+        print(f"{'route':<52} {'p50':>9} {'p95':>9} {'p99':>9} {'seq rows':>10} {'idx rows':>10} {'rss MB':>7}")
+        for name, r in data["routes"].items():
+            scanned = r["rows_scanned"] or {"seq": "", "index": ""}
+            print(f"{name[:52]:<52} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+                  f"{scanned['seq']:>10} {scanned['index']:>10} {r['peak_rss_mb'] or '':>7}")
+        c = data["concurrency"]
+        print(f"{c['cheap_route']} p95: idle {c['idle']['p95_ms']} ms, under load {c['under_load']['p95_ms']} ms "
+              f"({c['under_load']['requests']} samples, limit {c['p95_limit_ms']} ms): {'ok' if c['passed'] else 'FAILED'}")
+
+
+def compare(old_path, new_path, threshold=COMPARE_THRESHOLD):
+    """Print routes whose p95 regressed between two result files. Returns the number of regressions."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    regressions = 0
+    for scale, data in new["scales"].items():
+        before = old["scales"].get(scale, {}).get("routes", {})
+        for name, r in data["routes"].items():
+            b = before.get(name)
+            if not b or not b["requests"] or not r["requests"]:
+                continue
+            ratio = r["p95_ms"] / b["p95_ms"] if b["p95_ms"] else float("inf")
+            slower = ratio > 1 + threshold and r["p95_ms"] - b["p95_ms"] > COMPARE_MIN_MS
+            regressions += slower
+            if slower or ratio < 1 - threshold:
+                label = "SLOWER" if slower else "faster"
+                print(f"[{scale}] {label:<6} {name}: p95 {b['p95_ms']} -> {r['p95_ms']} ms ({ratio:.2f}x)")
+    print(f"{regressions} regressions")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every API and entry-app route at several data scales.")
+    parser.add_argument("--scales", default="seed,small", help=f"comma-separated, from: {', '.join(SCALES)}")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--warmup", type=int, default=WARMUP)
+    parser.add_argument("--output", default=None, help="results JSON (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--reuse", action="store_true", help="keep existing bench_* databases instead of regenerating")
+    parser.add_argument("--drop", action="store_true", help="drop each scale's databases after its run")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--threshold", type=float, default=COMPARE_THRESHOLD)
+    parser.add_argument("--worker", metavar="SCALE", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, threshold=args.threshold) else 0)
+    if args.worker:
+        run_worker(args.worker, args.iterations, args.warmup, args.result_file)
+        sys.exit(0)
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scales: {', '.join(unknown)}")
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{(_git_commit()[0] or 'local')[:12]}.json")
+    failed = run(scales, args.iterations, args.warmup, output, args.reuse, args.drop)
+    if failed:
+        print(f"Cheap-route latency regressed under load at: {', '.join(failed)}")
+        sys.exit(1)
@@ -0,0 +1,308 @@
+"""Set-based import of uploaded entry files (/import_entries).
+
+The uploaded rows are normalized in Python and COPY'd into a temporary
+staging table in the cafe DB. A fixed number of statements then handles
+the whole file, however many rows it has:
+
+1. mark duplicates: rows already in `entries`, or repeated earlier in
+   the file (same date, category, description, type and amount);
+2. insert the rest into `entries` in file order;
+3. COPY the inserted rows into a staging table in the reporting DB;
+4. one INSERT .. SELECT each for payroll_history (Payroll categories) and
+   checking_account_main (everything else, income -> Credit,
+   expense -> Debit, skipping rows the ledger already has);
+5. update the daily/period rollups, ledger version, date bounds and
+   running balances once for all inserted rows.
+
+Rows without a date, category or description, with an unreadable date, or
+with an amount too large for entries.balance are rejected rather than
+failing the import. The report returned by `import_rows` has the
+inserted / duplicate / rejected counts and the first few rejections.
+"""
+import csv
+import io
+from datetime import date, datetime
+
+import ledger_balance
+import ledger_rollup
+from ledger_bounds import extend_bounds
+from ledger_version import bump_entry_version, bump_ledger_version
+
+# Arbitrary key for pg_advisory_xact_lock: concurrent imports dedupe against each other
+IMPORT_LOCK_KEY = 7349024
+PAYROLL_CATEGORIES = ("payroll", "payroll/labor")
+# entries.balance is NUMERIC(12,2)
+MAX_AMOUNT = 10 ** 10
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%m/%d/%y", "%d.%m.%Y")
+REPORTED_REJECTIONS = 20
+STAGED_COLUMNS = ("line", "date", "entry_type", "category", "description", "amount")
+
+ENTRY_STAGING_DDL = """
+    CREATE TEMP TABLE import_staging (
+        line INTEGER PRIMARY KEY,
+        date DATE NOT NULL,
+        entry_type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        description TEXT NOT NULL,
+        amount NUMERIC NOT NULL,
+        status TEXT NOT NULL DEFAULT 'new'
+    ) ON COMMIT DROP
+"""
+
+MARK_DUPLICATES_SQL = """
+    UPDATE import_staging s SET status = 'duplicate'
+    FROM (
+        SELECT line, ROW_NUMBER() OVER (
+            PARTITION BY date, category, description, entry_type, amount ORDER BY line
+        ) AS n
+        FROM import_staging
+    ) r
+    WHERE r.line = s.line
+      AND (r.n > 1 OR EXISTS (
+          SELECT 1 FROM entries e
+          WHERE e.date = s.date AND e.category = s.category AND e.description = s.description
+            AND e.entry_type = s.entry_type AND e.balance = s.amount
+      ))
+"""
+
+LEDGER_STAGING_DDL = """
+    CREATE TEMP TABLE import_ledger_staging (
+        line INTEGER PRIMARY KEY,
+        date DATE NOT NULL,
+        entry_type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        description TEXT NOT NULL,
+        amount NUMERIC NOT NULL
+    ) ON COMMIT DROP
+"""
+
+# What went into the ledger, in ledger_rollup.apply_rows shape
+LEDGER_INSERTED_DDL = """
+    CREATE TEMP TABLE import_ledger_inserted (
+        source TEXT NOT NULL,
+        day DATE NOT NULL,
+        category TEXT,
+        subcategory TEXT,
+        amount NUMERIC,
+        net_pay NUMERIC
+    ) ON COMMIT DROP
+"""
+
+IS_PAYROLL = "LOWER(BTRIM(category, E' \\t\\r\\n')) IN ({})".format(
+    ", ".join(f"'{c}'" for c in PAYROLL_CATEGORIES))
+
+INSERT_PAYROLL_SQL = f"""
+    WITH ins AS (
+        INSERT INTO payroll_history (employee_name, pay_date, total_business_cost, role)
+        SELECT description, date, amount, 'Employee'
+        FROM import_ledger_staging
+        WHERE {IS_PAYROLL}
+        ORDER BY line
+        RETURNING pay_date, employee_name, total_business_cost
+    )
+    INSERT INTO import_ledger_inserted (source, day, category, subcategory, amount, net_pay)
+    SELECT '{ledger_rollup.PAYROLL}', pay_date, 'Payroll', employee_name, total_business_cost, NULL FROM ins
+"""
+
+INSERT_CHECKING_SQL = f"""
+    WITH candidates AS (
+        SELECT line, date, description, category, amount,
+               CASE WHEN entry_type = 'income' THEN 'Credit' ELSE 'Debit' END AS type
+        FROM import_ledger_staging
+        WHERE NOT {IS_PAYROLL}
+    ), ins AS (
+        INSERT INTO checking_account_main (date, transaction_id, description, category, type, amount, balance)
+        SELECT date, 'TX-' || UPPER(SUBSTR(MD5(CAST(RANDOM() AS TEXT) || line), 1, 8)),
+               description, category, type, amount, 0
+        FROM candidates s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM checking_account_main c
+            WHERE c.date = s.date AND c.category = s.category AND c.description = s.description
+              AND c.type = s.type AND c.amount = s.amount
+        )
+        ORDER BY line
+        RETURNING date, category, description, amount
+    )
+    INSERT INTO import_ledger_inserted (source, day, category, subcategory, amount, net_pay)
+    SELECT '{ledger_rollup.CHECKING_MAIN}', date, category, description, amount, NULL FROM ins
+"""
+
+
+def _blank(value):
+    # '' from CSV, None / NaN / NaT from Excel (NaN-likes are not equal to themselves)
+    return value is None or value == '' or value != value
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    try:
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_amount(value):
+    if _blank(value):
+        return 0.0
+    try:
+        return float(value)
+    except Exception:
+        try:
+            return float(str(value).replace(',', ''))
+        except Exception:
+            return 0.0
+
+
+def normalize(raw):
+    """One uploaded row -> ((date, entry_type, category, description, amount), None) or (None, reason)."""
+    kv = {str(k).strip().lower(): raw[k] for k in raw.keys()}
+    date_val = kv.get('date') if not _blank(kv.get('date')) else kv.get('pay_date')
+    desc = next((kv.get(k) for k in ('description', 'employee_name', 'vendor') if not _blank(kv.get(k))), None)
+    category = kv.get('category')
+    if _blank(date_val) or _blank(category) or _blank(desc):
+        return None, "missing date, category or description"
+    day = _parse_date(date_val)
+    if day is None:
+        return None, f"unreadable date {date_val!r}"
+    amount = _parse_amount(kv.get('amount') if not _blank(kv.get('amount')) else kv.get('balance'))
+    if abs(amount) >= MAX_AMOUNT:
+        return None, f"amount {amount} out of range"
+    t = str(kv.get('type') or kv.get('entry_type') or '').strip().lower()
+    if t in ('credit', 'income'):
+        entry_type = 'income'
+    elif t in ('debit', 'expense'):
+        entry_type = 'expense'
+    else:
+        entry_type = 'income' if amount >= 0 else 'expense'
+    return (day, entry_type, str(category), str(desc), amount), None
+
+
+def _copy_in(cur, table, columns, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(records)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _stage_entries(cur, records):
+    """Stage, dedupe and insert into entries. Returns ({status: count}, CSV of the inserted rows)."""
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (IMPORT_LOCK_KEY,))
+    cur.execute(ENTRY_STAGING_DDL)
+    _copy_in(cur, "import_staging", STAGED_COLUMNS, records)
+    cur.execute("ANALYZE import_staging")
+    cur.execute(MARK_DUPLICATES_SQL)
+    cur.execute(
+        "INSERT INTO entries (date, entry_type, category, description, balance) "
+        "SELECT date, entry_type, category, description, amount FROM import_staging "
+        "WHERE status = 'new' ORDER BY line"
+    )
+    if cur.rowcount:
+        bump_entry_version(cur)
+    cur.execute("SELECT status, COUNT(*) FROM import_staging GROUP BY status")
+    counts = dict(cur.fetchall())
+    inserted = io.StringIO()
+    cur.copy_expert(
+        f"COPY (SELECT {', '.join(STAGED_COLUMNS)} FROM import_staging WHERE status = 'new' ORDER BY line) "
+        "TO STDOUT WITH (FORMAT csv)",
+        inserted,
+    )
+    inserted.seek(0)
+    return counts, inserted
+
+
+def _sync_ledger(r_cur, inserted):
+    """Write the newly inserted entries to the reporting ledger. Returns (payroll rows, checking rows, checking dupes)."""
+    r_cur.execute(LEDGER_STAGING_DDL)
+    r_cur.execute(LEDGER_INSERTED_DDL)
+    r_cur.copy_expert(
+        f"COPY import_ledger_staging ({', '.join(STAGED_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", inserted
+    )
+    r_cur.execute("ANALYZE import_ledger_staging")
+    r_cur.execute(INSERT_PAYROLL_SQL)
+    payroll = r_cur.rowcount
+    r_cur.execute(f"SELECT COUNT(*) FROM import_ledger_staging WHERE NOT {IS_PAYROLL}")
+    checking_candidates = r_cur.fetchone()[0]
+    r_cur.execute(INSERT_CHECKING_SQL)
+    checking = r_cur.rowcount
+
+    ledger_rollup.apply_rows(r_cur, "import_ledger_inserted")
+    r_cur.execute("SELECT DISTINCT day, source FROM import_ledger_inserted ORDER BY day")
+    touched = r_cur.fetchall()
+    days = sorted({day for day, _ in touched})
+    if days:
+        bump_ledger_version(r_cur, days)
+        extend_bounds(r_cur, days)
+        ledger_balance.recompute_balances(
+            r_cur, [day for day, source in touched if source == ledger_rollup.CHECKING_MAIN]
+        )
+    return payroll, checking, checking_candidates - checking
+
+
+def import_rows(conn, r_conn, rows):
+    """Import uploaded rows (dicts) into entries and the reporting ledger. Returns the report.
+
+    `conn` is the cafe DB and `r_conn` the reporting DB (psycopg2). Entries
+    are committed even if the ledger sync fails; the failure is in the
+    report's "sync_error".
+    """
+    records, rejected = [], []
+    for line, raw in enumerate(rows, start=1):
+        record, reason = normalize(raw)
+        if record is None:
+            rejected.append({"row": line, "reason": reason})
+        else:
+            records.append((line, record[0].isoformat()) + record[1:])
+    report = {
+        "rows": len(rows), "inserted": 0, "duplicates": 0, "rejected": len(rejected),
+        "payroll_synced": 0, "checking_synced": 0, "checking_duplicates": 0,
+        "rejections": rejected[:REPORTED_REJECTIONS], "sync_error": None,
+    }
+    if not records:
+        return report
+
+    cur = conn.cursor()
+    try:
+        counts, inserted = _stage_entries(cur, records)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    report["inserted"] = counts.get("new", 0)
+    report["duplicates"] = counts.get("duplicate", 0)
+    if not report["inserted"]:
+        return report
+
+    r_cur = r_conn.cursor()
+    try:
+        payroll, checking, checking_dupes = _sync_ledger(r_cur, inserted)
+        r_conn.commit()
+        report.update(payroll_synced=payroll, checking_synced=checking, checking_duplicates=checking_dupes)
+    except Exception as e:
+        r_conn.rollback()
+        print(f"Import ledger sync failed: {e}")
+        report["sync_error"] = str(e).strip()
+    finally:
+        r_cur.close()
+    return report
+
+
+def summary(report):
+    """One line for the page after an import."""
+    text = (f"Imported {report['inserted']} of {report['rows']} rows: "
+            f"{report['duplicates']} duplicates, {report['rejected']} rejected.")
+    if report["sync_error"]:
+        text += " The reporting ledger could not be updated."
+    return text
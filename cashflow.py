@@ -0,0 +1,126 @@
+"""Unified transaction list (the detailed cashflow) shared by the API endpoints.
+
+All four ledger tables are read as one stream of
+(date, description, category, amount) rows, with transfers and card
+payments left out. Each row also carries a stable sort key
+(date, src, row_id) so callers can page through it with a keyset cursor or
+stream it from a server-side cursor without loading the range into memory.
+"""
+import base64
+import binascii
+from datetime import date
+
+from sqlalchemy import text
+
+from json_response import to_columns
+
+# src numbers one table each, so (date, src, row_id) is unique and totally ordered.
+# row_id is each table's id key (migration 1); the (date, id) indexes serve this order.
+CASHFLOW_SOURCE_SQL = """
+    SELECT date, description, category, amount, 1 AS src, id AS row_id FROM checking_account_main
+    UNION ALL
+    SELECT date, description, category, amount, 2 AS src, id AS row_id FROM checking_account_secondary
+    UNION ALL
+    SELECT date, vendor AS description, category, amount, 3 AS src, id AS row_id FROM credit_card_account
+    UNION ALL
+    SELECT pay_date AS date, employee_name AS description, 'PAYROLL/LABOR' AS category,
+           -total_business_cost AS amount, 4 AS src, id AS row_id FROM payroll_history
+"""
+
+EXCLUDED_CATEGORIES_SQL = "TRIM(UPPER(category)) NOT IN ('TRANSFER', 'PAYMENT', 'CREDIT CARD PAYMENT')"
+
+# Rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+
+def cashflow_query(descending=True, after=None, limit=None):
+    """Build the unified cashflow SELECT.
+
+    `after` is a decoded cursor: only rows strictly past it (in the chosen
+    direction) are returned. `limit` caps the page size.
+    """
+    direction = "DESC" if descending else "ASC"
+    keyset = ""
+    if after is not None:
+        op = "<" if descending else ">"
+        keyset = f"AND (date, src, row_id) {op} (:after_date, :after_src, :after_row)"
+    sql = f"""
+        SELECT TO_CHAR(date, 'YYYY-MM-DD') AS date, description, category, amount,
+               src, row_id AS row_key
+        FROM ({CASHFLOW_SOURCE_SQL}) sub_raw
+        WHERE CAST(date AS DATE) BETWEEN :start AND :end
+          AND {EXCLUDED_CATEGORIES_SQL}
+          {keyset}
+        ORDER BY sub_raw.date {direction}, sub_raw.src {direction}, sub_raw.row_id {direction}
+    """
+    if limit is not None:
+        sql += " LIMIT :limit"
+    return text(sql)
+
+
+def query_params(start_date, end_date, after=None, limit=None):
+    params = {"start": start_date, "end": end_date}
+    if after is not None:
+        params.update(after)
+    if limit is not None:
+        params["limit"] = limit
+    return params
+
+
+def encode_cursor(row):
+    raw = f"{row['date']}|{row['src']}|{row['row_key']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Turn an opaque page cursor back into query parameters (ValueError if invalid)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        day, src, row_id = raw.split("|", 2)
+        return {"after_date": date.fromisoformat(day), "after_src": int(src), "after_row": int(row_id)}
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def public_row(row):
+    """The JSON shape the frontend has always received for one transaction."""
+    amount = row["amount"]
+    return {
+        "date": row["date"],
+        "description": row["description"],
+        "category": row["category"],
+        "amount": float(amount) if amount is not None else None,
+    }
+
+
+# Fields of public_row, in the order cashflow_query selects them
+PUBLIC_FIELDS = ("date", "description", "category", "amount")
+
+
+def fetch_columns(conn, start_date, end_date):
+    """The whole range newest first, as parallel arrays (see json_response.to_columns)."""
+    result = conn.execute(cashflow_query(), query_params(start_date, end_date))
+    columns = to_columns(result, PUBLIC_FIELDS)
+    columns["amount"] = [float(a) if a is not None else None for a in columns["amount"]]
+    return columns
+
+
+def fetch_page(conn, start_date, end_date, limit, cursor=None, descending=True):
+    """One keyset page: (rows, next_cursor). next_cursor is None on the last page."""
+    after = decode_cursor(cursor) if cursor else None
+    # Ask for one extra row to know whether another page exists
+    rows = conn.execute(
+        cashflow_query(descending, after, limit + 1),
+        query_params(start_date, end_date, after, limit + 1),
+    ).mappings().all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [public_row(r) for r in rows[:limit]], next_cursor
+
+
+def iter_batches(conn, start_date, end_date, descending=True, batch_size=STREAM_BATCH_SIZE):
+    """Yield lists of rows from a server-side cursor, `batch_size` at a time."""
+    result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(
+        cashflow_query(descending), query_params(start_date, end_date)
+    )
+    for batch in result.mappings().partitions(batch_size):
+        yield batch
@@ -0,0 +1,119 @@
+"""gzip / brotli response compression, negotiated from Accept-Encoding.
+
+Pure ASGI middleware, so streamed responses (NDJSON, exports) are
+compressed chunk by chunk as they are produced rather than buffered.
+brotli is used when the `brotli` package is installed and the client
+accepts it, gzip otherwise. Small bodies, non-text types (PDFs) and
+responses that already carry a Content-Encoding are passed through.
+"""
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Bodies smaller than this are not worth the compression overhead
+MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+# 4-5 is the usual sweet spot for on-the-fly brotli
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def negotiate(accept_encoding):
+    """Pick "br", "gzip" or None from an Accept-Encoding header (q=0 means refused)."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name.strip().lower()] = q
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits 16 + MAX_WBITS: gzip container
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data):
+        """Compress and flush, so everything sent so far can be decoded by the client."""
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def last(self, data):
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.finish()
+        return self._obj.compress(data) + self._obj.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first body chunk decides what to do
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if state["compressor"] is None:
+                headers = MutableHeaders(scope=state["start"])
+                content_type = headers.get("content-type", "")
+                small = not more and len(body) < self.minimum_size
+                if (small or "content-encoding" in headers
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                    state["passthrough"] = True
+                    await send(state["start"])
+                    return await send(message)
+                state["compressor"] = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more:
+                    # Whole body in one message: compress it and send a real length
+                    body = state["compressor"].last(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(state["start"])
+                    return await send({"type": "http.response.body", "body": body, "more_body": False})
+                if "content-length" in headers:
+                    del headers["content-length"]
+                await send(state["start"])
+
+            compressor = state["compressor"]
+            # Streamed: flush per chunk so rows reach the client as they are produced
+            body = compressor.chunk(body) if more else compressor.last(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
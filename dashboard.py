@@ -0,0 +1,131 @@
+"""One round trip for a whole dashboard view (/api/dashboard).
+
+A view shows the financial summary, the income trend, the detailed
+cashflow and the closing checking balance for one or more date ranges.
+Every section is built on a single connection inside one REPEATABLE READ,
+read-only transaction, so all the numbers come from the same snapshot.
+Scans are shared between ranges:
+
+* the daily rollup is read once for the span of all ranges; the summary
+  and income trend for each range are cut from those per-day rows (the
+  trend then bucketed to weeks or months like /api/income-progress);
+* overlapping ranges are merged before reading transactions, and each
+  merged span is read once and sliced per range.
+"""
+from datetime import date, datetime
+
+import cashflow
+import timeseries
+from ledger_balance import balance_as_of
+from kpi_engine import DAILY_KPI_QUERY, kpis_from_rows
+
+SECTIONS = ("summary", "income_progress", "detailed_cashflow", "balance")
+
+
+def parse_range(spec):
+    """"start,end" or "start,end,limit" -> (start, end, limit). ValueError if malformed."""
+    parts = [p.strip() for p in spec.split(",")]
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid range '{spec}': use start,end or start,end,limit")
+    start = datetime.strptime(parts[0], "%Y-%m-%d").date()
+    end = datetime.strptime(parts[1], "%Y-%m-%d").date()
+    limit = int(parts[2]) if len(parts) == 3 else None
+    if end < start or (limit is not None and limit < 1):
+        raise ValueError(f"Invalid range '{spec}'")
+    return start, end, limit
+
+
+def financial_summary(kpis):
+    """The /api/financial-summary payload."""
+    return {
+        "summary": {
+            "total_revenue": kpis["revenue"],
+            "total_expense": kpis["total_expense"],
+            "net_profit": kpis["net_profit"],
+            "exact_labor_cost": kpis["payroll"]
+        },
+        "breakdown": kpis["breakdown"],
+        "categories": kpis["categories"]
+    }
+
+
+def _income_progress(rows, start, end, granularity="day"):
+    """The /api/income-progress payload from per-day rollup rows."""
+    daily = {}
+    for r in rows:
+        if r["src"] == "checking_main" and r["has_sales"]:
+            daily[r["day"]] = daily.get(r["day"], 0.0) + float(r["sales"] or 0)
+    if granularity == "auto":
+        granularity = timeseries.choose_granularity(start, end)
+    if granularity == "day":
+        return [{"date": d.strftime("%Y-%m-%d"), "revenue": v} for d, v in sorted(daily.items())]
+    return [{"date": d, "revenue": v} for d, v in timeseries.bucket(sorted(daily.items()), start, granularity)]
+
+
+def _merge_spans(ranges):
+    """Group overlapping / adjacent (start, end, limit) ranges into spans: [(start, end, [range indexes])]."""
+    order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+    spans = []
+    for i in order:
+        start, end, _ = ranges[i]
+        if spans and date.fromordinal(start.toordinal() - 1) <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], end)
+            spans[-1][2].append(i)
+        else:
+            spans.append([start, end, [i]])
+    return spans
+
+
+def _cashflow_sections(conn, ranges):
+    """Newest-first transaction lists for each range, reading each merged span once."""
+    out = [None] * len(ranges)
+    for span_start, span_end, members in _merge_spans(ranges):
+        if len(members) == 1 and ranges[members[0]][2] is not None:
+            # A lone capped range only needs its first page
+            start, end, limit = ranges[members[0]]
+            rows = conn.execute(
+                cashflow.cashflow_query(limit=limit), cashflow.query_params(start, end, limit=limit)
+            ).mappings().all()
+            out[members[0]] = [cashflow.public_row(r) for r in rows]
+            continue
+        rows = conn.execute(
+            cashflow.cashflow_query(), cashflow.query_params(span_start, span_end)
+        ).mappings().all()
+        rows = [cashflow.public_row(r) for r in rows]
+        for i in members:
+            start, end, limit = ranges[i]
+            lo, hi = start.isoformat(), end.isoformat()
+            picked = [r for r in rows if lo <= r["date"] <= hi]
+            out[i] = picked[:limit] if limit is not None else picked
+    return out
+
+
+def build_dashboard(engine, ranges, sections=SECTIONS, granularity="day"):
+    """Sections for every (start, end, limit) range, from one snapshot on one connection."""
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+        with conn.begin():
+            daily = []
+            if "summary" in sections or "income_progress" in sections:
+                daily = conn.execute(DAILY_KPI_QUERY, {
+                    "start": min(r[0] for r in ranges),
+                    "end": max(r[1] for r in ranges),
+                }).mappings().all()
+            details = _cashflow_sections(conn, ranges) if "detailed_cashflow" in sections else None
+            balances = [balance_as_of(conn, r[1])[1] for r in ranges] if "balance" in sections else None
+
+    views = []
+    for i, (start, end, limit) in enumerate(ranges):
+        rows = [r for r in daily if start <= r["day"] <= end]
+        view = {"start_date": start.isoformat(), "end_date": end.isoformat()}
+        if "summary" in sections:
+            view.update(financial_summary(kpis_from_rows(rows)))
+        if "income_progress" in sections:
+            view["income_progress"] = _income_progress(rows, start, end, granularity)
+        if details is not None:
+            view["detailed_cashflow"] = details[i]
+        if balances is not None:
+            # Checking balance at the end of the range
+            view["closing_balance"] = float(balances[i]) if balances[i] is not None else None
+        views.append(view)
+    return {"ranges": views}
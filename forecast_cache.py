@@ -0,0 +1,122 @@
+"""Fitted forecast state for /api/predict-finances, cached per ledger version.
+
+The expensive part of a forecast (monthly revenue / expense history and
+category weights) only changes when the ledger does. It is
+computed once and stamped with the ledger version; after a write, only the
+months containing the changed days are reloaded. Requests for other
+target dates reuse it and only run the projection step.
+"""
+import threading
+
+import pandas as pd
+from sqlalchemy import text
+
+from ledger_version import get_ledger_version, changed_days_since
+
+_lock = threading.Lock()
+# version -> ledger version the state reflects; months -> {m_start: {"rev", "exp", "cats"}}
+_state = {"version": None, "months": {}, "derived": None}
+
+
+# One row per (month, category) straight from the database: card spend and
+# net payroll always count as expense, checking rows by their sign.
+MONTHLY_SQL = """
+    SELECT m_start, cat,
+           SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) AS rev,
+           SUM(CASE WHEN amount < 0 THEN -amount ELSE 0 END) AS exp
+    FROM (
+        SELECT CAST(date_trunc('month', date) AS DATE) AS m_start, 'Operating Expenses' AS cat, amount
+        FROM checking_account_main WHERE date IS NOT NULL {range_date}
+        UNION ALL
+        SELECT CAST(date_trunc('month', date) AS DATE), 'Credit Card Payments', -ABS(amount)
+        FROM credit_card_account WHERE date IS NOT NULL {range_date}
+        UNION ALL
+        SELECT CAST(date_trunc('month', pay_date) AS DATE), 'Payroll/Labor', -ABS(net_pay)
+        FROM payroll_history WHERE pay_date IS NOT NULL {range_pay_date}
+    ) ledger
+    GROUP BY m_start, cat
+"""
+
+
+def _load_months(conn, lo=None, hi=None):
+    """Monthly revenue, expense and per-category spend for [lo, hi) (all history if None)."""
+    params = {}
+    ranges = {"range_date": "", "range_pay_date": ""}
+    if lo is not None:
+        params = {"lo": lo, "hi": hi}
+        ranges = {
+            "range_date": "AND date >= :lo AND date < :hi",
+            "range_pay_date": "AND pay_date >= :lo AND pay_date < :hi",
+        }
+    rows = conn.execute(text(MONTHLY_SQL.format(**ranges)), params).mappings().all()
+
+    months = {}
+    for r in rows:
+        m_start = pd.Timestamp(r["m_start"])
+        month = months.setdefault(m_start, {"rev": 0.0, "exp": 0.0, "cats": {}})
+        rev, spent = float(r["rev"] or 0), float(r["exp"] or 0)
+        month["rev"] += rev
+        month["exp"] += spent
+        if spent:
+            month["cats"][r["cat"]] = spent
+    return months
+
+
+def _derive(months):
+    """Monthly frame and category weights from the per-month aggregates."""
+    monthly = pd.DataFrame(
+        [{"m_start": m, "rev": v["rev"], "exp": v["exp"]} for m, v in months.items()],
+        columns=["m_start", "rev", "exp"],
+    ).sort_values('m_start').reset_index(drop=True)
+
+    # Calculate historical distribution weights
+    cat_totals = {}
+    for v in months.values():
+        for cat, spent in v["cats"].items():
+            cat_totals[cat] = cat_totals.get(cat, 0.0) + spent
+    total_history_spent = sum(cat_totals.values())
+    cat_weights = {cat: spent / (total_history_spent + 1e-9) for cat, spent in cat_totals.items()}
+
+    # Month x category spend (0 where a category had none that month)
+    cat_monthly = pd.DataFrame(
+        {m: v["cats"] for m, v in months.items()}
+    ).T.reindex(monthly['m_start']).fillna(0.0)
+
+    return {
+        "monthly": monthly,
+        "cat_monthly": cat_monthly,
+        "cat_weights": cat_weights,
+    }
+
+
+def _month_start(day):
+    return pd.Timestamp(day.year, day.month, 1)
+
+
+def get_forecast_state(engine):
+    """Current forecast state, refreshing only what changed since it was built.
+
+    Returns a dict with `version`, `monthly` (DataFrame of m_start/rev/exp),
+    `cat_monthly` (m_start x category spend) and `cat_weights`.
+    """
+    with _lock, engine.connect() as conn:
+        if _state["version"] is None:
+            # Read the version first: a write landing during the load is picked up next time
+            version = get_ledger_version(conn)
+            _state["months"] = _load_months(conn)
+        else:
+            version, days = changed_days_since(conn, _state["version"])
+            if days is None:
+                _state["months"] = _load_months(conn)
+            elif days:
+                months = sorted({_month_start(d) for d in days})
+                lo, hi = months[0], months[-1] + pd.DateOffset(months=1)
+                fresh = _load_months(conn, lo.date(), hi.date())
+                # Every month in [lo, hi) is replaced, including ones that are now empty
+                for m in [m for m in _state["months"] if lo <= m < hi]:
+                    del _state["months"][m]
+                _state["months"].update(fresh)
+        if _state["derived"] is None or version != _state["version"]:
+            _state["derived"] = _derive(_state["months"])
+        _state["version"] = version
+        return {"version": version, **_state["derived"]}
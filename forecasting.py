@@ -0,0 +1,163 @@
+"""Statistical forecasts for /api/predict-finances.
+
+Revenue, expense and every expense category are fitted together as one
+batch of monthly series. The fitted state (final level, trend, damping
+and seasonal terms per series) is cached per (ledger version, model), so
+each request only runs `project`. That is a single numpy expression that
+produces any horizon for all series at once.
+
+Models:
+    ets     damped additive-trend exponential smoothing (Holt), with additive
+            yearly seasonality once there are two full years of history
+    growth  the original rule: history averages compounded at 1% (revenue)
+            and 0.5% (expense) a month
+"""
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+MODELS = ("ets", "growth")
+SEASONAL_PERIODS = 12
+# Below this many months a trend cannot be estimated; ets falls back to growth
+MIN_ETS_MONTHS = 4
+
+_lock = threading.Lock()
+# model -> (ledger version, fitted state)
+_fits = {}
+
+
+def history(state, fill_gaps=True):
+    """(month index, series names, S x n matrix), optionally on a gap-free monthly index."""
+    monthly = state["monthly"].set_index('m_start')
+    cats = state["cat_monthly"]
+    if monthly.empty:
+        return pd.DatetimeIndex([]), ["revenue", "expense"] + list(cats.columns), np.zeros((2 + len(cats.columns), 0))
+    index = monthly.index
+    if fill_gaps:
+        index = pd.date_range(monthly.index.min(), monthly.index.max(), freq='MS')
+    monthly = monthly.reindex(index, fill_value=0.0)
+    cats = cats.reindex(index, fill_value=0.0)
+    names = ["revenue", "expense"] + list(cats.columns)
+    matrix = np.vstack([monthly['rev'].values, monthly['exp'].values] + [cats[c].values for c in cats.columns])
+    return index, names, matrix.astype(float)
+
+
+def _fit_ets_series(y):
+    """Final (level, trend, damping, last season) of one fitted series."""
+    n = len(y)
+    season = np.zeros(SEASONAL_PERIODS)
+    if n < 2 or np.allclose(y, y[0]):
+        return y[-1] if n else 0.0, 0.0, 1.0, season
+    seasonal = "add" if n >= 2 * SEASONAL_PERIODS else None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            res = ExponentialSmoothing(
+                y,
+                trend="add",
+                damped_trend=True,
+                seasonal=seasonal,
+                seasonal_periods=SEASONAL_PERIODS if seasonal else None,
+                initialization_method="estimated",
+            ).fit()
+    except Exception as e:
+        print(f"ETS fit failed, using the series mean: {e}")
+        return float(np.mean(y)), 0.0, 1.0, season
+    if seasonal:
+        season = np.asarray(res.season)[-SEASONAL_PERIODS:]
+    return (
+        float(np.asarray(res.level)[-1]),
+        float(np.asarray(res.trend)[-1]),
+        float(res.params.get("damping_trend") or 1.0),
+        season,
+    )
+
+
+def fit(state, model):
+    """Fit `model` to every series in the forecast state."""
+    index, names, Y = history(state, fill_gaps=(model == "ets"))
+    fitted = {"model": model, "names": names, "last_month": index[-1] if len(index) else None}
+    if model == "ets" and Y.shape[1] >= MIN_ETS_MONTHS:
+        params = [_fit_ets_series(y) for y in Y]
+        fitted["level"] = np.array([p[0] for p in params])
+        fitted["trend"] = np.array([p[1] for p in params])
+        fitted["phi"] = np.array([p[2] for p in params])
+        fitted["season"] = np.vstack([p[3] for p in params])
+    else:
+        fitted["model"] = "growth"
+        # Averages over the months that have data, as the original forecast did
+        _, _, Y = history(state, fill_gaps=False)
+        fitted["avg"] = Y.mean(axis=1) if Y.size else np.zeros(len(names))
+    return fitted
+
+
+def get_fit(state, model):
+    """Cached fit for the state's ledger version (refit only after the ledger changes)."""
+    with _lock:
+        cached = _fits.get(model)
+        if cached and cached[0] == state["version"]:
+            return cached[1]
+        fitted = fit(state, model)
+        _fits[model] = (state["version"], fitted)
+        return fitted
+
+
+def project(fitted, first_step, horizon):
+    """S x horizon forecast for steps first_step .. first_step + horizon - 1.
+
+    Steps count months after the last history month.
+    """
+    if fitted["model"] == "growth":
+        # Growth factors applied to averages, counted from the first forecast month
+        i = np.arange(1, horizon + 1)
+        avg = fitted["avg"][:, None]
+        out = np.repeat(avg, horizon, axis=1)
+        out[0] = avg[0] * 1.01 ** i
+        out[1:] = np.maximum(avg[1:] * 1.005 ** i, avg[1:] * 0.95)
+        return out
+    steps = np.arange(first_step, first_step + horizon)
+    powers = fitted["phi"][:, None] ** np.arange(1, steps[-1] + 1)[None, :]
+    damped = np.cumsum(powers, axis=1)[:, steps - 1]
+    seasonal = fitted["season"][:, (steps - 1) % SEASONAL_PERIODS]
+    return np.maximum(fitted["level"][:, None] + fitted["trend"][:, None] * damped + seasonal, 0.0)
+
+
+def forecast_matrix(fitted, start_month, horizon):
+    """S x horizon forecast for the months starting at `start_month`."""
+    first_step = 1
+    if fitted["last_month"] is not None:
+        last = fitted["last_month"]
+        first_step = max(1, (start_month.year - last.year) * 12 + start_month.month - last.month)
+    return project(fitted, first_step, horizon)
+
+
+def forecast(state, model, start_month, horizon):
+    """Monthly forecast rows starting at `start_month` (a Timestamp month start)."""
+    fitted = get_fit(state, model)
+    names = fitted["names"]
+    F = forecast_matrix(fitted, start_month, horizon)
+
+    rows = []
+    for i in range(horizon):
+        p_rev, p_exp = float(F[0, i]), float(F[1, i])
+        # Split projected expense into categories in proportion to their own forecasts
+        cat_values = F[2:, i]
+        if cat_values.sum() <= 0:
+            weights = np.array([state["cat_weights"].get(n, 0.0) for n in names[2:]])
+        else:
+            weights = cat_values / cat_values.sum()
+        cat_list = [{"name": n, "value": round(p_exp * w, 2)} for n, w in zip(names[2:], weights)]
+        # Sort categories HIGHEST to LOWEST
+        cat_list = sorted(cat_list, key=lambda x: x['value'], reverse=True)
+        m_dt = start_month + pd.DateOffset(months=i)
+        rows.append({
+            "month": m_dt.strftime("%B %Y"),
+            "revenue": round(p_rev, 2),
+            "expense": round(p_exp, 2),
+            "profit": round(p_rev - p_exp, 2),
+            "categories": cat_list
+        })
+    return fitted["model"], rows
@@ -0,0 +1,436 @@
+"""Synthetic data generator: scale the coffee-shop dataset to production volume.
+
+The seeded rows (coffeeshop_db.sql) are used as templates. For each ledger
+table, the (category, type, description) mix and each combination's amount
+mean / spread are measured. Revenue also gets a weekday profile, and payroll
+gets pay by role with deduction ratios and pay interval. New rows are drawn
+from those distributions, a day range at a time, and bulk-loaded with COPY:
+
+    checking_account_main       ~transactions-per-day rows a day, running balance
+    credit_card_account         same mix ratio to checking as the seed, running balance
+    payroll_history             every employee on every pay date (employees added to employee_profiles)
+    checking_account_secondary  transfer in + payroll funding per pay date
+    entries (cafe DB)           the staff-entered sales / expense rows of checking_account_main
+    budgets, overall_budgets    per month, sized from the generated actuals (months
+                                that already have budgets are kept unless --replace)
+
+The daily rollup is rebuilt and the ledger bounds reconciled at the end.
+
+    python generate_data.py --years 5 --transactions-per-day 400 --employees 25
+    python generate_data.py --replace --years 3     # drop existing rows first
+"""
+import argparse
+import io
+import re
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from db import CAFE_DATABASE_URL, REPORTING_DATABASE_URL
+from ledger_bounds import reconcile_bounds
+from ledger_rollup import rebuild_rollup
+from ledger_balance import rebuild_balances
+from ledger_version import bump_entry_version, ensure_entry_changes
+from migrations import migrate
+
+LEDGER_TABLES = ("checking_account_main", "checking_account_secondary", "credit_card_account", "payroll_history")
+# Categories the Flask entry form records (and syncs into checking_account_main)
+ENTRY_CATEGORIES = ("Sales Revenue", "COGS", "Operating Expense")
+# Budget categories as budget.js names them -> ledger category
+BUDGET_CATEGORIES = {"COGS": "COGS", "Operating expense": "Operating Expense"}
+CHUNK_DAYS = 90
+OPENING_BALANCE = 15000.0
+# Weekday profiles are only taken from categories with at least this many seeded rows
+MIN_PROFILE_ROWS = 50
+PAYROLL_COLUMNS = (
+    "employee_id", "employee_name", "role", "pay_date", "gross_pay", "federal_tax", "provincial_tax",
+    "cpp", "ei", "other_deductions", "net_pay", "employer_cpp", "employer_ei", "tips",
+    "travel_reimbursement", "total_business_cost",
+)
+# Per-role ratios to gross pay measured from the seed
+PAYROLL_RATIOS = (
+    "federal_tax", "provincial_tax", "cpp", "ei", "other_deductions",
+    "employer_cpp", "employer_ei", "tips", "travel_reimbursement",
+)
+
+
+# --- TEMPLATES (measured from the rows already in the database) ---
+
+def ledger_templates(cur, table, description_col="description"):
+    """(category, type, description) mix with amount statistics, plus a weekday profile per category."""
+    cur.execute(
+        f"""
+        SELECT category, type, {description_col}, COUNT(*), AVG(amount),
+               COALESCE(STDDEV_SAMP(amount), AVG(amount) * 0.25), MIN(amount), MAX(amount)
+        FROM {table}
+        WHERE category IS NOT NULL AND type IS NOT NULL AND amount IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        """
+    )
+    templates = pd.DataFrame(
+        cur.fetchall(), columns=["category", "type", "description", "count", "mean", "std", "min", "max"]
+    )
+    for col in ("mean", "std", "min", "max"):
+        templates[col] = templates[col].astype(float)
+    templates["weight"] = templates["count"] / templates["count"].sum()
+
+    cur.execute(
+        f"""
+        SELECT category, EXTRACT(ISODOW FROM date)::int, AVG(amount) / AVG(AVG(amount)) OVER (PARTITION BY category)
+        FROM {table}
+        WHERE category IN (SELECT category FROM {table} GROUP BY category HAVING COUNT(*) >= %s)
+        GROUP BY 1, 2
+        """,
+        (MIN_PROFILE_ROWS,),
+    )
+    weekday = {(cat, dow): float(f) for cat, dow, f in cur.fetchall()}
+    cur.execute(f"SELECT COUNT(*), MIN(transaction_id) FROM {table}")
+    count, sample_id = cur.fetchone()
+    prefix = re.match(r"[A-Za-z]*", sample_id or "").group(0) or "TX"
+    return {"templates": templates, "weekday": weekday, "seed_rows": count, "prefix": prefix}
+
+
+def payroll_templates(cur):
+    """Pay by role, per-role deduction ratios, seeded names and the pay interval."""
+    ratios = ", ".join(f"AVG(COALESCE({col}, 0) / gross_pay)" for col in PAYROLL_RATIOS)
+    cur.execute(
+        f"""
+        SELECT role, COUNT(DISTINCT employee_id), AVG(gross_pay),
+               COALESCE(STDDEV_SAMP(gross_pay), AVG(gross_pay) * 0.05), {ratios}
+        FROM payroll_history
+        WHERE gross_pay > 0 AND role IS NOT NULL
+        GROUP BY role
+        ORDER BY role
+        """
+    )
+    roles = pd.DataFrame(cur.fetchall(), columns=["role", "employees", "mean", "std", *PAYROLL_RATIOS])
+    for col in roles.columns[2:]:
+        roles[col] = roles[col].astype(float)
+    roles["weight"] = roles["employees"] / roles["employees"].sum()
+
+    cur.execute("SELECT DISTINCT employee_name FROM payroll_history WHERE gross_pay > 0 ORDER BY 1")
+    names = [r[0] for r in cur.fetchall() if r[0]]
+    cur.execute("SELECT DISTINCT pay_date FROM payroll_history WHERE gross_pay > 0 ORDER BY 1")
+    pay_dates = [r[0] for r in cur.fetchall()]
+    gaps = np.diff([d.toordinal() for d in pay_dates])
+    interval = int(np.median(gaps)) if len(gaps) else 14
+    anchor = pay_dates[0] if pay_dates else date(2022, 1, 7)
+    # payroll_history.employee_id references employee_profiles
+    cur.execute("SELECT role, AVG(hourly_rate) FROM employee_profiles GROUP BY role")
+    rates = {role: float(rate) for role, rate in cur.fetchall() if rate is not None}
+    cur.execute("SELECT GREATEST((SELECT MAX(id) FROM employee_profiles), (SELECT MAX(employee_id) FROM payroll_history), 0)")
+    return {"roles": roles, "names": names, "interval": interval, "anchor": anchor,
+            "rates": rates, "max_id": cur.fetchone()[0]}
+
+
+def _employees(rng, payroll, count):
+    roles = payroll["roles"]
+    firsts = sorted({n.split()[0] for n in payroll["names"]}) or ["Alex"]
+    lasts = sorted({n.split()[-1] for n in payroll["names"]}) or ["Smith"]
+    picked = rng.choice(len(roles), size=count, p=roles["weight"].to_numpy())
+    employees = []
+    for i, r in enumerate(picked):
+        name = f"{firsts[i % len(firsts)]} {lasts[(i // len(firsts)) % len(lasts)]}"
+        if i >= len(firsts) * len(lasts):
+            name += f" {i // (len(firsts) * len(lasts)) + 1}"
+        row = roles.iloc[r]
+        employees.append({"employee_id": payroll["max_id"] + i + 1, "employee_name": name, "row": row,
+                          "hourly_rate": round(payroll["rates"].get(row["role"], row["mean"] / 80), 2)})
+    return employees
+
+
+# --- ROW GENERATION ---
+
+def _growth(days, growth):
+    return (1 + growth) ** (days / 365.25)
+
+
+def _ledger_chunk(rng, spec, dates, rate, start, growth, state, debit_sign):
+    """One chunk of ledger rows; `state` carries the running balance and the id counter."""
+    t = spec["templates"]
+    counts = rng.poisson(rate * t["weight"].to_numpy(), size=(len(dates), len(t)))
+    flat = np.repeat(np.arange(counts.size), counts.ravel())
+    day, k = flat // len(t), flat % len(t)
+    rows = t.iloc[k].reset_index(drop=True)
+
+    mean, std, low, high = (rows[c].to_numpy() for c in ("mean", "std", "min", "max"))
+    amount = rng.normal(mean, std).clip(low * 0.5, high * 1.5)
+    offsets = np.array([(d - start).days for d in dates])[day]
+    amount *= _growth(offsets, growth)
+    dows = np.array([d.isoweekday() for d in dates])[day]
+    amount *= np.array([spec["weekday"].get((c, w), 1.0) for c, w in zip(rows["category"], dows)])
+    amount = np.round(amount, 2)
+
+    signed = np.where(rows["type"].str.lower() == "debit", debit_sign, -debit_sign) * amount
+    balance = np.round(state["balance"] + np.cumsum(signed), 2)
+    if len(balance):
+        state["balance"] = float(balance[-1])
+    ids = state["next_id"] + np.arange(len(rows))
+    state["next_id"] += len(rows)
+    return pd.DataFrame({
+        "date": np.array(dates, dtype=object)[day],
+        "transaction_id": [f"{spec['prefix']}{n:08d}" for n in ids],
+        "description": rows["description"],
+        "category": rows["category"],
+        "type": rows["type"],
+        "amount": amount,
+        "balance": balance,
+    })
+
+
+def _payroll_chunk(rng, employees, pay_dates, start, growth):
+    rows = []
+    for pay_date in pay_dates:
+        factor = _growth((pay_date - start).days, growth)
+        for emp in employees:
+            r = emp["row"]
+            gross = round(max(rng.normal(r["mean"], r["std"]), r["mean"] * 0.5) * factor, 2)
+            parts = {col: round(gross * r[col], 2) for col in PAYROLL_RATIOS}
+            net = round(gross - sum(parts[c] for c in ("federal_tax", "provincial_tax", "cpp", "ei", "other_deductions")), 2)
+            cost = round(gross + parts["employer_cpp"] + parts["employer_ei"] + parts["tips"]
+                         + parts["travel_reimbursement"], 2)
+            rows.append({"employee_id": emp["employee_id"], "employee_name": emp["employee_name"],
+                         "role": r["role"], "pay_date": pay_date, "gross_pay": gross, **parts,
+                         "net_pay": net, "total_business_cost": cost})
+    return pd.DataFrame(rows, columns=PAYROLL_COLUMNS)
+
+
+def _secondary_chunk(spec, payroll_rows, state):
+    """Funding from the main account and the payroll run itself, once per pay date."""
+    t = spec["templates"]
+    transfer = t[t["type"].str.lower() == "credit"].iloc[0]
+    funding = t[t["type"].str.lower() == "debit"].iloc[0]
+    rows = []
+    for pay_date, net in payroll_rows.groupby("pay_date")["net_pay"].sum().items():
+        for tmpl, signed in ((transfer, net), (funding, -net)):
+            state["balance"] = round(state["balance"] + signed, 2)
+            rows.append({"date": pay_date, "transaction_id": f"{spec['prefix']}{state['next_id']:08d}",
+                         "description": tmpl["description"], "category": tmpl["category"],
+                         "type": tmpl["type"], "amount": round(abs(signed), 2), "balance": state["balance"]})
+            state["next_id"] += 1
+    return pd.DataFrame(rows, columns=["date", "transaction_id", "description", "category", "type", "amount", "balance"])
+
+
+def _entries_chunk(rng, main_rows, staff):
+    rows = main_rows[main_rows["category"].isin(ENTRY_CATEGORIES)]
+    return pd.DataFrame({
+        "date": rows["date"],
+        "entry_type": np.where(rows["type"].str.lower() == "credit", "income", "expense"),
+        "category": rows["category"],
+        "description": rows["description"],
+        "details": None,
+        "staff_name": rng.choice(staff, size=len(rows)) if len(rows) else [],
+        "balance": rows["amount"],
+    })
+
+
+def _copy(cur, table, frame, columns=None):
+    if frame.empty:
+        return 0
+    columns = columns or list(frame.columns)
+    buffer = io.StringIO()
+    frame[columns].to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return len(frame)
+
+
+def _budgets(rng, monthly):
+    """Category and subcategory budgets per month around the actuals, plus an overall budget above them."""
+    budgets, overall = [], []
+    for month, group in monthly.groupby("month"):
+        mains = 0.0
+        for budget_cat, ledger_cat in BUDGET_CATEGORIES.items():
+            subs = group[group["category"] == ledger_cat]
+            if subs.empty:
+                continue
+            sub_amounts = np.round(subs["amount"].to_numpy() * rng.uniform(0.85, 1.15, len(subs)), 2)
+            main = round(float(sub_amounts.sum()) * 1.05, 2)
+            mains += main
+            budgets.append((month, budget_cat, None, main))
+            budgets += [(month, budget_cat, d, a) for d, a in zip(subs["description"], sub_amounts)]
+        overall.append((month, round(mains * 1.1, 2), "Generated"))
+    return (pd.DataFrame(budgets, columns=["month", "category", "subcategory", "amount"]),
+            pd.DataFrame(overall, columns=["month", "amount", "description"]))
+
+
+def default_start(cur, days, replace=False):
+    """First day to generate from: after the last ledger row, or the first one with `replace`.
+
+    On an empty ledger the period ends today.
+    """
+    cur.execute("SELECT MIN(date), MAX(date) FROM checking_account_main")
+    first, last = cur.fetchone()
+    if replace and first is not None:
+        return first
+    if not replace and last is not None:
+        return last + timedelta(days=1)
+    return date.today() - timedelta(days=days - 1)
+
+
+def _last_number(cur, table, prefix):
+    """Highest numeric suffix of `table`'s <prefix><digits> transaction ids (0 if none).
+
+    Not the row count: rows deleted by the app would make that hand out ids already in use.
+    """
+    cur.execute(
+        f"""
+        SELECT COALESCE(MAX(CAST(SUBSTRING(transaction_id FROM CHAR_LENGTH(%s) + 1) AS BIGINT)), 0)
+        FROM {table}
+        WHERE transaction_id ~ ('^' || %s || '[0-9]+$')
+        """,
+        (prefix, prefix),
+    )
+    return cur.fetchone()[0]
+
+
+def _last_balance(cur, table):
+    cur.execute(f"SELECT balance FROM {table} WHERE balance IS NOT NULL ORDER BY date DESC, id DESC LIMIT 1")
+    row = cur.fetchone()
+    return float(row[0]) if row else OPENING_BALANCE
+
+
+def generate(conn, cafe_conn, start, days, transactions_per_day, employees, growth=0.05, seed=42,
+             replace=False, chunk_days=CHUNK_DAYS):
+    """Generate and COPY `days` days of data starting at `start`. Returns rows loaded per table."""
+    rng = np.random.default_rng(seed)
+    cur = conn.cursor()
+    cafe_cur = cafe_conn.cursor()
+    specs = {
+        "checking_account_main": ledger_templates(cur, "checking_account_main"),
+        "checking_account_secondary": ledger_templates(cur, "checking_account_secondary"),
+        "credit_card_account": ledger_templates(cur, "credit_card_account", "vendor"),
+    }
+    payroll = payroll_templates(cur)
+    if specs["checking_account_main"]["templates"].empty or payroll["roles"].empty:
+        raise ValueError("no seeded ledger rows to measure templates from; load the seed first (python init_db.py)")
+
+    if replace:
+        cur.execute(f"TRUNCATE {', '.join(LEDGER_TABLES)}")
+        cafe_cur.execute("TRUNCATE entries")
+    states = {}
+    for table, spec in specs.items():
+        states[table] = {"balance": _last_balance(cur, table), "next_id": _last_number(cur, table, spec["prefix"]) + 1}
+    if replace:
+        states["credit_card_account"]["balance"] = 0.0
+
+    staff = _employees(rng, payroll, employees)
+    _copy(cur, "employee_profiles", pd.DataFrame([
+        {"id": e["employee_id"], "name": e["employee_name"], "role": e["row"]["role"],
+         "hourly_rate": e["hourly_rate"], "is_active": True, "is_seasonal": False} for e in staff
+    ]))
+    staff_names = [e["employee_name"] for e in staff if e["row"]["role"] != "Owner"] or ["Staff"]
+    # Credit card volume keeps its seeded ratio to the main account
+    main_rate = float(transactions_per_day)
+    card_rate = main_rate * specs["credit_card_account"]["seed_rows"] / max(specs["checking_account_main"]["seed_rows"], 1)
+
+    end = start + timedelta(days=days - 1)
+    first_pay = payroll["anchor"] + timedelta(
+        days=-(-(start - payroll["anchor"]).days // payroll["interval"]) * payroll["interval"]
+    )
+    loaded = {t: 0 for t in LEDGER_TABLES + ("entries",)}
+    monthly = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        dates = [chunk_start + timedelta(days=i) for i in range((chunk_end - chunk_start).days + 1)]
+        pay_dates = [d for d in dates if d >= first_pay and (d - first_pay).days % payroll["interval"] == 0]
+
+        main_rows = _ledger_chunk(rng, specs["checking_account_main"], dates, main_rate, start, growth,
+                                  states["checking_account_main"], debit_sign=-1)
+        card_rows = _ledger_chunk(rng, specs["credit_card_account"], dates, card_rate, start, growth,
+                                  states["credit_card_account"], debit_sign=1)
+        payroll_rows = _payroll_chunk(rng, staff, pay_dates, start, growth)
+        secondary_rows = _secondary_chunk(specs["checking_account_secondary"], payroll_rows,
+                                          states["checking_account_secondary"])
+        card_rows = card_rows.rename(columns={"description": "vendor"})
+
+        loaded["checking_account_main"] += _copy(cur, "checking_account_main", main_rows)
+        loaded["credit_card_account"] += _copy(cur, "credit_card_account", card_rows)
+        loaded["payroll_history"] += _copy(cur, "payroll_history", payroll_rows)
+        loaded["checking_account_secondary"] += _copy(cur, "checking_account_secondary", secondary_rows)
+        loaded["entries"] += _copy(cafe_cur, "entries", _entries_chunk(rng, main_rows, staff_names))
+
+        spent = main_rows[main_rows["category"].isin(BUDGET_CATEGORIES.values())]
+        monthly.append(spent.assign(month=[d.strftime("%Y-%m") for d in spent["date"]])
+                       .groupby(["month", "category", "description"], as_index=False)["amount"].sum())
+        print(f"  {chunk_start} .. {chunk_end}: {len(main_rows) + len(card_rows) + len(payroll_rows) + len(secondary_rows)} ledger rows")
+        chunk_start = chunk_end + timedelta(days=1)
+
+    budgets, overall = _budgets(rng, pd.concat(monthly, ignore_index=True))
+    months = tuple(overall["month"])
+    if months and replace:
+        cur.execute("DELETE FROM budgets WHERE month IN %s", (months,))
+        cur.execute("DELETE FROM overall_budgets WHERE month IN %s", (months,))
+    elif months:
+        # Budgets someone already set are kept: only months without any get generated ones
+        cur.execute(
+            "SELECT month FROM budgets WHERE month IN %s UNION SELECT month FROM overall_budgets WHERE month IN %s",
+            (months, months),
+        )
+        budgeted = {row[0] for row in cur.fetchall()}
+        budgets = budgets[~budgets["month"].isin(budgeted)]
+        overall = overall[~overall["month"].isin(budgeted)]
+    loaded["budgets"] = _copy(cur, "budgets", budgets)
+    loaded["overall_budgets"] = _copy(cur, "overall_budgets", overall)
+
+    # Entries changed: the analytics HTTP validators include their version
+    ensure_entry_changes(cafe_cur)
+    bump_entry_version(cafe_cur)
+    cafe_conn.commit()
+    conn.commit()
+    for table in LEDGER_TABLES + ("budgets", "overall_budgets"):
+        cur.execute(f"ANALYZE {table}")
+    cafe_cur.execute("ANALYZE entries")
+    conn.commit()
+    cafe_conn.commit()
+    cur.close()
+    cafe_cur.close()
+    return loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic coffee-shop data at scale (bulk-loaded with COPY).")
+    parser.add_argument("--years", type=float, default=3, help="length of the generated period")
+    parser.add_argument("--transactions-per-day", type=float, default=20,
+                        help="average checking_account_main rows per day (card volume scales with it)")
+    parser.add_argument("--employees", type=int, default=12)
+    parser.add_argument("--start", type=date.fromisoformat, default=None,
+                        help="first generated day (default: the day after the last ledger row, "
+                             "or the first seeded day with --replace; on an empty ledger, so the "
+                             "period ends today)")
+    parser.add_argument("--growth", type=float, default=0.05, help="yearly growth applied to amounts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--replace", action="store_true", help="truncate the ledger tables and entries first")
+    parser.add_argument("--database-url", default=REPORTING_DATABASE_URL)
+    parser.add_argument("--cafe-database-url", default=CAFE_DATABASE_URL)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    cafe_conn = psycopg2.connect(args.cafe_database_url)
+    try:
+        migrate(conn, "reporting")
+        migrate(cafe_conn, "cafe")
+        days = int(round(args.years * 365.25))
+        start = args.start
+        if start is None:
+            cur = conn.cursor()
+            start = default_start(cur, days, args.replace)
+            cur.close()
+        print(f"Generating {days} days from {start}...")
+        try:
+            loaded = generate(conn, cafe_conn, start, days, args.transactions_per_day, args.employees,
+                              args.growth, args.seed, args.replace)
+        except ValueError as e:
+            parser.error(str(e))
+        for table, count in loaded.items():
+            print(f"{table}: {count} rows")
+        print(f"Rebuilt ledger_daily_rollup: {rebuild_rollup(conn)} rows")
+        print(f"Recomputed checking balances: {rebuild_balances(conn)} rows changed")
+        print("Ledger bounds: %s .. %s" % reconcile_bounds(conn))
+    finally:
+        cafe_conn.close()
+        conn.close()
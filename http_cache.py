@@ -0,0 +1,115 @@
+"""Conditional GET (ETag / Last-Modified) for the analytics endpoints.
+
+Every analytics response is a function of the request (path + query), the
+ledger, the budgets, the cafe entries (source=entries|both) and today's
+date. The ETag is a hash of (path, sorted query, ledger version, budget
+version, entry version, today). The ledger version is bumped by the Flask
+app's ledger syncs, the entry version by every write to `entries` (even
+when the sync to the ledger adds nothing or fails), the budget version by
+the budget write endpoints. A request whose If-None-Match matches, or whose
+If-Modified-Since is not older than the last change, gets a 304 after one
+version lookup per database. The endpoint and its SQL never run.
+
+Last-Modified is the latest change rounded up to a whole second, and is
+only sent once that second has passed, so no later write can share it.
+
+Edits made directly in the database (psql, pgAdmin) do not bump any
+version. `python ledger_rollup.py --rebuild` and `python ledger_balance.py
+--rebuild` (also run by generate_data.py) do, which also clears validators
+that browsers are holding.
+"""
+import hashlib
+from datetime import date, datetime, time, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+from ledger_version import get_data_versions
+
+# Responses that change without a ledger/budget/entry write (pool counters, job
+# progress, forecasts whose backtest refreshes in the background, admin views)
+UNCACHED_PREFIXES = ("/api/pool-stats", "/api/reports", "/api/predict-finances", "/api/admin")
+
+
+def _etag(request, versions):
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    seed = "|".join([
+        request.url.path, query,
+        str(versions["ledger"][0]), str(versions["budget"][0]), str(versions["entries"][0]),
+        date.today().isoformat(),
+    ])
+    # Weak: the same data may be sent with a different content encoding
+    return 'W/"%s"' % hashlib.sha1(seed.encode()).hexdigest()[:32]
+
+
+def _last_modified(versions):
+    # Responses also depend on today's date, so nothing is older than local midnight
+    midnight = datetime.combine(date.today(), time.min).astimezone()
+    stamps = [midnight] + [v[1] for v in versions.values() if v[1] is not None]
+    latest = max(stamps).astimezone(timezone.utc)
+    # HTTP dates have whole seconds: round up, so the change is never newer than the date
+    if latest.microsecond:
+        latest += timedelta(seconds=1)
+    return latest.replace(microsecond=0)
+
+
+def _matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return strip(etag) in {strip(t) for t in if_none_match.split(",")}
+
+
+def _not_modified_since(if_modified_since, last_modified):
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return since is not None and since.tzinfo is not None and last_modified <= since
+
+
+class ConditionalGetMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, engine, cafe_engine=None):
+        super().__init__(app)
+        self.engine = engine
+        self.cafe_engine = cafe_engine
+
+    def _versions(self):
+        with self.engine.connect() as conn:
+            if self.cafe_engine is None:
+                return get_data_versions(conn)
+            with self.cafe_engine.connect() as cafe_conn:
+                return get_data_versions(conn, cafe_conn)
+
+    async def dispatch(self, request, call_next):
+        path = request.url.path
+        if request.method != "GET" or not path.startswith("/api/") or path.startswith(UNCACHED_PREFIXES):
+            return await call_next(request)
+        try:
+            versions = await run_in_threadpool(self._versions)
+        except Exception as e:
+            print(f"Cache validator lookup failed: {e}")
+            return await call_next(request)
+
+        etag = _etag(request, versions)
+        last_modified = _last_modified(versions)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        # Until the rounded-up second is over, another write could land in it with the
+        # same Last-Modified; such responses carry only the ETag
+        if last_modified <= datetime.now(timezone.utc):
+            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            fresh = _matches(if_none_match, etag)
+        else:
+            fresh = _not_modified_since(request.headers.get("if-modified-since"), last_modified)
+        if fresh:
+            return Response(status_code=304, headers=headers)
+
+        response = await call_next(request)
+        if response.status_code == 200:
+            response.headers.update(headers)
+        return response
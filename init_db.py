@@ -1,6 +1,10 @@
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 import os
+import argparse
+from ledger_rollup import rebuild_rollup
+from ledger_bounds import reconcile_bounds
+from migrations import migrate
 
 # Configuration
 DB_HOST = "localhost"
@@ -36,7 +40,7 @@ def create_database(cursor, db_name):
     else:
         print(f"Database {db_name} already exists.")
 
-def init_dbs():
+def init_dbs(partition=False):
     password = find_password()
     if password is None:
         print("Please ensure PostgreSQL is running and you know the password for 'postgres' user.")
@@ -74,6 +78,7 @@ def init_dbs():
     """)
     conn.commit()
     cur.close()
+    migrate(conn, "cafe")
     conn.close()
 
     # Initialize coffeeshop_cashflow (from SQL file)
@@ -90,6 +95,11 @@ def init_dbs():
             env=env
         )
         print("Executed coffeeshop_db.sql successfully.")
+        conn = psycopg2.connect(dbname="coffeeshop_cashflow", user=DB_USER, password=password, host=DB_HOST)
+        print(f"Built ledger_daily_rollup: {rebuild_rollup(conn)} rows")
+        migrate(conn, "reporting", optional=partition)
+        print("Ledger bounds: %s .. %s" % reconcile_bounds(conn))
+        conn.close()
     except subprocess.CalledProcessError as e:
         print(f"Error executing SQL file via psql: {e}")
     
@@ -106,4 +116,7 @@ def init_dbs():
         print("You might need to update DATABASE_URL in main.py.")
 
 if __name__ == "__main__":
-    init_dbs()
+    parser = argparse.ArgumentParser(description="Create and load both databases.")
+    parser.add_argument("--partition", action="store_true",
+                        help="partition the large ledger tables by month (see ledger_partitions.py)")
+    init_dbs(parser.parse_args().partition)
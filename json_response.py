@@ -0,0 +1,59 @@
+"""Fast JSON for the large analytics responses.
+
+FastAPI's default path runs every row through `jsonable_encoder` and then
+the stdlib `json` module. Endpoints that return thousands of rows build a
+`FastJSONResponse` instead: orjson when installed (stdlib json otherwise),
+with Decimal and date handled by the encoder itself.
+
+`to_columns` is the compact columnar layout (`?layout=columns`): one array
+per field instead of one object per row, so field names are not repeated.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+LAYOUTS = ("rows", "columns")
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content):
+    """Serialize to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def to_columns(rows, fields):
+    """Columnar layout {"count": n, "<field>": [values...], ...}.
+
+    `rows` are positional (tuples / result rows) whose leading values are `fields`, in order.
+    """
+    columns = {field: [] for field in fields}
+    appends = [columns[field].append for field in fields]
+    count = 0
+    for row in rows:
+        for append, value in zip(appends, row):
+            append(value)
+        count += 1
+    return {"count": count, **columns}
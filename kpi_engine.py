@@ -0,0 +1,126 @@
+"""Dashboard KPIs for a date range, read from the daily ledger rollup.
+
+`compute_kpis` returns revenue, payroll, total expense, net profit, the
+fixed `breakdown` the charts use and `categories` (every expense category
+-> total):
+
+* revenue is Sales Revenue on the main checking account only;
+* payroll is net pay from payroll_history;
+* the breakdown and categories come from checking_main and credit_card
+  rows, leaving out transfers and card payments, with payroll added to the
+  breakdown.
+
+dashboard.py reuses the same columns per day (DAILY_KPI_QUERY) to serve
+several ranges from one scan.
+"""
+from sqlalchemy import text
+
+# Dashboard keys for the categories the frontend charts by name.
+# Upper-cased ledger category -> breakdown key
+BREAKDOWN_KEYS = {
+    "COGS": "cogs",
+    "MARKETING": "marketing",
+    "OPERATING EXPENSE": "operating",
+    "SUPPLIES": "supplies",
+    "UTILITIES": "utilities",
+    "OTHER": "other",
+}
+
+# Labels used by the PDF report for the breakdown keys (report order)
+BREAKDOWN_LABELS = [
+    ("payroll", "Payroll/Labor"),
+    ("cogs", "COGS"),
+    ("marketing", "Marketing"),
+    ("supplies", "Supplies"),
+    ("utilities", "Utilities"),
+    ("operating", "Operating Expense"),
+    ("other", "Other"),
+]
+
+REVENUE_CATEGORY = "SALES REVENUE"
+# Money moving between our own accounts, never an expense
+NON_EXPENSE_CATEGORIES = ("TRANSFER", "PAYMENT", "CREDIT CARD PAYMENT")
+
+# One pass over the daily rollup for the range: everything is grouped by
+# (source, category) and split into revenue / expense buckets in Python.
+# SUM(amount) = credit + debit, SUM(ABS(amount)) = credit - debit.
+KPI_COLUMNS = """
+    source AS src, UPPER(category) AS cat, MIN(category) AS label,
+    SUM(CASE WHEN source = 'payroll' THEN net_pay_total ELSE credit_total + debit_total END) AS total,
+    SUM(CASE WHEN source = 'payroll' THEN net_pay_total ELSE credit_total - debit_total END) AS abs_total
+"""
+KPI_FILTER = """
+    WHERE day BETWEEN :start AND :end
+      AND source IN ('checking_main', 'credit_card', 'payroll')
+      AND category <> ''
+"""
+
+KPI_QUERY = text(f"""
+    SELECT {KPI_COLUMNS}
+    FROM ledger_daily_rollup
+    {KPI_FILTER}
+    GROUP BY source, UPPER(category)
+""")
+
+# The same totals kept per day, so one scan can serve several date ranges
+# (see dashboard.py). `sales` is the income-progress series: exact
+# 'Sales Revenue' rows only, as /api/income-progress selects them.
+DAILY_KPI_QUERY = text(f"""
+    SELECT day, {KPI_COLUMNS},
+           BOOL_OR(category = 'Sales Revenue') AS has_sales,
+           SUM(CASE WHEN category = 'Sales Revenue' THEN credit_total + debit_total ELSE 0 END) AS sales
+    FROM ledger_daily_rollup
+    {KPI_FILTER}
+    GROUP BY day, source, UPPER(category)
+""")
+
+
+def kpis_from_rows(rows):
+    """Dashboard numbers from KPI rows; several rows per (source, category) are summed.
+
+    Returns a dict with `revenue`, `payroll`, `total_expense`, `net_profit`,
+    the fixed `breakdown` the charts use and `categories`: every expense
+    category found in the ledger -> total.
+    """
+    revenue = 0.0
+    payroll = 0.0
+    breakdown = {key: 0.0 for key in BREAKDOWN_KEYS.values()}
+    totals = {}
+    labels = {}
+    for r in rows:
+        src, cat = r["src"], r["cat"]
+        if src == "payroll":
+            payroll += float(r["total"] or 0)
+            continue
+        if cat == REVENUE_CATEGORY:
+            # Sales are only ever deposited into the main checking account
+            if src == "checking_main":
+                revenue += float(r["total"] or 0)
+            continue
+        if cat in NON_EXPENSE_CATEGORIES:
+            continue
+        amount = float(r["abs_total"] or 0)
+        if cat in BREAKDOWN_KEYS:
+            breakdown[BREAKDOWN_KEYS[cat]] += amount
+        # Shown under the same spelling MIN(category) would pick over the range
+        labels[cat] = min(labels.get(cat, r["label"]), r["label"])
+        totals[cat] = totals.get(cat, 0.0) + amount
+
+    breakdown = {"payroll": payroll, **breakdown}
+    # Total Expense is the sum of the charted categories (payroll included)
+    total_expense = sum(breakdown.values())
+    categories = {labels[cat]: amount for cat, amount in totals.items()}
+    return {
+        "revenue": revenue,
+        "payroll": payroll,
+        "total_expense": total_expense,
+        "net_profit": revenue - total_expense,
+        "breakdown": breakdown,
+        "categories": dict(sorted(categories.items(), key=lambda kv: kv[1], reverse=True)),
+    }
+
+
+def compute_kpis(conn, start_date, end_date):
+    """Revenue, payroll and per-category expense totals for a date range (see kpis_from_rows)."""
+    rows = conn.execute(KPI_QUERY, {"start": start_date, "end": end_date}).mappings().all()
+    return kpis_from_rows(rows)
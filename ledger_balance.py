@@ -0,0 +1,238 @@
+"""Running balance of checking_account_main, kept current incrementally.
+
+A row's balance is the opening balance plus every signed amount up to and
+including it, in (date, id) order. Credits add `amount` and Debits
+subtract ABS(amount). Rows with no type (entered by hand, like the seed's
+"June Test" rows) are debits if the amount is negative; otherwise the
+category decides, as the Flask form would have: Sales Revenue is a credit,
+anything else (COGS, expenses) a debit. The opening balance is derived once from the bank
+rows already in the table and stored in `ledger_balance_state`.
+
+After the Flask app inserts or deletes rows dated D or later,
+`recompute_balances` rewrites the balances from D onward. It is anchored
+on the last row before D, whose balance is already right, and works in
+set-based batches of BALANCE_BATCH_DAYS days: one windowed UPDATE per
+batch, each anchored on the batch before it. Rows whose balance is
+already correct are not rewritten. It runs on the caller's cursor, so it
+commits with the write.
+
+`balance_as_of` reads the balance at the end of a day from the last row
+on or before it: one backward probe of the (date, id) index.
+
+CLI:
+    python ledger_balance.py --rebuild        # recompute every balance
+    python ledger_balance.py --check          # count rows whose balance is off
+    python ledger_balance.py --as-of 2022-03-31
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+import psycopg2
+from sqlalchemy import text
+
+from db import REPORTING_DATABASE_URL
+from ledger_version import bump_ledger_version, ensure_ledger_changes
+
+BALANCE_BATCH_DAYS = int(os.getenv("BALANCE_BATCH_DAYS", "92"))
+
+# Arbitrary key for pg_advisory_xact_lock: writers recompute one at a time, each
+# seeing the rows the previous one committed
+BALANCE_LOCK_KEY = 7349023
+
+STATE_DDL = """
+    CREATE TABLE IF NOT EXISTS ledger_balance_state (
+        id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        opening_balance NUMERIC NOT NULL,
+        recomputed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+# Untyped rows: see the module docstring
+SIGNED_AMOUNT = """
+    CASE
+        WHEN type = 'Debit' THEN -ABS(amount)
+        WHEN type IS NULL AND (amount < 0 OR COALESCE(UPPER(TRIM(category)), '') <> 'SALES REVENUE')
+            THEN -ABS(amount)
+        ELSE COALESCE(amount, 0)
+    END
+"""
+
+# Opening balance implied by the first row that carries a real (bank) balance:
+# app-entered rows were written with 0 and are skipped
+OPENING_BALANCE_SQL = f"""
+    SELECT balance - running
+    FROM (
+        SELECT date, id, balance, SUM({SIGNED_AMOUNT}) OVER (ORDER BY date, id) AS running
+        FROM checking_account_main
+        WHERE date IS NOT NULL
+    ) ordered
+    WHERE balance IS NOT NULL AND balance <> 0
+    ORDER BY date, id
+    LIMIT 1
+"""
+
+# Balance just before %(start)s: the last earlier row, else the opening balance
+ANCHOR_SQL = """
+    COALESCE(
+        (SELECT balance FROM checking_account_main
+         WHERE date < %(start)s ORDER BY date DESC, id DESC LIMIT 1),
+        (SELECT opening_balance FROM ledger_balance_state WHERE id = 1),
+        0
+    )
+"""
+
+BATCH_UPDATE_SQL = f"""
+    UPDATE checking_account_main t
+    SET balance = r.running
+    FROM (
+        SELECT id, date, {ANCHOR_SQL} + SUM({SIGNED_AMOUNT}) OVER (ORDER BY date, id) AS running
+        FROM checking_account_main
+        WHERE date >= %(start)s AND date < %(end)s
+    ) r
+    WHERE t.id = r.id AND t.date = r.date AND t.balance IS DISTINCT FROM r.running
+      -- repeated on t so the target side is read off the date index too, not a seq scan
+      AND t.date >= %(start)s AND t.date < %(end)s
+"""
+
+BALANCE_AS_OF_QUERY = text("""
+    SELECT date, balance FROM checking_account_main
+    WHERE date <= :day ORDER BY date DESC, id DESC LIMIT 1
+""")
+
+
+def ensure_balances(conn):
+    """Create the state table; the first time, derive the opening balance and fill every balance."""
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('ledger_balance_state') IS NOT NULL")
+    exists = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    if not exists:
+        rebuild_balances(conn)
+
+
+def _store_opening(cur):
+    cur.execute(STATE_DDL)
+    cur.execute(OPENING_BALANCE_SQL)
+    row = cur.fetchone()
+    opening = row[0] if row else 0
+    cur.execute("""
+        INSERT INTO ledger_balance_state (id, opening_balance, recomputed_at) VALUES (1, %s, now())
+        ON CONFLICT (id) DO UPDATE SET opening_balance = EXCLUDED.opening_balance, recomputed_at = now()
+    """, (opening,))
+    return opening
+
+
+def recompute_balances(cur, days):
+    """Rewrite balances from the earliest of `days` onward, on the caller's cursor.
+
+    Returns the number of rows whose balance changed.
+    """
+    days = sorted({str(d) for d in days if d})
+    if not days:
+        return 0
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (BALANCE_LOCK_KEY,))
+    cur.execute(
+        "SELECT MIN(d), (SELECT MAX(date) FROM checking_account_main) FROM unnest(CAST(%s AS DATE[])) AS d",
+        (days,),
+    )
+    start, last = cur.fetchone()
+    changed = 0
+    while last is not None and start <= last:
+        end = date.fromordinal(start.toordinal() + BALANCE_BATCH_DAYS)
+        cur.execute(BATCH_UPDATE_SQL, {"start": start, "end": end})
+        changed += cur.rowcount
+        start = end
+    return changed
+
+
+def rebuild_balances(conn):
+    """Re-derive the opening balance and recompute every balance, committing per batch. Returns rows changed.
+
+    If any balance changed, a whole-ledger change is recorded so cached
+    responses (ETags, /api/balance) are refreshed.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (BALANCE_LOCK_KEY,))
+    _store_opening(cur)
+    cur.execute("SELECT MIN(date), MAX(date) FROM checking_account_main")
+    start, last = cur.fetchone()
+    conn.commit()
+    changed = 0
+    while last is not None and start <= last:
+        end = date.fromordinal(start.toordinal() + BALANCE_BATCH_DAYS)
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (BALANCE_LOCK_KEY,))
+        cur.execute(BATCH_UPDATE_SQL, {"start": start, "end": end})
+        changed += cur.rowcount
+        conn.commit()
+        start = end
+    if changed:
+        ensure_ledger_changes(cur)
+        bump_ledger_version(cur)
+        conn.commit()
+    cur.close()
+    return changed
+
+
+def balance_as_of(conn, day):
+    """(date of the last transaction on or before `day`, balance after it) on a SQLAlchemy connection.
+
+    Before the first transaction this is (None, opening balance).
+    """
+    row = conn.execute(BALANCE_AS_OF_QUERY, {"day": day}).first()
+    if row is not None:
+        return row[0], row[1]
+    opening = conn.execute(text("SELECT opening_balance FROM ledger_balance_state WHERE id = 1")).scalar()
+    return None, opening
+
+
+def count_mismatches(conn):
+    """Rows whose stored balance differs from the recomputed running balance."""
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT balance,
+                   (SELECT opening_balance FROM ledger_balance_state WHERE id = 1)
+                   + SUM({SIGNED_AMOUNT}) OVER (ORDER BY date, id) AS running
+            FROM checking_account_main
+            WHERE date IS NOT NULL
+        ) ordered
+        WHERE balance IS DISTINCT FROM running
+    """)
+    count = cur.fetchone()[0]
+    conn.rollback()
+    cur.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the checking_account_main running balances.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every balance")
+    parser.add_argument("--check", action="store_true", help="count rows whose balance is wrong")
+    parser.add_argument("--as-of", metavar="YYYY-MM-DD", help="print the balance at the end of this day")
+    parser.add_argument("--database-url", default=REPORTING_DATABASE_URL)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        if args.rebuild:
+            print(f"Recomputed balances: {rebuild_balances(conn)} rows changed")
+        if args.as_of:
+            from sqlalchemy import create_engine
+
+            with create_engine(args.database_url).connect() as sa_conn:
+                print(balance_as_of(sa_conn, date.fromisoformat(args.as_of)))
+        if args.check or not (args.rebuild or args.as_of):
+            cur = conn.cursor()
+            cur.execute("SELECT to_regclass('ledger_balance_state') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                print("Balances not set up yet: run with --rebuild (or start either app)")
+                sys.exit(1)
+            cur.close()
+            mismatches = count_mismatches(conn)
+            print(f"{mismatches} rows with a wrong balance")
+            sys.exit(1 if mismatches else 0)
+    finally:
+        conn.close()
@@ -0,0 +1,166 @@
+"""First and last ledger dates (the /api/data-bounds range) kept in a one-row table.
+
+The bounds cover checking_account_main, credit_card_account and
+payroll_history. The Flask app widens them with `extend_bounds` in the same
+transaction as each ledger insert. After a delete, `shrink_bounds`
+re-reads a bound from the daily rollup, and only when the deleted day was
+that bound. The API reads the row through a short in-process cache.
+`reconcile_bounds` recomputes everything from the raw tables. The API runs
+it in the background on its first read and every BOUNDS_RECONCILE_SECONDS
+after that. Run `python ledger_bounds.py --reconcile` after hand edits.
+"""
+import argparse
+import os
+import threading
+import time
+
+import psycopg2
+from sqlalchemy import text
+
+from db import REPORTING_DATABASE_URL
+
+BOUNDS_CACHE_SECONDS = float(os.getenv("BOUNDS_CACHE_SECONDS", "5"))
+BOUNDS_RECONCILE_SECONDS = float(os.getenv("BOUNDS_RECONCILE_SECONDS", "3600"))
+
+BOUNDS_DDL = """
+    CREATE TABLE IF NOT EXISTS ledger_bounds (
+        id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        min_date DATE,
+        max_date DATE,
+        reconciled_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+# Per-table MIN/MAX so each one is a single probe of that table's date index
+RAW_BOUNDS_SQL = """
+    SELECT LEAST((SELECT MIN(date) FROM checking_account_main),
+                 (SELECT MIN(date) FROM credit_card_account),
+                 (SELECT MIN(pay_date) FROM payroll_history)),
+           GREATEST((SELECT MAX(date) FROM checking_account_main),
+                    (SELECT MAX(date) FROM credit_card_account),
+                    (SELECT MAX(pay_date) FROM payroll_history))
+"""
+
+# Same sources as RAW_BOUNDS_SQL, read from the rollup (its key starts with day)
+ROLLUP_BOUNDS_SQL = """
+    SELECT MIN(day), MAX(day) FROM ledger_daily_rollup
+    WHERE source IN ('checking_main', 'credit_card', 'payroll')
+"""
+
+_lock = threading.Lock()
+_cache = {"bounds": None, "read_at": 0.0, "reconciled_at": 0.0, "reconciling": False}
+
+
+def _store(cur, min_date, max_date):
+    cur.execute("""
+        INSERT INTO ledger_bounds (id, min_date, max_date, reconciled_at) VALUES (1, %s, %s, now())
+        ON CONFLICT (id) DO UPDATE SET
+            min_date = EXCLUDED.min_date, max_date = EXCLUDED.max_date, reconciled_at = now()
+    """, (min_date, max_date))
+
+
+def ensure_bounds(cur):
+    """Create the bounds table, filling it from the raw tables the first time."""
+    cur.execute(BOUNDS_DDL)
+    cur.execute("SELECT EXISTS (SELECT 1 FROM ledger_bounds)")
+    if not cur.fetchone()[0]:
+        cur.execute(RAW_BOUNDS_SQL)
+        _store(cur, *cur.fetchone())
+
+
+def extend_bounds(cur, days):
+    """Widen the bounds to include `days` (dates just inserted), on the caller's cursor."""
+    days = sorted({str(d) for d in days if d})
+    if not days:
+        return
+    cur.execute("""
+        UPDATE ledger_bounds
+        SET min_date = LEAST(min_date, CAST(%s AS DATE)), max_date = GREATEST(max_date, CAST(%s AS DATE))
+        WHERE id = 1
+    """, (days[0], days[-1]))
+
+
+def shrink_bounds(cur, day):
+    """After deleting a row dated `day`, re-read any bound it sat on.
+
+    Needs the rollup to already reflect the delete (call after apply_delta).
+    """
+    if not day:
+        return
+    cur.execute(
+        "SELECT 1 FROM ledger_bounds WHERE id = 1 AND CAST(%s AS DATE) IN (min_date, max_date)",
+        (str(day),),
+    )
+    if cur.fetchone():
+        cur.execute(ROLLUP_BOUNDS_SQL)
+        min_date, max_date = cur.fetchone()
+        cur.execute(
+            "UPDATE ledger_bounds SET min_date = %s, max_date = %s WHERE id = 1",
+            (min_date, max_date),
+        )
+
+
+def reconcile_bounds(conn):
+    """Recompute the bounds from the raw tables (psycopg2 connection). Returns (min, max)."""
+    cur = conn.cursor()
+    cur.execute(BOUNDS_DDL)
+    cur.execute(RAW_BOUNDS_SQL)
+    bounds = cur.fetchone()
+    _store(cur, *bounds)
+    conn.commit()
+    cur.close()
+    return bounds
+
+
+def _reconcile_in_background(engine):
+    try:
+        raw_conn = engine.raw_connection()
+        try:
+            reconcile_bounds(raw_conn)
+        finally:
+            raw_conn.close()
+    except Exception as e:
+        print(f"Ledger bounds reconcile failed: {e}")
+    finally:
+        with _lock:
+            _cache["read_at"] = 0.0
+            _cache["reconciling"] = False
+
+
+def get_bounds(engine):
+    """(min_date, max_date) of the ledger, at most BOUNDS_CACHE_SECONDS old."""
+    now = time.monotonic()
+    with _lock:
+        if _cache["bounds"] is not None and now - _cache["read_at"] < BOUNDS_CACHE_SECONDS:
+            return _cache["bounds"]
+        if now - _cache["reconciled_at"] >= BOUNDS_RECONCILE_SECONDS and not _cache["reconciling"]:
+            _cache["reconciled_at"] = now
+            _cache["reconciling"] = True
+            threading.Thread(target=_reconcile_in_background, args=(engine,), daemon=True).start()
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT min_date, max_date FROM ledger_bounds WHERE id = 1")).first()
+    bounds = (row[0], row[1]) if row else (None, None)
+    with _lock:
+        _cache["bounds"] = bounds
+        _cache["read_at"] = now
+    return bounds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the ledger date bounds table.")
+    parser.add_argument("--reconcile", action="store_true", help="recompute the bounds from the raw tables")
+    parser.add_argument("--database-url", default=REPORTING_DATABASE_URL)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        if args.reconcile:
+            min_date, max_date = reconcile_bounds(conn)
+            print(f"Reconciled ledger bounds: {min_date} .. {max_date}")
+        else:
+            cur = conn.cursor()
+            cur.execute("SELECT min_date, max_date, reconciled_at FROM ledger_bounds WHERE id = 1")
+            print(cur.fetchone())
+            cur.close()
+    finally:
+        conn.close()
@@ -0,0 +1,126 @@
+"""Columnar export of the unified ledger (/api/export/ledger).
+
+All four ledger tables are read as one normalized table, oldest first:
+
+    date, source, id, transaction_id, description, category, type, amount
+
+(payroll rows: description = employee, category 'Payroll', amount =
+-total_business_cost). Rows come from a server-side cursor in batches;
+each batch becomes an Arrow record batch and is written to an Arrow IPC
+stream or a Parquet file (one row group per batch). The bytes each batch
+produces are handed to the client right away, so memory stays at about
+one batch no matter how long the range is.
+
+pyarrow is optional; without it the endpoint answers 501.
+"""
+from sqlalchemy import text
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+EXPORT_BATCH_SIZE = 50000
+
+LEDGER_EXPORT_SQL = text("""
+    SELECT date, source, id, transaction_id, description, category, type,
+           CAST(amount AS DOUBLE PRECISION) AS amount
+    FROM (
+        SELECT date, 'checking_main' AS source, id, transaction_id, description, category, type, amount
+        FROM checking_account_main
+        UNION ALL
+        SELECT date, 'checking_secondary', id, transaction_id, description, category, type, amount
+        FROM checking_account_secondary
+        UNION ALL
+        SELECT date, 'credit_card', id, transaction_id, vendor, category, type, amount
+        FROM credit_card_account
+        UNION ALL
+        SELECT pay_date, 'payroll', id, NULL, employee_name, 'Payroll', NULL, -total_business_cost
+        FROM payroll_history
+    ) ledger
+    WHERE date BETWEEN :start AND :end
+    ORDER BY date, source, id
+""")
+
+
+def available():
+    return pa is not None
+
+
+def _schema():
+    return pa.schema([
+        ("date", pa.date32()),
+        ("source", pa.string()),
+        ("id", pa.int64()),
+        ("transaction_id", pa.string()),
+        ("description", pa.string()),
+        ("category", pa.string()),
+        ("type", pa.string()),
+        ("amount", pa.float64()),
+    ])
+
+
+class _ChunkSink:
+    """Write-only file object that keeps its position and hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_export(engine, start_date, end_date, fmt="arrow", batch_size=EXPORT_BATCH_SIZE):
+    """Yield the encoded export for the range chunk by chunk (one chunk per batch)."""
+    schema = _schema()
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(
+            LEDGER_EXPORT_SQL, {"start": start_date, "end": end_date}
+        )
+        for rows in result.partitions(batch_size):
+            columns = list(zip(*rows))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+            ))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Stream end marker / Parquet footer
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,288 @@
+"""Monthly range partitioning of the large ledger tables (optional).
+
+checking_account_main, credit_card_account and payroll_history can be
+converted to tables partitioned by month on their date column, so a range
+query only touches the months it covers, and an old month can be detached
+in one catalog operation instead of a DELETE. Each partition is named
+<table>_pYYYYMM. A <table>_default partition catches anything no month
+covers (e.g. entries backdated before the first month). `ensure_partitions`
+moves those rows into a month partition when it creates one.
+
+Conversion is reporting migration 4, which is optional. It runs only with
+`python migrations.py --partition`, `python init_db.py --partition` or
+LEDGER_PARTITIONING=1. The primary key becomes (id, <date column>),
+because a partitioned table's unique keys must include the partition key,
+so rows without a date have to be fixed or removed first.
+
+Both apps call `ensure_partitions` on startup. It creates the months from
+now to PARTITION_MONTHS_AHEAD ahead (default 3) and does nothing on
+unpartitioned tables. Run `python ledger_partitions.py --ensure` from cron
+if the apps stay up for months.
+
+CLI:
+    python ledger_partitions.py --status
+    python ledger_partitions.py --ensure
+    python ledger_partitions.py --detach 2022-01 [--table payroll_history] [--drop]
+"""
+import argparse
+import os
+from datetime import date, timedelta
+
+import psycopg2
+
+import ledger_rollup
+from db import REPORTING_DATABASE_URL
+from ledger_bounds import reconcile_bounds
+from ledger_version import ensure_ledger_changes, bump_ledger_version
+
+# table -> (partition column, source name in ledger_daily_rollup)
+PARTITIONED_TABLES = {
+    "checking_account_main": ("date", ledger_rollup.CHECKING_MAIN),
+    "credit_card_account": ("date", ledger_rollup.CREDIT_CARD),
+    "payroll_history": ("pay_date", ledger_rollup.PAYROLL),
+}
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# Arbitrary key for pg_advisory_xact_lock, so two processes starting together don't race
+PARTITION_LOCK_KEY = 7349022
+
+
+def _month(d):
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d, months):
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _months(first, last):
+    month = _month(first)
+    while month <= last:
+        yield month
+        month = _add_months(month, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def is_partitioned(cur, table):
+    cur.execute(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", (table,)
+    )
+    return cur.fetchone() is not None
+
+
+def partitions(cur, table):
+    """Names of the partitions of `table`."""
+    cur.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+        (table,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def _create_month(cur, table, column, month, existing):
+    name = partition_name(table, month)
+    if name in existing:
+        return False
+    bounds = (month, _add_months(month, 1))
+    default = f"{table}_default"
+    cur.execute(f"SELECT 1 FROM {default} WHERE {column} >= %s AND {column} < %s LIMIT 1", bounds)
+    if cur.fetchone() is None:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", bounds)
+    else:
+        # Rows already sitting in the default partition have to move before the month can attach
+        cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cur.execute(
+            f"WITH moved AS (DELETE FROM {default} WHERE {column} >= %s AND {column} < %s RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved",
+            bounds,
+        )
+        cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+    existing.add(name)
+    return True
+
+
+def _ensure_table(cur, table, column, months_ahead):
+    existing = set(partitions(cur, table))
+    this_month = _month(date.today())
+    wanted = set(_months(this_month, _add_months(this_month, months_ahead)))
+    # Plus every month that has rows stranded in the default partition
+    cur.execute(
+        f"SELECT DISTINCT CAST(date_trunc('month', {column}) AS DATE) FROM {table}_default "
+        f"WHERE {column} IS NOT NULL"
+    )
+    wanted.update(row[0] for row in cur.fetchall())
+    return [partition_name(table, m) for m in sorted(wanted) if _create_month(cur, table, column, m, existing)]
+
+
+def ensure_partitions(conn, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Create missing month partitions on every partitioned ledger table. Returns the names created."""
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+    created = []
+    for table, (column, _) in PARTITIONED_TABLES.items():
+        if is_partitioned(cur, table):
+            created += _ensure_table(cur, table, column, months_ahead)
+    conn.commit()
+    cur.close()
+    return created
+
+
+# --- CONVERSION (reporting migration 4) ---
+
+# Views built on a table (and views on those views), shallowest first
+DEPENDENT_VIEWS_SQL = """
+    WITH RECURSIVE deps (oid, depth) AS (
+        SELECT r.ev_class, 1
+        FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+        WHERE d.refobjid = to_regclass(%s) AND r.ev_class <> d.refobjid
+        UNION
+        SELECT r.ev_class, deps.depth + 1
+        FROM deps JOIN pg_depend d ON d.refobjid = deps.oid JOIN pg_rewrite r ON r.oid = d.objid
+        WHERE r.ev_class <> deps.oid
+    )
+    SELECT CAST(CAST(c.oid AS regclass) AS TEXT), pg_get_viewdef(c.oid)
+    FROM deps JOIN pg_class c ON c.oid = deps.oid
+    WHERE c.relkind = 'v'
+    GROUP BY c.oid
+    ORDER BY MAX(deps.depth)
+"""
+
+def _convert_table(cur, table, column, months_ahead):
+    old = f"{table}_unpartitioned"
+    cur.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+    cur.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s",
+        (table,),
+    )
+    indexes = cur.fetchall()
+    cur.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        (table,),
+    )
+    foreign_keys = cur.fetchall()
+    cur.execute(DEPENDENT_VIEWS_SQL, (table,))
+    views = cur.fetchall()
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+    sequence = cur.fetchone()[0]
+    cur.execute(f"SELECT MIN({column}), MAX({column}), COUNT(*) - COUNT({column}) FROM {table}")
+    first, last, undated = cur.fetchone()
+    if undated:
+        raise RuntimeError(f"{table} has {undated} rows with no {column}; fix them before partitioning")
+
+    # Views can't follow the rows to a new table: drop them now, recreate them at the end
+    for name, _ in reversed(views):
+        cur.execute(f"DROP VIEW {name}")
+    cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    cur.execute(
+        f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY RANGE ({column})"
+    )
+    this_month = _month(date.today())
+    first = _month(first) if first else this_month
+    last = max(_month(last) if last else this_month, _add_months(this_month, months_ahead))
+    for month in _months(first, last):
+        cur.execute(
+            f"CREATE TABLE {partition_name(table, month)} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            (month, _add_months(month, 1)),
+        )
+    cur.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    cur.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    cur.execute(f"DROP TABLE {old}")
+
+    # Recreated on the parent, which builds them on every partition
+    cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {column})")
+    for name, definition in indexes:
+        if name != f"{table}_pkey":
+            cur.execute(definition)
+    for name, definition in foreign_keys:
+        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    for name, definition in views:
+        cur.execute(f"CREATE VIEW {name} AS {definition}")
+    cur.execute(f"ANALYZE {table}")
+
+
+def convert_tables(cur, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Convert each ledger table that is still a plain table, on the caller's transaction."""
+    for table, (column, _) in PARTITIONED_TABLES.items():
+        if not is_partitioned(cur, table):
+            _convert_table(cur, table, column, months_ahead)
+
+
+# --- DETACH ---
+
+def detach_month(conn, month, tables=None, drop=False):
+    """Detach (and optionally drop) the `month` partition of each table.
+
+    The month's rows leave the ledger, so its rollup rows are removed and
+    the ledger version and date bounds are refreshed. A detached table
+    keeps its data and can be re-attached with ALTER TABLE .. ATTACH
+    PARTITION. Returns the partitions detached.
+    """
+    month = _month(month)
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+    detached = []
+    for table in tables or PARTITIONED_TABLES:
+        column, source = PARTITIONED_TABLES[table]
+        name = partition_name(table, month)
+        if name not in partitions(cur, table):
+            continue
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        if drop:
+            cur.execute(f"DROP TABLE {name}")
+        cur.execute(
+            "DELETE FROM ledger_daily_rollup WHERE source = %s AND day >= %s AND day < %s",
+            (source, month, _add_months(month, 1)),
+        )
+        detached.append(name)
+    if detached:
+        ledger_rollup.rebuild_periods(cur, month, _add_months(month, 1) - timedelta(days=1))
+        ensure_ledger_changes(cur)
+        bump_ledger_version(cur)
+    conn.commit()
+    cur.close()
+    if detached:
+        reconcile_bounds(conn)
+    return detached
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the monthly ledger partitions.")
+    parser.add_argument("--database-url", default=REPORTING_DATABASE_URL)
+    parser.add_argument("--status", action="store_true", help="list the partitions of each table")
+    parser.add_argument("--ensure", action="store_true", help="create missing future month partitions")
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--detach", metavar="YYYY-MM", help="detach this month's partitions")
+    parser.add_argument("--table", choices=sorted(PARTITIONED_TABLES), action="append",
+                        help="only this table (repeatable; default all)")
+    parser.add_argument("--drop", action="store_true", help="drop the detached partitions")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    try:
+        if args.detach:
+            names = detach_month(conn, date.fromisoformat(args.detach + "-01"), args.table, args.drop)
+            print(f"{'Dropped' if args.drop else 'Detached'}: {', '.join(names) or 'nothing'}")
+        elif args.ensure:
+            names = ensure_partitions(conn, args.months_ahead)
+            print(f"Created: {', '.join(names) or 'nothing'}")
+        else:
+            cur = conn.cursor()
+            for table in args.table or PARTITIONED_TABLES:
+                if is_partitioned(cur, table):
+                    names = [n for n in partitions(cur, table) if n != f"{table}_default"]
+                    print(f"{table}: {len(names)} month partitions ({names[0]} .. {names[-1]}) + default")
+                else:
+                    print(f"{table}: not partitioned")
+            conn.rollback()
+            cur.close()
+    finally:
+        conn.close()
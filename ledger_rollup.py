@@ -0,0 +1,370 @@
+"""Daily ledger rollup: one row per (day, category, subcategory, source).
+
+The reporting endpoints read this table instead of re-aggregating the raw
+ledger tables on every request. The Flask app keeps it current through
+`apply_delta` in the same transaction as its ledger writes, and
+`python ledger_rollup.py --rebuild / --check` rebuilds it from scratch or
+compares it against the raw tables.
+
+`ledger_period_rollup` holds the same totals per ISO week and per calendar
+month, keyed by (granularity, source, category, period start) without the
+subcategory, so long-range series read one row per period. apply_delta
+and rebuild_rollup maintain it alongside the daily rows.
+"""
+import argparse
+import sys
+
+import psycopg2
+
+from db import REPORTING_DATABASE_URL
+from ledger_version import ensure_ledger_changes, bump_ledger_version
+
+# Source account names stored in the `source` column
+CHECKING_MAIN = "checking_main"
+CHECKING_SECONDARY = "checking_secondary"
+CREDIT_CARD = "credit_card"
+PAYROLL = "payroll"
+
+ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS ledger_daily_rollup (
+        day DATE NOT NULL,
+        category TEXT NOT NULL,
+        subcategory TEXT NOT NULL,
+        source TEXT NOT NULL,
+        credit_total NUMERIC NOT NULL DEFAULT 0,
+        debit_total NUMERIC NOT NULL DEFAULT 0,
+        net_pay_total NUMERIC NOT NULL DEFAULT 0,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, category, subcategory, source)
+    )
+"""
+
+# Coarser resolutions kept in ledger_period_rollup (date_trunc field names)
+PERIODS = ("week", "month")
+
+PERIOD_ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS ledger_period_rollup (
+        granularity TEXT NOT NULL,
+        period DATE NOT NULL,
+        category TEXT NOT NULL,
+        source TEXT NOT NULL,
+        credit_total NUMERIC NOT NULL DEFAULT 0,
+        debit_total NUMERIC NOT NULL DEFAULT 0,
+        net_pay_total NUMERIC NOT NULL DEFAULT 0,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, source, category, period)
+    )
+"""
+
+# The daily rollup aggregated to one granularity (%(granularity)s), optionally
+# limited to [%(start)s, %(end)s)
+PERIOD_AGGREGATE_SQL = """
+    SELECT %(granularity)s, CAST(date_trunc(%(granularity)s, day) AS DATE) AS period, category, source,
+           SUM(credit_total), SUM(debit_total), SUM(net_pay_total), SUM(row_count)
+    FROM ledger_daily_rollup
+    WHERE (CAST(%(start)s AS DATE) IS NULL OR day >= %(start)s)
+      AND (CAST(%(end)s AS DATE) IS NULL OR day < %(end)s)
+    GROUP BY period, category, source
+"""
+
+# The raw ledger aggregated to rollup grain. credit_total is the sum of the
+# positive amounts, debit_total the sum of the negative ones, so
+# SUM(amount) = credit + debit and SUM(ABS(amount)) = credit - debit.
+RAW_AGGREGATE_SQL = """
+    SELECT day, category, subcategory, source,
+           SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) AS credit_total,
+           SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END) AS debit_total,
+           COALESCE(SUM(net_pay), 0) AS net_pay_total,
+           COUNT(*) AS row_count
+    FROM (
+        SELECT date AS day, COALESCE(TRIM(category), '') AS category,
+               COALESCE(TRIM(description), '') AS subcategory, 'checking_main' AS source,
+               amount, CAST(NULL AS NUMERIC) AS net_pay
+        FROM checking_account_main
+        UNION ALL
+        SELECT date, COALESCE(TRIM(category), ''), COALESCE(TRIM(description), ''), 'checking_secondary',
+               amount, NULL
+        FROM checking_account_secondary
+        UNION ALL
+        SELECT date, COALESCE(TRIM(category), ''), COALESCE(TRIM(vendor), ''), 'credit_card',
+               amount, NULL
+        FROM credit_card_account
+        UNION ALL
+        SELECT pay_date, 'Payroll', COALESCE(TRIM(employee_name), ''), 'payroll',
+               total_business_cost, net_pay
+        FROM payroll_history
+    ) raw
+    WHERE day IS NOT NULL
+    GROUP BY day, category, subcategory, source
+"""
+
+DELTA_SQL = """
+    INSERT INTO ledger_daily_rollup AS r
+        (day, category, subcategory, source, credit_total, debit_total, net_pay_total, row_count)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (day, category, subcategory, source) DO UPDATE SET
+        credit_total = r.credit_total + EXCLUDED.credit_total,
+        debit_total = r.debit_total + EXCLUDED.debit_total,
+        net_pay_total = r.net_pay_total + EXCLUDED.net_pay_total,
+        row_count = r.row_count + EXCLUDED.row_count
+"""
+
+
+PERIOD_DELTA_SQL = """
+    INSERT INTO ledger_period_rollup AS r
+        (granularity, period, category, source, credit_total, debit_total, net_pay_total, row_count)
+    SELECT g, CAST(date_trunc(g, CAST(%s AS DATE)) AS DATE), %s, %s, %s, %s, %s, %s
+    FROM unnest(CAST(%s AS TEXT[])) AS g
+    ON CONFLICT (granularity, source, category, period) DO UPDATE SET
+        credit_total = r.credit_total + EXCLUDED.credit_total,
+        debit_total = r.debit_total + EXCLUDED.debit_total,
+        net_pay_total = r.net_pay_total + EXCLUDED.net_pay_total,
+        row_count = r.row_count + EXCLUDED.row_count
+"""
+
+
+def _trim(value):
+    # Same normalization as COALESCE(TRIM(x), '') in RAW_AGGREGATE_SQL
+    return str(value).strip(' ') if value is not None else ''
+
+
+def apply_delta(cur, source, day, category, subcategory, amount, net_pay=None, sign=1):
+    """Add (sign=1) or remove (sign=-1) one raw ledger row from the rollup.
+
+    Runs on the caller's cursor so it commits or rolls back together with
+    the ledger write it mirrors.
+    """
+    if not day:
+        return
+    amount = float(amount or 0)
+    net_pay = float(net_pay or 0) * sign
+    category = 'Payroll' if source == PAYROLL else _trim(category)
+    key = (day, category, _trim(subcategory), source)
+    # A removal takes the amount back off the side it was added to
+    totals = (max(amount, 0) * sign, min(amount, 0) * sign, net_pay, sign)
+    cur.execute(DELTA_SQL, key + totals)
+    cur.execute(PERIOD_DELTA_SQL, (day, category, source) + totals + (list(PERIODS),))
+    if sign < 0:
+        cur.execute(
+            """
+            DELETE FROM ledger_daily_rollup
+            WHERE day = %s AND category = %s AND subcategory = %s AND source = %s AND row_count <= 0
+            """,
+            key,
+        )
+        cur.execute(
+            """
+            DELETE FROM ledger_period_rollup
+            WHERE category = %s AND source = %s AND row_count <= 0
+              AND (granularity, period) IN (
+                  SELECT g, CAST(date_trunc(g, CAST(%s AS DATE)) AS DATE) FROM unnest(CAST(%s AS TEXT[])) AS g
+              )
+            """,
+            (category, source, day, list(PERIODS)),
+        )
+
+
+def apply_rows(cur, rows_table):
+    """Add many raw ledger rows to the rollup in two statements.
+
+    `rows_table` is a table (usually a temp table) with columns (source,
+    day, category, subcategory, amount, net_pay), one row per ledger row
+    inserted. Same result as apply_delta per row, on the caller's cursor.
+    """
+    normalized = f"""
+        SELECT day, source,
+               CASE WHEN source = '{PAYROLL}' THEN 'Payroll' ELSE COALESCE(TRIM(category), '') END AS category,
+               COALESCE(TRIM(subcategory), '') AS subcategory,
+               COALESCE(amount, 0) AS amount, COALESCE(net_pay, 0) AS net_pay
+        FROM {rows_table}
+        WHERE day IS NOT NULL
+    """
+    totals = """
+        SUM(GREATEST(amount, 0)), SUM(LEAST(amount, 0)), SUM(net_pay), COUNT(*)
+    """
+    cur.execute(f"""
+        INSERT INTO ledger_daily_rollup AS r
+            (day, category, subcategory, source, credit_total, debit_total, net_pay_total, row_count)
+        SELECT day, category, subcategory, source, {totals}
+        FROM ({normalized}) n
+        GROUP BY day, category, subcategory, source
+        ON CONFLICT (day, category, subcategory, source) DO UPDATE SET
+            credit_total = r.credit_total + EXCLUDED.credit_total,
+            debit_total = r.debit_total + EXCLUDED.debit_total,
+            net_pay_total = r.net_pay_total + EXCLUDED.net_pay_total,
+            row_count = r.row_count + EXCLUDED.row_count
+    """)
+    cur.execute(f"""
+        INSERT INTO ledger_period_rollup AS r
+            (granularity, period, category, source, credit_total, debit_total, net_pay_total, row_count)
+        SELECT g, CAST(date_trunc(g, day) AS DATE), category, source, {totals}
+        FROM ({normalized}) n CROSS JOIN unnest(CAST(%s AS TEXT[])) AS g
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (granularity, source, category, period) DO UPDATE SET
+            credit_total = r.credit_total + EXCLUDED.credit_total,
+            debit_total = r.debit_total + EXCLUDED.debit_total,
+            net_pay_total = r.net_pay_total + EXCLUDED.net_pay_total,
+            row_count = r.row_count + EXCLUDED.row_count
+    """, (list(PERIODS),))
+
+
+def rebuild_periods(cur, start=None, end=None):
+    """Recompute the week/month rollup from the daily rollup on the caller's cursor.
+
+    With `start`/`end` (dates, inclusive) only the periods overlapping that
+    range are rebuilt. Returns the number of period rows written.
+    """
+    cur.execute(PERIOD_ROLLUP_DDL)
+    count = 0
+    for granularity in PERIODS:
+        bounds = {"granularity": granularity, "start": None, "end": None}
+        if start is not None:
+            # Widen to whole periods: [start of start's period, start of the period after end's)
+            cur.execute(
+                "SELECT CAST(date_trunc(%(g)s, CAST(%(start)s AS DATE)) AS DATE), "
+                "CAST(date_trunc(%(g)s, CAST(%(end)s AS DATE)) + CAST('1 ' || %(g)s AS INTERVAL) AS DATE)",
+                {"g": granularity, "start": start, "end": end},
+            )
+            bounds["start"], bounds["end"] = cur.fetchone()
+        cur.execute(
+            """
+            DELETE FROM ledger_period_rollup
+            WHERE granularity = %(granularity)s
+              AND (CAST(%(start)s AS DATE) IS NULL OR period >= %(start)s)
+              AND (CAST(%(end)s AS DATE) IS NULL OR period < %(end)s)
+            """,
+            bounds,
+        )
+        cur.execute(
+            "INSERT INTO ledger_period_rollup "
+            "(granularity, period, category, source, credit_total, debit_total, net_pay_total, row_count) "
+            + PERIOD_AGGREGATE_SQL,
+            bounds,
+        )
+        count += cur.rowcount
+    return count
+
+
+def ensure_rollup(conn):
+    """Create the rollup tables, and build them once if they are still empty."""
+    cur = conn.cursor()
+    cur.execute(ROLLUP_DDL)
+    cur.execute(PERIOD_ROLLUP_DDL)
+    cur.execute("SELECT EXISTS (SELECT 1 FROM ledger_daily_rollup), EXISTS (SELECT 1 FROM ledger_period_rollup)")
+    populated, periods_populated = cur.fetchone()
+    if populated and not periods_populated:
+        # Daily rollup from before the period table existed
+        cur.execute("LOCK TABLE ledger_period_rollup IN EXCLUSIVE MODE")
+        rebuild_periods(cur)
+    conn.commit()
+    cur.close()
+    if not populated:
+        rebuild_rollup(conn)
+
+
+def rebuild_rollup(conn):
+    """Recompute the whole rollup (daily and periods) from the raw tables in one transaction.
+
+    Returns the number of daily rows.
+    """
+    cur = conn.cursor()
+    cur.execute(ROLLUP_DDL)
+    cur.execute(PERIOD_ROLLUP_DDL)
+    cur.execute("LOCK TABLE ledger_daily_rollup, ledger_period_rollup IN EXCLUSIVE MODE")
+    cur.execute("DELETE FROM ledger_daily_rollup")
+    cur.execute(
+        "INSERT INTO ledger_daily_rollup "
+        "(day, category, subcategory, source, credit_total, debit_total, net_pay_total, row_count) "
+        + RAW_AGGREGATE_SQL
+    )
+    count = cur.rowcount
+    rebuild_periods(cur)
+    # Anything cached from the old rollup is stale now
+    ensure_ledger_changes(cur)
+    bump_ledger_version(cur)
+    conn.commit()
+    cur.close()
+    return count
+
+
+def check_consistency(conn):
+    """Compare the rollup with the raw tables.
+
+    Returns a list of (day, category, subcategory, source, raw_values, rollup_values)
+    for every key where they differ; an empty list means the rollup is exact.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT COALESCE(raw.day, r.day), COALESCE(raw.category, r.category),
+               COALESCE(raw.subcategory, r.subcategory), COALESCE(raw.source, r.source),
+               raw.credit_total, raw.debit_total, raw.net_pay_total, raw.row_count,
+               r.credit_total, r.debit_total, r.net_pay_total, r.row_count
+        FROM ({RAW_AGGREGATE_SQL}) raw
+        FULL OUTER JOIN ledger_daily_rollup r
+          ON r.day = raw.day AND r.category = raw.category
+         AND r.subcategory = raw.subcategory AND r.source = raw.source
+        WHERE raw.row_count IS DISTINCT FROM r.row_count
+           OR raw.credit_total IS DISTINCT FROM r.credit_total
+           OR raw.debit_total IS DISTINCT FROM r.debit_total
+           OR raw.net_pay_total IS DISTINCT FROM r.net_pay_total
+        ORDER BY 1, 4, 2, 3
+        """
+    )
+    mismatches = [(row[0], row[1], row[2], row[3], row[4:8], row[8:12]) for row in cur.fetchall()]
+    cur.close()
+    return mismatches
+
+
+def check_periods(conn):
+    """Compare the week/month rollup with the daily rollup.
+
+    Returns (granularity, period, category, source) for every key that differs.
+    """
+    cur = conn.cursor()
+    mismatches = []
+    for granularity in PERIODS:
+        cur.execute(
+            f"""
+            SELECT %(granularity)s, COALESCE(d.period, p.period), COALESCE(d.category, p.category),
+                   COALESCE(d.source, p.source)
+            FROM ({PERIOD_AGGREGATE_SQL}) AS d (granularity, period, category, source,
+                                               credit_total, debit_total, net_pay_total, row_count)
+            FULL OUTER JOIN (
+                SELECT * FROM ledger_period_rollup WHERE granularity = %(granularity)s
+            ) p ON p.period = d.period AND p.category = d.category AND p.source = d.source
+            WHERE d.row_count IS DISTINCT FROM p.row_count
+               OR d.credit_total IS DISTINCT FROM p.credit_total
+               OR d.debit_total IS DISTINCT FROM p.debit_total
+               OR d.net_pay_total IS DISTINCT FROM p.net_pay_total
+            ORDER BY 2, 4, 3
+            """,
+            {"granularity": granularity, "start": None, "end": None},
+        )
+        mismatches += cur.fetchall()
+    cur.close()
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the daily and week/month ledger rollup tables.")
+    parser.add_argument('--rebuild', action='store_true', help="recompute the rollup from the raw tables")
+    parser.add_argument('--check', action='store_true', help="compare the rollup against the raw tables")
+    parser.add_argument('--database-url', default=REPORTING_DATABASE_URL)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.database_url)
+    if args.rebuild:
+        print(f"Rebuilt ledger_daily_rollup: {rebuild_rollup(conn)} rows")
+    if args.check or not args.rebuild:
+        mismatches = check_consistency(conn)
+        for day, category, subcategory, source, raw, rolled in mismatches[:50]:
+            print(f"{day} {source} {category!r}/{subcategory!r}: raw={raw} rollup={rolled}")
+        print(f"{len(mismatches)} mismatched keys")
+        period_mismatches = check_periods(conn)
+        for granularity, period, category, source in period_mismatches[:50]:
+            print(f"{granularity} {period} {source} {category!r}: period rollup differs from the daily rollup")
+        print(f"{len(period_mismatches)} mismatched week/month keys")
+        conn.close()
+        sys.exit(1 if mismatches or period_mismatches else 0)
+    conn.close()
@@ -0,0 +1,149 @@
+"""Ledger version counter for caches keyed on "has anything changed?".
+
+Every write to the reporting ledger appends a row to `ledger_changes` in the
+same transaction, carrying the day it touched (NULL = the whole ledger, e.g.
+a rollup rebuild). The current version is the highest change number, so a
+cache stamped with version N is still valid while no change > N exists, and
+`changed_days_since(N)` says which days to recompute.
+
+Version numbers come from a sequence, which hands them out at INSERT, not
+at COMMIT. So writers take LEDGER_VERSION_LOCK_KEY before inserting and
+hold it until they commit. A version is therefore only handed out once
+every lower one is committed, and a reader that sees version N also sees
+every change up to N.
+"""
+from sqlalchemy import text
+
+# Arbitrary key for pg_advisory_xact_lock: serializes version bumps in commit order
+LEDGER_VERSION_LOCK_KEY = 7349025
+
+LEDGER_CHANGES_DDL = """
+    CREATE TABLE IF NOT EXISTS ledger_changes (
+        version BIGSERIAL PRIMARY KEY,
+        changed_day DATE,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def ensure_ledger_changes(cur):
+    cur.execute(LEDGER_CHANGES_DDL)
+
+
+def bump_ledger_version(cur, days=None):
+    """Record a ledger write on the caller's (psycopg2) cursor.
+
+    `days` is the dates touched by the write; None marks the whole ledger
+    as changed. Returns the new version. Other writers wait at their own
+    bump until the caller's transaction ends.
+    """
+    if days is not None:
+        days = sorted({str(d) for d in days if d})
+        if not days:
+            return None
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (LEDGER_VERSION_LOCK_KEY,))
+    if days is None:
+        cur.execute("INSERT INTO ledger_changes (changed_day) VALUES (NULL) RETURNING version")
+        return cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO ledger_changes (changed_day) SELECT unnest(CAST(%s AS DATE[])) RETURNING version",
+        (days,),
+    )
+    return max(row[0] for row in cur.fetchall())
+
+
+def get_ledger_version(conn):
+    """Current ledger version (0 before the first recorded change)."""
+    return int(conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM ledger_changes")).scalar())
+
+
+def changed_days_since(conn, version):
+    """(latest_version, days) for changes after `version`.
+
+    `days` is a set of dates, or None when a whole-ledger change happened and
+    everything has to be recomputed.
+    """
+    rows = conn.execute(
+        text("SELECT version, changed_day FROM ledger_changes WHERE version > :v"),
+        {"v": version},
+    ).all()
+    if not rows:
+        return version, set()
+    latest = max(r[0] for r in rows)
+    if any(r[1] is None for r in rows):
+        return latest, None
+    return latest, {r[1] for r in rows}
+
+
+# --- BUDGET VERSION ---
+# Same idea for the budget tables (written through budget_routes.py); together
+# the two versions say whether any analytics response can have changed.
+
+# Arbitrary key for pg_advisory_xact_lock: budget versions, like ledger ones, in commit order
+BUDGET_VERSION_LOCK_KEY = 7349027
+
+BUDGET_CHANGES_DDL = """
+    CREATE TABLE IF NOT EXISTS budget_changes (
+        version BIGSERIAL PRIMARY KEY,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def bump_budget_version(conn):
+    """Record a budget write on the caller's (SQLAlchemy) connection, before it commits.
+
+    Other writers wait at their own bump until the caller's transaction ends.
+    """
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": BUDGET_VERSION_LOCK_KEY})
+    return int(conn.execute(text("INSERT INTO budget_changes DEFAULT VALUES RETURNING version")).scalar())
+
+
+# --- ENTRY VERSION ---
+# The cafe `entries` table (written by app.py and bulk_import.py) feeds the
+# source=entries|both analytics too. It lives in the cafe database, so its
+# change log does as well: every entries write bumps it in its own
+# transaction, whether or not the ledger sync that follows succeeds.
+
+# Arbitrary key for pg_advisory_xact_lock in the cafe database
+ENTRY_VERSION_LOCK_KEY = 7349026
+
+ENTRY_CHANGES_DDL = """
+    CREATE TABLE IF NOT EXISTS entry_changes (
+        version BIGSERIAL PRIMARY KEY,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def ensure_entry_changes(cur):
+    cur.execute(ENTRY_CHANGES_DDL)
+
+
+def bump_entry_version(cur):
+    """Record an entries write on the caller's (psycopg2) cafe cursor, before it commits. Returns the new version."""
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (ENTRY_VERSION_LOCK_KEY,))
+    cur.execute("INSERT INTO entry_changes DEFAULT VALUES RETURNING version")
+    return cur.fetchone()[0]
+
+
+def get_data_versions(conn, cafe_conn=None):
+    """Latest (version, changed_at) of the ledger, the budgets and the cafe entries.
+
+    `conn` is the reporting database, `cafe_conn` the cafe one (one round
+    trip each). Returns {"ledger": ..., "budget": ..., "entries": ...}, each
+    (version, changed_at); version is 0 and changed_at None before the first
+    recorded change, or for entries when no `cafe_conn` is given.
+    """
+    row = conn.execute(text("""
+        SELECT l.version, l.changed_at, b.version, b.changed_at
+        FROM (SELECT 1) one
+        LEFT JOIN (SELECT version, changed_at FROM ledger_changes ORDER BY version DESC LIMIT 1) l ON TRUE
+        LEFT JOIN (SELECT version, changed_at FROM budget_changes ORDER BY version DESC LIMIT 1) b ON TRUE
+    """)).one()
+    entries = (0, None)
+    if cafe_conn is not None:
+        e = cafe_conn.execute(text("SELECT version, changed_at FROM entry_changes ORDER BY version DESC LIMIT 1")).first()
+        if e is not None:
+            entries = (int(e[0]), e[1])
+    return {"ledger": (int(row[0] or 0), row[1]), "budget": (int(row[2] or 0), row[3]), "entries": entries}
@@ -0,0 +1,274 @@
+"""Request and SQL timing for both apps, exposed as Prometheus text at /metrics.
+
+* http_request_duration_seconds{method, route, status}: wall time of every
+  request, up to the last body chunk (streamed exports included).
+* db_statement_duration_seconds{database, route, statement} and
+  db_statement_rows{database, route, statement}: every SQL statement run
+  through a SQLAlchemy engine from db.py (FastAPI) or a psycopg2 connection
+  made with InstrumentedConnection (Flask), with the rows it returned or
+  changed.
+
+`route` is the route template ("/api/reports/{job_id}", "/delete_entry/<int:id>"),
+never the raw path, so label cardinality stays fixed. Statements outside a
+request (startup, report job threads) are labelled "-". `statement` is the
+verb plus the first table it reads or writes, e.g. "SELECT checking_account_main".
+
+Each process serves its own numbers. Under gunicorn with several workers,
+set PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them.
+
+prometheus_client is optional; without it nothing is recorded and /metrics
+answers 501.
+"""
+import os
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+import psycopg2.extensions
+from sqlalchemy import event
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, REGISTRY, generate_latest
+    from prometheus_client import multiprocess
+except ImportError:  # optional dependency
+    Histogram = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+METRICS_PATH = "/metrics"
+NO_ROUTE = "-"
+
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+if Histogram is not None:
+    REQUEST_DURATION = Histogram(
+        "http_request_duration_seconds", "HTTP request duration", ["method", "route", "status"]
+    )
+    STATEMENT_DURATION = Histogram(
+        "db_statement_duration_seconds", "SQL statement duration",
+        ["database", "route", "statement"], buckets=QUERY_BUCKETS,
+    )
+    STATEMENT_ROWS = Histogram(
+        "db_statement_rows", "Rows returned or changed by an SQL statement",
+        ["database", "route", "statement"], buckets=ROW_BUCKETS,
+    )
+
+# Route template of the request being served in this context
+_current_route = ContextVar("metrics_route", default=NO_ROUTE)
+
+
+def available():
+    return Histogram is not None
+
+
+def current_route():
+    return _current_route.get()
+
+
+# First table after FROM/INTO/UPDATE/TABLE/JOIN; "EXTRACT(YEAR FROM date)" style columns are skipped
+_STATEMENT_RE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF(?:\s+NOT)?\s+EXISTS)?|JOIN)\s+([A-Za-z_][\w.]*)\b(?!\s*\))",
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """'SELECT checking_account_main', 'INSERT entries', 'COMMIT', ..."""
+    words = sql.split(None, 1)
+    if not words:
+        return "OTHER"
+    verb = words[0].upper()
+    table = _STATEMENT_RE.search(sql)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+def observe_statement(database, sql, seconds, rowcount):
+    if Histogram is None:
+        return
+    label = statement_label(sql) if isinstance(sql, str) else "OTHER"
+    route = _current_route.get()
+    STATEMENT_DURATION.labels(database, route, label).observe(seconds)
+    # Server-side cursors and DDL report -1
+    if rowcount is not None and rowcount >= 0:
+        STATEMENT_ROWS.labels(database, route, label).observe(rowcount)
+
+
+def render():
+    """(body, content type) of the Prometheus text exposition, or None without prometheus_client."""
+    if Histogram is None:
+        return None
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+# --- SQLALCHEMY ---
+
+def instrument_engine(engine):
+    """Time every statement `engine` runs (db.get_engine calls this once per engine)."""
+    if Histogram is None:
+        return
+    database = engine.url.database
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        observe_statement(database, statement, time.perf_counter() - started, cursor.rowcount)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+# --- PSYCOPG2 ---
+
+class _TimedCursorMixin:
+    def _observe(self, sql, started):
+        observe_statement(self.connection.info.dbname, sql, time.perf_counter() - started, self.rowcount)
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._observe(query, started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._observe(query, started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self._observe(sql, started)
+
+
+_timed_cursor_classes = {}
+
+
+def _timed_cursor_class(base):
+    cls = _timed_cursor_classes.get(base)
+    if cls is None:
+        cls = type(f"Timed{base.__name__}", (_TimedCursorMixin, base), {})
+        _timed_cursor_classes[base] = cls
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors (any cursor_factory) time their statements.
+
+    Use as psycopg2.connect(..., connection_factory=InstrumentedConnection).
+    """
+
+    def cursor(self, *args, cursor_factory=None, **kwargs):
+        base = cursor_factory or self.cursor_factory or psycopg2.extensions.cursor
+        if Histogram is not None and not issubclass(base, _TimedCursorMixin):
+            base = _timed_cursor_class(base)
+        return super().cursor(*args, cursor_factory=base, **kwargs)
+
+
+# --- FASTAPI ---
+
+def _route_template(routes, scope):
+    from starlette.routing import Match
+
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.NONE:
+            continue
+        path = getattr(route, "path", None)
+        if path is None and hasattr(route, "original_router"):
+            # Newer FastAPI keeps include_router() routes behind a branch without a path of its own
+            path = _route_template(route.original_router.routes, scope)
+        if match == Match.FULL:
+            return path or "unmatched"
+        if partial is None:
+            partial = path
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request, labelled with the route template.
+
+    Add it last (outermost) with routes=app.routes so the ETag lookup and
+    compression are inside the measured time and the route is known to
+    every statement the request runs.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or Histogram is None:
+            return await self.app(scope, receive, send)
+        route = _route_template(self.routes, scope)
+        token = _current_route.set(route)
+        status = {"code": 500}
+        started = time.perf_counter()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            REQUEST_DURATION.labels(scope["method"], route, str(status["code"])).observe(
+                time.perf_counter() - started
+            )
+            _current_route.reset(token)
+
+
+# --- FLASK ---
+
+def instrument_flask(flask_app):
+    """Time every Flask request and serve /metrics from `flask_app`."""
+    from flask import g, request
+
+    @flask_app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+        g.metrics_token = _current_route.set(g.metrics_route)
+
+    @flask_app.after_request
+    def _record(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @flask_app.teardown_request
+    def _finish(exc):
+        started = g.pop("metrics_started", None)
+        if started is None or Histogram is None:
+            return
+        status = g.pop("metrics_status", 500)
+        REQUEST_DURATION.labels(request.method, g.metrics_route, str(status)).observe(
+            time.perf_counter() - started
+        )
+        _current_route.reset(g.metrics_token)
+
+    @flask_app.route(METRICS_PATH)
+    def metrics():
+        exposition = render()
+        if exposition is None:
+            return "prometheus_client is not installed", 501
+        body, content_type = exposition
+        return body, 200, {"Content-Type": content_type}
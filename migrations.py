@@ -0,0 +1,156 @@
+"""Versioned schema migrations for the reporting and cafe databases.
+
+Each database has an ordered list of (version, description, statements).
+`migrate` applies the ones not yet recorded in that database's
+`schema_migrations` table, each in its own transaction, under an advisory
+lock so the API and the Flask app can both run it on startup. init_db.py
+runs it after loading the dump.
+
+Migrations are append-only: never edit one that has shipped, add a new
+version instead. A step is either an SQL string or a function called with
+the migration's cursor. Versions listed in OPTIONAL_MIGRATIONS are only
+applied when asked for (`migrate(..., optional=True)`, `--partition`, or
+LEDGER_PARTITIONING=1); until then they show as pending.
+
+CLI:
+    python migrations.py              # apply pending migrations to both databases
+    python migrations.py --partition  # also apply the optional ledger partitioning
+    python migrations.py --status     # list applied / pending versions
+"""
+import argparse
+import os
+
+import psycopg2
+
+import ledger_partitions
+from db import REPORTING_DATABASE_URL, CAFE_DATABASE_URL
+
+# Arbitrary key for pg_advisory_lock, shared by every process running migrations
+MIGRATION_LOCK_KEY = 7349021
+
+MIGRATIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+LEDGER_TABLES = ("checking_account_main", "checking_account_secondary", "credit_card_account", "payroll_history")
+
+MIGRATIONS = {
+    "reporting": [
+        (1, "surrogate primary keys on the ledger tables", [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS id BIGSERIAL PRIMARY KEY" for table in LEDGER_TABLES
+        ]),
+        (2, "date indexes on the ledger tables", [
+            # (date, id) also matches the cashflow keyset order, so pages are read off the index
+            "CREATE INDEX IF NOT EXISTS checking_account_main_date_idx ON checking_account_main (date, id)",
+            "CREATE INDEX IF NOT EXISTS checking_account_secondary_date_idx ON checking_account_secondary (date, id)",
+            "CREATE INDEX IF NOT EXISTS credit_card_account_date_idx ON credit_card_account (date, id)",
+            "CREATE INDEX IF NOT EXISTS payroll_history_pay_date_idx ON payroll_history (pay_date, id)",
+        ]),
+        (3, "indexes for the sync dedupe/delete lookups and rollup series reads", [
+            # app.py: WHERE date = .. AND category = .. AND description = .. AND type = .. AND amount = ..
+            "CREATE INDEX IF NOT EXISTS checking_account_main_dedupe_idx "
+            "ON checking_account_main (date, category, description)",
+            # app.py delete: WHERE pay_date = .. AND employee_name = .. AND total_business_cost = ..
+            "CREATE INDEX IF NOT EXISTS payroll_history_dedupe_idx ON payroll_history (pay_date, employee_name)",
+            # income-progress: WHERE source = .. AND category = .. AND day BETWEEN ..
+            "CREATE INDEX IF NOT EXISTS ledger_daily_rollup_series_idx ON ledger_daily_rollup (source, category, day)",
+        ]),
+        (4, "monthly range partitioning of checking_account_main, credit_card_account and payroll_history", [
+            ledger_partitions.convert_tables,
+        ]),
+    ],
+    "cafe": [
+        (1, "indexes for entry dedupe and expense range reads", [
+            # app.py import: WHERE date = .. AND category = .. AND description = .. AND entry_type = .. AND balance = ..
+            "CREATE INDEX IF NOT EXISTS entries_dedupe_idx ON entries (date, category, description)",
+            # budget_routes: WHERE entry_type = 'expense' AND date BETWEEN ..
+            "CREATE INDEX IF NOT EXISTS entries_expense_date_idx ON entries (date) WHERE entry_type = 'expense'",
+        ]),
+    ],
+}
+
+# Versions skipped unless requested (large one-off rewrites)
+OPTIONAL_MIGRATIONS = {"reporting": {4}, "cafe": set()}
+PARTITIONING_REQUESTED = os.getenv("LEDGER_PARTITIONING", "0").lower() in ("1", "true", "yes")
+
+DATABASE_URLS = {"reporting": REPORTING_DATABASE_URL, "cafe": CAFE_DATABASE_URL}
+
+
+def applied_versions(cur):
+    cur.execute(MIGRATIONS_DDL)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn, database, optional=PARTITIONING_REQUESTED):
+    """Apply pending migrations for `database` ("reporting" or "cafe"). Returns the versions applied.
+
+    Optional versions are included only when `optional` is true.
+    """
+    conn.autocommit = False
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        done = applied_versions(cur)
+        conn.commit()
+        applied = []
+        for version, description, statements in MIGRATIONS[database]:
+            if version in done or (version in OPTIONAL_MIGRATIONS[database] and not optional):
+                continue
+            try:
+                for step in statements:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"Applied {database} migration {version}: {description}")
+            applied.append(version)
+        return applied
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+        cur.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or inspect schema migrations.")
+    parser.add_argument("--database", choices=sorted(MIGRATIONS), action="append",
+                        help="only this database (repeatable; default both)")
+    parser.add_argument("--status", action="store_true", help="list applied and pending versions")
+    parser.add_argument("--partition", action="store_true",
+                        help="also apply the optional monthly partitioning of the ledger tables")
+    args = parser.parse_args()
+
+    databases = args.database or sorted(MIGRATIONS)
+    conns = {name: psycopg2.connect(DATABASE_URLS[name]) for name in databases}
+    try:
+        if args.status:
+            for name in databases:
+                cur = conns[name].cursor()
+                done = applied_versions(cur)
+                conns[name].commit()
+                cur.close()
+                for version, description, _ in MIGRATIONS[name]:
+                    state = "applied" if version in done else "pending"
+                    if version in OPTIONAL_MIGRATIONS[name] and version not in done:
+                        state = "optional"
+                    print(f"{name:<10} {version:>3} {state:<8} {description}")
+        else:
+            for name in databases:
+                if not migrate(conns[name], name, optional=args.partition or PARTITIONING_REQUESTED):
+                    print(f"{name}: up to date")
+    finally:
+        for conn in conns.values():
+            conn.close()
@@ -222,13 +222,13 @@ async function generateFilteredReport() {
     if (!start || !end) return;
 
     try {
-        // 1. Existing KPI Fetch
-        const sumRes = await fetch(`http://127.0.0.1:8000/api/financial-summary?start_date=${start}&end_date=${end}`);
-        const data = await sumRes.json();
+        // 1. KPIs, trend and detailed log in one request (one DB snapshot)
+        const viewRes = await fetch(`http://127.0.0.1:8000/api/dashboard?range=${start},${end}`);
+        const view = await viewRes.json();
+        const data = view.ranges[0];
 
-        // 2. Existing Trend Fetch
-        const trendRes = await fetch(`http://127.0.0.1:8000/api/income-progress?start_date=${start}&end_date=${end}`);
-        const trendData = await trendRes.json();
+        // 2. Trend series
+        const trendData = data.income_progress;
 
         // Update UI Text
         document.getElementById('rev').innerText = `$${data.summary.total_revenue.toLocaleString()}`;
@@ -240,8 +240,7 @@ async function generateFilteredReport() {
         updateChartsWithBackendData(trendData, data.breakdown);
 
         // --- THE FULL FIX: Detailed Table ---
-        const logRes = await fetch(`http://127.0.0.1:8000/api/detailed-cashflow?start_date=${start}&end_date=${end}`);
-        const logs = await logRes.json();
+        const logs = data.detailed_cashflow;
         
         const tableBody = document.getElementById('detailed_logs_body'); 
         if (tableBody) {
@@ -415,10 +414,10 @@ async function updateUI() {
     const startDate = "2025-08-01"; // This matches your new SQL data start
 
     try {
-        // 2. Fetch Summary (The Dashboard Cards)
+        // 2. Fetch Summary (The Dashboard Cards) and the latest 15 transactions together
         // Ensure this API endpoint in Python sums ALL tables (Checking + Credit + Payroll)
-        const res = await fetch(`http://127.0.0.1:8000/api/financial-summary?start_date=${startDate}&end_date=${today}`);
-        const data = await res.json();
+        const res = await fetch(`http://127.0.0.1:8000/api/dashboard?range=${startDate},${today},15&sections=summary,detailed_cashflow`);
+        const data = (await res.json()).ranges[0];
         
         if (data.summary) {
             // Updating the Dashboard Cards to match the Report values
@@ -432,8 +431,7 @@ async function updateUI() {
         }
 
         // 3. Update the Transaction Table
-        const logRes = await fetch(`http://127.0.0.1:8000/api/detailed-cashflow?start_date=${startDate}&end_date=${today}`);
-        const logs = await logRes.json();
+        const logs = data.detailed_cashflow;
         
         const dashTableBody = document.getElementById('expense-rows'); 
         if (dashTableBody) {
@@ -0,0 +1,209 @@
+"""PDF financial reports: rendering, background jobs and an on-disk cache.
+
+A report is identified by (start_date, end_date, ledger version). Finished
+PDFs are written to REPORT_CACHE_DIR, so asking for the same range again
+before the ledger changes is just a file download. Report rows come from a
+server-side cursor in batches and go straight into the PDF, so no DataFrame
+of the whole range is ever built.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fpdf import FPDF
+
+import cashflow
+from kpi_engine import compute_kpis, BREAKDOWN_LABELS
+from ledger_version import get_ledger_version
+
+REPORT_CACHE_DIR = os.getenv(
+    "REPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_cache")
+)
+REPORT_WORKERS = max(1, int(os.getenv("REPORT_WORKERS", "1")))
+# Finished/failed jobs are forgotten after this many seconds (their PDFs stay cached)
+JOB_TTL_SECONDS = 3600
+
+_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+# --- RENDERING ---
+
+def write_report(conn, start_date, end_date, path):
+    """Render the financial report for the range into the PDF file at `path`."""
+    # --- MATCHING YOUR FRONTEND MATH ---
+    kpis = compute_kpis(conn, start_date, end_date)
+    s = kpis["revenue"]
+    p = kpis["payroll"]
+    total_exp = kpis["total_expense"]
+    net_profit = kpis["net_profit"]
+
+    pdf = FPDF()
+    pdf.add_page()
+
+    pdf.set_font("helvetica", "B", 16)
+    pdf.cell(0, 10, "FINANCIAL PERFORMANCE REPORT", align="C", ln=True)
+    pdf.set_font("helvetica", "", 10)
+    pdf.cell(0, 8, f"Period: {start_date} to {end_date}", align="C", ln=True)
+    pdf.ln(5)
+
+    # --- KPI SECTION (The 4 Main Cards) ---
+    pdf.set_fill_color(245, 245, 245)
+    pdf.set_font("helvetica", "B", 10)
+    pdf.cell(45, 10, " TOTAL REVENUE", border=1, fill=True)
+    pdf.cell(50, 10, f" ${s:,.2f}", border=1)
+    pdf.cell(45, 10, " TOTAL PAYROLL", border=1, fill=True)
+    pdf.cell(50, 10, f" ${p:,.2f}", border=1, ln=True)
+
+    pdf.cell(45, 10, " TOTAL EXPENSE", border=1, fill=True)
+    pdf.cell(50, 10, f" ${total_exp:,.2f}", border=1)
+    pdf.cell(45, 10, " NET PROFIT", border=1, fill=True)
+
+    # Color profit logic
+    if net_profit >= 0: pdf.set_text_color(0, 128, 0)
+    else: pdf.set_text_color(200, 0, 0)
+
+    pdf.cell(50, 10, f" ${net_profit:,.2f}", border=1, ln=True)
+    pdf.set_text_color(0, 0, 0)
+    pdf.ln(10)
+
+    # --- CATEGORY SUMMARY TABLE ---
+    pdf.set_font("helvetica", "B", 12)
+    pdf.cell(0, 10, "Expense Breakdown by Category", ln=True)
+    pdf.set_font("helvetica", "B", 10)
+    pdf.set_fill_color(230, 230, 230)
+    pdf.cell(110, 10, " Category", border=1, fill=True)
+    pdf.cell(80, 10, " Amount", border=1, fill=True, ln=True)
+
+    pdf.set_font("helvetica", "", 10)
+    categories = [(label, kpis["breakdown"][key]) for key, label in BREAKDOWN_LABELS]
+    # Any other ledger category the engine found goes after the fixed ones
+    charted = {label.upper() for _, label in BREAKDOWN_LABELS}
+    categories += [(name, val) for name, val in kpis["categories"].items() if name.upper() not in charted]
+    for name, val in categories:
+        if val > 0: # Only show categories that have spending
+            pdf.cell(110, 8, f" {name}", border=1)
+            pdf.cell(80, 8, f"${val:,.2f}", border=1, ln=True)
+    pdf.ln(10)
+
+    # --- DETAILED TRANSACTIONS ---
+    pdf.set_font("helvetica", "B", 12)
+    pdf.cell(0, 10, "Detailed Transactions (Date Ascending)", ln=True)
+    pdf.set_font("helvetica", "B", 8)
+    pdf.set_fill_color(93, 64, 55)
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(25, 10, " Date", border=1, fill=True)
+    pdf.cell(100, 10, " Description", border=1, fill=True)
+    pdf.cell(35, 10, " Category", border=1, fill=True)
+    pdf.cell(30, 10, " Amount", border=1, fill=True, ln=True)
+
+    pdf.set_font("helvetica", "", 7)
+    pdf.set_text_color(0, 0, 0)
+    for batch in cashflow.iter_batches(conn, start_date, end_date, descending=False):
+        for row_dt in batch:
+            pdf.cell(25, 7, f" {row_dt['date']}", border=1)
+            pdf.cell(100, 7, f" {str(row_dt['description'])[:55]}", border=1)
+            pdf.cell(35, 7, f" {row_dt['category']}", border=1)
+            pdf.cell(30, 7, f"${float(row_dt['amount'] or 0):,.2f} ", border=1, align="R", ln=True)
+
+    pdf.output(path)
+
+
+# --- ARTIFACT CACHE ---
+
+def report_path(start_date, end_date, version):
+    return os.path.join(REPORT_CACHE_DIR, f"report_{start_date}_{end_date}_v{version}.pdf")
+
+
+def _drop_stale_versions(start_date, end_date, keep_path):
+    prefix = f"report_{start_date}_{end_date}_v"
+    for name in os.listdir(REPORT_CACHE_DIR):
+        path = os.path.join(REPORT_CACHE_DIR, name)
+        if name.startswith(prefix) and name.endswith(".pdf") and path != keep_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def build_report(engine, start_date, end_date):
+    """Return the cached PDF path for the range, rendering it first if needed."""
+    with engine.connect() as conn:
+        version = get_ledger_version(conn)
+        path = report_path(start_date, end_date, version)
+        if os.path.exists(path):
+            return path
+        os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+        # Render to a private temp file, then publish it atomically
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            write_report(conn, start_date, end_date, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    _drop_stale_versions(start_date, end_date, path)
+    return path
+
+
+# --- BACKGROUND JOBS ---
+
+def _run_job(engine, job):
+    job["status"] = "running"
+    try:
+        job["path"] = build_report(engine, job["start_date"], job["end_date"])
+        job["status"] = "done"
+    except Exception as e:
+        print(f"Report job {job['id']} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    job["finished_at"] = time.time()
+
+
+def _prune_jobs():
+    cutoff = time.time() - JOB_TTL_SECONDS
+    for job_id in [j["id"] for j in _jobs.values() if j.get("finished_at") and j["finished_at"] < cutoff]:
+        _jobs.pop(job_id, None)
+
+
+def submit_report(engine, start_date, end_date):
+    """Queue a report for the range and return its job record.
+
+    A request for a range that is already queued or running joins that job.
+    """
+    with _jobs_lock:
+        _prune_jobs()
+        for job in _jobs.values():
+            if (job["start_date"], job["end_date"]) == (start_date, end_date) and job["status"] in ("queued", "running"):
+                return job
+        job = {
+            "id": uuid.uuid4().hex,
+            "start_date": start_date,
+            "end_date": end_date,
+            "status": "queued",
+            "path": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        _jobs[job["id"]] = job
+    _executor.submit(_run_job, engine, job)
+    return job
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+
+def job_status(job):
+    return {
+        "job_id": job["id"],
+        "start_date": str(job["start_date"]),
+        "end_date": str(job["end_date"]),
+        "status": job["status"],
+        "error": job["error"],
+        "download_url": f"/api/reports/{job['id']}/download" if job["status"] == "done" else None,
+    }
@@ -0,0 +1,184 @@
+"""Slow-statement capture with EXPLAIN (ANALYZE, BUFFERS) plans.
+
+Every statement run through a db.py engine is timed. One that takes longer
+than SLOW_QUERY_MS is recorded in an in-memory ring buffer (the newest
+SLOW_QUERY_BUFFER entries) with its route, database, duration, SQL and
+bound parameters, and is shown by /api/admin/slow-queries.
+
+A sample of the recorded statements also gets its plan captured. The
+statement is re-run as EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) with the
+same parameters, on a separate pooled connection on a single background
+thread, so the request that was slow is never made slower. Which ones get
+a plan:
+
+* only reads (SELECT / WITH without INSERT, UPDATE or DELETE), inside a
+  READ ONLY transaction that is rolled back;
+* SLOW_QUERY_SAMPLE_RATE of them (default 1.0 = all);
+* at most one plan per distinct SQL text every SLOW_QUERY_EXPLAIN_INTERVAL
+  seconds, and at most SLOW_QUERY_EXPLAIN_QUEUE waiting at once;
+* each EXPLAIN is cut off after SLOW_QUERY_EXPLAIN_TIMEOUT_MS.
+
+SLOW_QUERY_MS=0 turns capture off.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import event
+
+import metrics
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+SLOW_QUERY_MS = _env_float("SLOW_QUERY_MS", 500)
+SLOW_QUERY_BUFFER = max(1, int(_env_float("SLOW_QUERY_BUFFER", 100)))
+SLOW_QUERY_SAMPLE_RATE = _env_float("SLOW_QUERY_SAMPLE_RATE", 1.0)
+SLOW_QUERY_EXPLAIN_INTERVAL = _env_float("SLOW_QUERY_EXPLAIN_INTERVAL", 60)
+SLOW_QUERY_EXPLAIN_QUEUE = max(1, int(_env_float("SLOW_QUERY_EXPLAIN_QUEUE", 8)))
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(_env_float("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", 30000))
+
+_READ_RE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_WRITE_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE)\b|\bFOR\s+UPDATE\b", re.IGNORECASE)
+
+_captured = deque(maxlen=SLOW_QUERY_BUFFER)
+_lock = threading.Lock()
+_state = {"next_id": 1, "pending": 0, "skipped": 0}
+_last_explained = {}
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+
+
+def _jsonable(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def explainable(statement):
+    return bool(_READ_RE.match(statement)) and not _WRITE_RE.search(statement)
+
+
+def _should_explain(statement, now):
+    if not explainable(statement) or random.random() >= SLOW_QUERY_SAMPLE_RATE:
+        return False
+    with _lock:
+        if _state["pending"] >= SLOW_QUERY_EXPLAIN_QUEUE:
+            _state["skipped"] += 1
+            return False
+        if now - _last_explained.get(statement, float("-inf")) < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        if len(_last_explained) >= 1000:
+            _last_explained.clear()
+        _last_explained[statement] = now
+        _state["pending"] += 1
+        return True
+
+
+def _explain(engine, entry, statement, parameters):
+    try:
+        raw_conn = engine.raw_connection()
+        try:
+            cur = raw_conn.cursor()
+            cur.execute("SET TRANSACTION READ ONLY")
+            cur.execute(f"SET LOCAL statement_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}")
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters)
+            plan = cur.fetchone()[0]
+            cur.close()
+            raw_conn.rollback()
+        finally:
+            raw_conn.close()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        with _lock:
+            entry["plan"] = plan
+            entry["plan_status"] = "captured"
+    except Exception as e:
+        with _lock:
+            entry["plan_status"] = "failed"
+            entry["plan_error"] = str(e).strip()
+    finally:
+        with _lock:
+            _state["pending"] -= 1
+
+
+def record(engine, statement, parameters, seconds, executemany=False):
+    """Store a statement that ran for `seconds` if it is over the threshold."""
+    if SLOW_QUERY_MS <= 0 or seconds * 1000 < SLOW_QUERY_MS:
+        return
+    now = time.monotonic()
+    explain = not executemany and _should_explain(statement, now)
+    entry = {
+        "captured_at": datetime.now().isoformat(timespec="seconds"),
+        "route": metrics.current_route(),
+        "database": engine.url.database,
+        "duration_ms": round(seconds * 1000, 3),
+        "statement": statement,
+        "parameters": _jsonable(parameters),
+        "plan_status": "pending" if explain else "not sampled",
+        "plan": None,
+    }
+    with _lock:
+        entry["id"] = _state["next_id"]
+        _state["next_id"] += 1
+        _captured.append(entry)
+    if explain:
+        _executor.submit(_explain, engine, entry, statement, parameters)
+
+
+def watch_engine(engine):
+    """Time every statement `engine` runs (db.get_engine calls this once per engine)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["slow_query_started"].pop()
+        record(engine, statement, parameters, time.perf_counter() - started, executemany)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("slow_query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+def snapshot(limit=None):
+    """Captured statements, newest first, plus the current settings."""
+    with _lock:
+        entries = [dict(e) for e in reversed(_captured)]
+        skipped = _state["skipped"]
+    return {
+        "threshold_ms": SLOW_QUERY_MS,
+        "sample_rate": SLOW_QUERY_SAMPLE_RATE,
+        "buffer_size": SLOW_QUERY_BUFFER,
+        "explains_skipped": skipped,
+        "entries": entries[:limit] if limit else entries,
+    }
+
+
+def clear():
+    with _lock:
+        _captured.clear()
+        _last_explained.clear()
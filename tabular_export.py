@@ -0,0 +1,117 @@
+"""CSV / XLSX downloads of the cashflow, KPI and budget-vs-actual reports.
+
+Rows are produced in batches and written out as they arrive: the
+cashflow export reads a server-side cursor (cashflow.iter_batches), so a
+multi-year range is never held in memory or in a DataFrame.
+
+* CSV is encoded and yielded one batch at a time.
+* XLSX uses openpyxl's write-only workbook, which serializes each row to
+  a temporary file as it is appended instead of keeping cell objects. The
+  finished file is then streamed out in chunks.
+
+openpyxl is optional; without it only CSV is available.
+"""
+import csv
+import io
+import tempfile
+from datetime import date
+
+import cashflow
+from budget_routes import compute_key_insights
+from kpi_engine import BREAKDOWN_LABELS, compute_kpis
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # optional: CSV only
+    Workbook = None
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+XLSX_CHUNK_SIZE = 64 * 1024
+
+HEADERS = {
+    "cashflow": ("Date", "Description", "Category", "Amount"),
+    "kpis": ("Section", "Item", "Amount"),
+    "budget": ("Category", "Subcategory", "Budgeted", "Actual", "Variance", "Status"),
+}
+
+
+def available(fmt):
+    return fmt == "csv" or Workbook is not None
+
+
+# --- ROW SOURCES (each yields lists of tuples) ---
+
+def cashflow_rows(engine, start_date, end_date):
+    """Every transaction in the range, newest first (the /api/detailed-cashflow rows)."""
+    with engine.connect() as conn:
+        for batch in cashflow.iter_batches(conn, start_date, end_date):
+            yield [
+                (date.fromisoformat(r["date"]), r["description"], r["category"], r["amount"])
+                for r in batch
+            ]
+
+
+def kpi_rows(engine, start_date, end_date):
+    """Totals, the charted breakdown and every expense category (the PDF report's numbers)."""
+    with engine.connect() as conn:
+        kpis = compute_kpis(conn, start_date, end_date)
+    rows = [
+        ("Summary", "Total Revenue", kpis["revenue"]),
+        ("Summary", "Total Expense", kpis["total_expense"]),
+        ("Summary", "Net Profit", kpis["net_profit"]),
+    ]
+    rows += [("Breakdown", label, kpis["breakdown"][key]) for key, label in BREAKDOWN_LABELS]
+    rows += [("Category", name, total) for name, total in kpis["categories"].items()]
+    yield [(section, item, round(amount, 2)) for section, item, amount in rows]
+
+
+def budget_rows(start_date, end_date, month=None, sales_only=False, source="both"):
+    """The budget-vs-actual entries of /api/key-insights."""
+    insights = compute_key_insights(start_date, end_date, month, sales_only, source)
+    yield [
+        (e["category"], e["subcategory"], e["budgeted"], e["actual"], e["variance"], e["status"])
+        for e in insights["entries"]
+    ]
+
+
+# --- WRITERS ---
+
+def iter_csv(header, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there were no rows at all
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_xlsx(header, batches, title="Report"):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    for batch in batches:
+        for row in batch:
+            sheet.append(row)
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(XLSX_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_export(report, fmt, batches):
+    """Encoded chunks of `report` ("cashflow", "kpis" or "budget") in `fmt`."""
+    if fmt == "xlsx":
+        return iter_xlsx(HEADERS[report], batches, title=report.capitalize())
+    return iter_csv(HEADERS[report], batches)
@@ -0,0 +1,100 @@
+"""Sales revenue series at day, week or month resolution (/api/income-progress).
+
+Days come from ledger_daily_rollup. Weeks (ISO, starting Monday) and
+months come from ledger_period_rollup. Only periods lying wholly inside
+the range are read from it; the partial periods at either end are summed
+from the daily rows, so totals always match the requested range exactly.
+Each point is labelled with its period's first day, or the range start
+for a period that begins before the range.
+
+"auto" picks the finest granularity that keeps the series at or under
+the target point count (INCOME_PROGRESS_POINTS, default 120). A five-year
+range is then about 60 monthly points instead of about 1,800 daily ones.
+"""
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+GRANULARITIES = ("day", "week", "month")
+TARGET_POINTS = int(os.getenv("INCOME_PROGRESS_POINTS", "120"))
+
+DAILY_REVENUE_QUERY = text("""
+    SELECT TO_CHAR(day, 'YYYY-MM-DD') AS date, CAST(SUM(credit_total + debit_total) AS DOUBLE PRECISION) AS revenue
+    FROM ledger_daily_rollup
+    WHERE source = 'checking_main' AND category = 'Sales Revenue' AND day BETWEEN :start AND :end
+    GROUP BY day ORDER BY day ASC
+""")
+
+PERIOD_REVENUE_QUERY = text("""
+    SELECT TO_CHAR(GREATEST(period, :start), 'YYYY-MM-DD') AS date, CAST(SUM(revenue) AS DOUBLE PRECISION) AS revenue
+    FROM (
+        SELECT period, credit_total + debit_total AS revenue
+        FROM ledger_period_rollup
+        WHERE granularity = :granularity AND source = 'checking_main' AND category = 'Sales Revenue'
+          AND period >= :full_start AND period < :full_end
+        UNION ALL
+        SELECT CAST(date_trunc(:granularity, day) AS DATE), credit_total + debit_total
+        FROM ledger_daily_rollup
+        WHERE source = 'checking_main' AND category = 'Sales Revenue' AND day BETWEEN :start AND :end
+          AND (day < :full_start OR day >= :full_end)
+    ) series
+    GROUP BY 1 ORDER BY 1
+""")
+
+
+def period_start(d, granularity):
+    if granularity == "week":
+        return d - timedelta(days=d.weekday())
+    if granularity == "month":
+        return date(d.year, d.month, 1)
+    return d
+
+
+def _next_period(d, granularity):
+    if granularity == "week":
+        return d + timedelta(days=7)
+    if granularity == "month":
+        return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+    return d + timedelta(days=1)
+
+
+def point_count(start, end, granularity):
+    """Points a series over [start, end] has at `granularity`."""
+    if granularity == "week":
+        return (period_start(end, "week") - period_start(start, "week")).days // 7 + 1
+    if granularity == "month":
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return (end - start).days + 1
+
+
+def choose_granularity(start, end, points=TARGET_POINTS):
+    """The finest granularity giving at most `points` points (months if none does)."""
+    for granularity in GRANULARITIES:
+        if point_count(start, end, granularity) <= points:
+            return granularity
+    return "month"
+
+
+def revenue_series(conn, start, end, granularity="day"):
+    """[(date label, revenue)] for the range at `granularity` ("day", "week" or "month")."""
+    if granularity == "day":
+        return conn.execute(DAILY_REVENUE_QUERY, {"start": start, "end": end}).all()
+    # Whole periods inside the range: [full_start, full_end)
+    full_start = period_start(start, granularity)
+    if full_start != start:
+        full_start = _next_period(full_start, granularity)
+    full_end = period_start(end + timedelta(days=1), granularity)
+    return conn.execute(PERIOD_REVENUE_QUERY, {
+        "start": start, "end": end, "granularity": granularity,
+        "full_start": full_start, "full_end": full_end,
+    }).all()
+
+
+def bucket(daily, start, granularity):
+    """Sum sorted [(day, value)] into [(date label, value)] periods, labelled like revenue_series."""
+    totals = {}
+    for day, value in daily:
+        label = max(period_start(day, granularity), start)
+        totals[label] = totals.get(label, 0.0) + value
+    return [(d.strftime("%Y-%m-%d"), v) for d, v in sorted(totals.items())]
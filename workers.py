@@ -0,0 +1,37 @@
+"""Bounded worker pool for the slow endpoints (forecast, PDF report).
+
+Cheap endpoints are plain `def` routes, which FastAPI already runs in its
+default thread pool. Slow ones are `async def` routes that hand their
+blocking work to `run_heavy`, which has its own small capacity limit
+(HEAVY_WORKERS, default 2). So a burst of forecasts or reports queues
+behind that limit and does not take the event loop, the default threads
+or the whole connection pool away from requests like /api/data-bounds.
+"""
+import os
+from functools import partial
+
+import anyio
+
+HEAVY_WORKERS = max(1, int(os.getenv("HEAVY_WORKERS", "2")))
+
+_heavy_limiter = None
+
+
+def _limiter():
+    # Created lazily: anyio limiters have to be made inside the running loop
+    global _heavy_limiter
+    if _heavy_limiter is None:
+        _heavy_limiter = anyio.CapacityLimiter(HEAVY_WORKERS)
+    return _heavy_limiter
+
+
+async def run_heavy(func, *args, **kwargs):
+    """Run blocking `func(*args, **kwargs)` on the bounded heavy pool."""
+    return await anyio.to_thread.run_sync(partial(func, *args, **kwargs), limiter=_limiter())
+
+
+def heavy_stats():
+    if _heavy_limiter is None:
+        return {"limit": HEAVY_WORKERS, "running": 0, "waiting": 0}
+    stats = _heavy_limiter.statistics()
+    return {"limit": HEAVY_WORKERS, "running": stats.borrowed_tokens, "waiting": stats.tasks_waiting}